@@ -0,0 +1,90 @@
+"""
+Benchmark code block extraction: the old regex pass versus the incremental
+FenceParser, one-shot and over a chunked stream.
+
+Run from the backend directory:
+    python -m benchmarks.code_blocks
+"""
+import re
+import time
+from services.code_blocks import FenceParser, extract_code_blocks
+
+LEGACY_PATTERN = re.compile(r'```(\w+)?\n(.*?)```', re.DOTALL)
+
+SECTION = (
+    "Here is how the function works, step by step, with a short explanation.\n\n"
+    "```python\n"
+    "def fibonacci(n: int) -> int:\n"
+    "    a, b = 0, 1\n"
+    "    for _ in range(n):\n"
+    "        a, b = b, a + b\n"
+    "    return a\n"
+    "```\n\n"
+    "Inline `code` stays inline. Next comes a shell example:\n\n"
+    "```bash\npython -m fib 10\n```\n\n"
+)
+
+
+def legacy_extract(text):
+    return [{"language": lang or "text", "code": code.strip()} for lang, code in LEGACY_PATTERN.findall(text)]
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def stream_parser(text, chunk):
+    parser = FenceParser()
+    for i in range(0, len(text), chunk):
+        parser.feed(text[i:i + chunk])
+    parser.close()
+    return parser.blocks
+
+
+def stream_regex(text, chunk):
+    # What live detection costs with the regex: rescan the whole reply per chunk
+    for i in range(chunk, len(text) + chunk, chunk):
+        legacy_extract(text[:i])
+
+
+def bench_one_shot():
+    print(f"{'size':>10} {'regex':>10} {'parser':>10}  match")
+    for sections in (10, 100, 1000, 5000):
+        text = SECTION * sections
+        assert extract_code_blocks(text) == legacy_extract(text)
+        regex = timed(lambda: legacy_extract(text))
+        parser = timed(lambda: extract_code_blocks(text))
+        print(f"{len(text):>10} {regex * 1e3:>8.2f}ms {parser * 1e3:>8.2f}ms  ✅")
+
+
+def bench_streaming(chunk=40):
+    print(f"\n📡 Streamed in {chunk}-char chunks (live detection)")
+    print(f"{'size':>10} {'regex':>10} {'parser':>10}")
+    for sections in (10, 50, 200):
+        text = SECTION * sections
+        regex = timed(lambda: stream_regex(text, chunk), repeat=1)
+        parser = timed(lambda: stream_parser(text, chunk))
+        print(f"{len(text):>10} {regex * 1e3:>8.2f}ms {parser * 1e3:>8.2f}ms")
+
+
+def bench_unterminated():
+    print("\n🧨 Many opening fences, no closing fence")
+    print(f"{'fences':>10} {'regex':>10} {'parser':>10}")
+    for fences in (100, 1000, 4000):
+        text = "text\n```python\nx = 1\n" * fences
+        regex = timed(lambda: legacy_extract(text), repeat=1)
+        parser = timed(lambda: extract_code_blocks(text))
+        print(f"{fences:>10} {regex * 1e3:>8.2f}ms {parser * 1e3:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    print("🧪 Code block extraction benchmark")
+    print("-" * 50)
+    bench_one_shot()
+    bench_streaming()
+    bench_unterminated()
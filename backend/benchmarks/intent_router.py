@@ -0,0 +1,61 @@
+"""
+Benchmark intent detection: the old roadmap substring scan, one regex per
+phrase for every intent (the frontend's approach), and the IntentRouter's
+single combined pass.
+
+Run from the backend directory:
+    python -m benchmarks.intent_router
+"""
+import re
+import time
+from services.intent_router import INTENT_RULES, IntentRouter, NaiveBayesClassifier
+from test_intent_router import LABELLED
+
+LEGACY_KEYWORDS = [
+    'roadmap', 'learning path', 'course outline', 'study plan',
+    'curriculum', 'learning roadmap', 'learning plan', 'study roadmap'
+]
+
+PER_PATTERN = {intent: [re.compile(p, re.IGNORECASE) for p in patterns] for intent, patterns in INTENT_RULES.items()}
+
+MESSAGES = [text for text, _ in LABELLED]
+LONG = "Here is my code, can you look at it?\n" + "x = compute(x) + 1  # step\n" * 200
+ITERATIONS = 2000
+
+
+def legacy_roadmap(message):
+    message_lower = message.lower()
+    return any(keyword in message_lower for keyword in LEGACY_KEYWORDS)
+
+
+def per_pattern(message):
+    for intent, patterns in PER_PATTERN.items():
+        if any(p.search(message) for p in patterns):
+            return intent
+    return "chat"
+
+
+def timed(fn, messages):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - start) / (ITERATIONS * len(messages))
+
+
+def run(label, messages):
+    router = IntentRouter()
+    with_classifier = IntentRouter(classifier=NaiveBayesClassifier())
+    print(f"\n📨 {label}")
+    print(f"{'legacy roadmap-only scan':<34} {timed(legacy_roadmap, messages) * 1e6:>8.2f}µs")
+    print(f"{'one regex per phrase (all intents)':<34} {timed(per_pattern, messages) * 1e6:>8.2f}µs")
+    print(f"{'IntentRouter.classify':<34} {timed(router.classify, messages) * 1e6:>8.2f}µs")
+    print(f"{'IntentRouter + classifier':<34} {timed(with_classifier.classify, messages) * 1e6:>8.2f}µs")
+    print(f"{'IntentRouter.route (roadmap check)':<34} {timed(lambda m: router.route(m, 'code'), messages) * 1e6:>8.2f}µs")
+
+
+if __name__ == "__main__":
+    print("🧪 Intent routing benchmark (per message)")
+    print("-" * 50)
+    run(f"{len(MESSAGES)} labelled messages", MESSAGES)
+    run(f"long message ({len(LONG)} chars, no intent)", [LONG])
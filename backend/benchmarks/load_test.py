@@ -0,0 +1,484 @@
+"""
+Offline load test for the API against a fake Gemini and a fake Firestore.
+
+Serves the real app and the fake Gemini server (fake_gemini.py) with
+uvicorn in child processes, with Firestore swapped for the in-memory
+FakeFirestoreClient and authentication for per-request test users, then
+drives each endpoint over HTTP from this process:
+
+- closed loop: ``--concurrency`` workers each send the next request as
+  soon as the previous one finishes
+- open loop: requests arrive at ``--rate`` per second whether or not
+  earlier ones finished; latency is measured from the scheduled arrival,
+  so queueing delay is not hidden (no coordinated omission)
+
+Every endpoint gets a latency histogram; /api/chat/stream also records
+time to first token. Results are compared with the stored baseline for the
+same scenario, and ``--save-baseline`` records new ones. Baselines depend on
+the machine, so re-save them before comparing on different hardware.
+
+Run from the backend directory:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --mode open --rate 200 --requests 1000
+    python -m benchmarks.load_test --endpoints chat_stream --gemini-ttft 0.2 --save-baseline
+    python -m benchmarks.load_test --workers 4   # app served by serve.py with 4 workers
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "load_test.json")
+
+ENDPOINTS = ["chat", "chat_stream", "generate_code", "history", "history_stream"]
+
+# Tracked metrics and which direction is a regression
+HIGHER_IS_WORSE = {"p50": True, "p90": True, "p99": True, "throughput_rps": False, "error_rate": True}
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (about 9% relative precision).
+
+    Buckets grow by 2^(1/8) from 0.1 ms, so recording is a bisect and
+    percentiles come from bucket upper bounds, like HdrHistogram at low
+    precision.
+    """
+
+    BOUNDS = [0.0001 * 2 ** (i / 8) for i in range(8 * 20)]  # 0.1 ms .. ~100 s
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Milliseconds, rounded for stable baselines"""
+        if not self.count:
+            return {}
+        return {
+            "p50": round(self.percentile(50) * 1e3, 2),
+            "p90": round(self.percentile(90) * 1e3, 2),
+            "p99": round(self.percentile(99) * 1e3, 2),
+            "max": round(self.max * 1e3, 2),
+            "mean": round(self.total / self.count * 1e3, 2),
+        }
+
+    def render(self, width: int = 40) -> List[str]:
+        """Text bar chart of the populated buckets"""
+        populated = [i for i, n in enumerate(self.counts) if n]
+        if not populated:
+            return []
+        peak = max(self.counts)
+        lines = []
+        # Merge buckets four at a time to keep the chart short
+        for start in range(populated[0] - populated[0] % 4, populated[-1] + 1, 4):
+            n = sum(self.counts[start:start + 4])
+            upper = self.BOUNDS[min(start + 3, len(self.BOUNDS) - 1)] * 1e3
+            bar = "█" * max(1 if n else 0, round(n / peak * width))
+            lines.append(f"      ≤{upper:>9.1f}ms {n:>6} {bar}")
+        return lines
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.ttft = LatencyHistogram()
+        self.errors = 0
+        self.requests = 0
+        self.elapsed = 0.0
+
+    def result(self) -> dict:
+        result = {
+            "requests": self.requests,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "throughput_rps": round(self.requests / self.elapsed, 1) if self.elapsed else 0.0,
+            "latency_ms": self.latency.summary(),
+        }
+        if self.ttft.count:
+            result["ttft_ms"] = self.ttft.summary()
+        return result
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ServerProcess:
+    """A uvicorn server in a child process, so it does not share the load generator's GIL"""
+
+    def __init__(self, name: str, argv: List[str], port: int, env: Optional[dict] = None):
+        self.name = name
+        self.argv = argv
+        self.port = port
+        self.env = {**os.environ, **(env or {})}
+        self.process = None
+        self.log_path = None
+
+    def start(self, timeout: float = 60.0):
+        import urllib.request
+        with tempfile.NamedTemporaryFile(prefix=f"load_test_{self.name}_", suffix=".log", delete=False) as log:
+            self.log_path = log.name
+        with open(self.log_path, "wb") as log:
+            self.process = subprocess.Popen(
+                self.argv, cwd=BACKEND_DIR, env=self.env, stdout=log, stderr=subprocess.STDOUT
+            )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/health", timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.1)
+        self.stop(keep_log=True)
+        raise RuntimeError(f"{self.name} server did not start, see {self.log_path}")
+
+    def stop(self, keep_log: bool = False):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.log_path and not keep_log:
+            os.remove(self.log_path)
+            self.log_path = None
+
+
+def start_servers(args) -> List[ServerProcess]:
+    """Start the fake Gemini server and the app wired to fakes"""
+    gemini_port = free_port()
+    gemini = ServerProcess(
+        "gemini",
+        [sys.executable, "-m", "uvicorn", "fake_gemini:app",
+         "--host", "127.0.0.1", "--port", str(gemini_port), "--log-level", "warning"],
+        gemini_port,
+        env={
+            "FAKE_GEMINI_LATENCY": str(args.gemini_latency),
+            "FAKE_GEMINI_TTFT": str(args.gemini_ttft),
+            "FAKE_GEMINI_CHUNK_DELAY": str(args.gemini_chunk_delay),
+            "FAKE_GEMINI_CHUNKS": str(args.gemini_chunks),
+        }
+    )
+    app_port = free_port()
+    app = ServerProcess(
+        "app",
+        [sys.executable, "-m", "benchmarks.load_test", "--serve", str(app_port),
+         "--gemini-url", f"http://127.0.0.1:{gemini_port}",
+         "--firestore-latency", str(args.firestore_latency),
+         "--users", str(args.users), "--history-messages", str(args.history_messages),
+         "--workers", str(args.workers)],
+        app_port
+    )
+    gemini.start()
+    try:
+        app.start()
+    except Exception:
+        gemini.stop()
+        raise
+    return [app, gemini]
+
+
+def serve_app(args):
+    """Child process: run the real app with fake Firestore and test users"""
+    # Settings are read when the app is imported, so configure it first
+    os.environ.update({
+        "GEMINI_API_KEY": "load-test",
+        "GEMINI_API_BASE": args.gemini_url,
+        "GEMINI_TRANSPORT": "httpx",
+        "FIREBASE_CREDENTIALS_PATH": os.devnull + ".missing",
+        "ROADMAP_STORE_BACKEND": "memory",
+    })
+    import uvicorn
+    from fastapi import Header
+    from dependencies import get_current_user
+    from fake_firestore import FakeFirestoreClient
+    from firebase_config import firebase_service
+    import main
+
+    firebase_service.db = FakeFirestoreClient(latency=args.firestore_latency)
+    seed_history(firebase_service, args.users, args.history_messages)
+
+    async def load_test_user(authorization: Optional[str] = Header(None)):
+        # "Bearer <uid>": any token is a valid user
+        return {"uid": authorization[7:]} if authorization else None
+
+    main.app.dependency_overrides[get_current_user] = load_test_user
+    if args.workers > 1:
+        import serve
+        # Fakes are set up once here and inherited by every forked worker
+        sys.exit(serve.serve(
+            lambda: main.app, host="127.0.0.1", port=args.serve, workers=args.workers,
+            split=False, log_level="warning", access_log=False
+        ))
+    uvicorn.run(main.app, host="127.0.0.1", port=args.serve, log_level="warning")
+
+
+def seed_history(firebase, users: int, messages: int):
+    from datetime import datetime, timedelta
+    start = datetime(2024, 1, 1)
+    latency, firebase.db.latency = firebase.db.latency, 0.0
+    for u in range(users):
+        collection = firebase._chat_collection(f"user-{u}")
+        for m in range(messages):
+            collection.document().set({
+                "role": "user" if m % 2 == 0 else "assistant",
+                "content": f"Seeded message {m} " + "lorem ipsum " * 20,
+                "language": "python",
+                "timestamp": start + timedelta(seconds=m),
+            })
+    firebase.db.latency = latency
+
+
+async def call(client, endpoint: str, i: int, users: int):
+    """Send request ``i`` to an endpoint; returns time to first token for streams"""
+    headers = {"Authorization": f"Bearer user-{i % users}"}
+    # Unique prompts so every request reaches the (fake) model, not the response cache
+    if endpoint == "chat":
+        response = await client.post("/api/chat", headers=headers, json={
+            "message": f"Write a function that adds {i} to a number", "mode": "code"
+        })
+        response.raise_for_status()
+    elif endpoint == "generate_code":
+        response = await client.post("/api/generate-code", json={"prompt": f"Function returning {i}"})
+        response.raise_for_status()
+    elif endpoint == "history":
+        response = await client.get("/api/chat/history", headers=headers, params={"limit": 50})
+        response.raise_for_status()
+    elif endpoint == "history_stream":
+        async with client.stream("GET", "/api/chat/history/stream", headers=headers) as response:
+            response.raise_for_status()
+            async for _ in response.aiter_bytes():
+                pass
+    elif endpoint == "chat_stream":
+        start = time.perf_counter()
+        ttft = None
+        async with client.stream("POST", "/api/chat/stream", headers=headers, json={
+            "message": f"Explain how to reverse list number {i}", "mode": "code"
+        }) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                if ttft is None and b'"content"' in chunk:
+                    ttft = time.perf_counter() - start
+        return ttft
+    else:
+        raise ValueError(f"Unknown endpoint {endpoint}")
+    return None
+
+
+async def run_endpoint(client, endpoint: str, args) -> EndpointStats:
+    stats = EndpointStats()
+
+    async def one(i: int, scheduled: float):
+        try:
+            queued = time.perf_counter() - scheduled
+            ttft = await call(client, endpoint, i, args.users)
+            if ttft is not None:
+                # From the scheduled arrival, like the total latency
+                stats.ttft.record(queued + ttft)
+        except Exception:
+            stats.errors += 1
+        stats.requests += 1
+        stats.latency.record(time.perf_counter() - scheduled)
+
+    # Warm up connections, pools and caches outside the measurement
+    await asyncio.gather(
+        *(call(client, endpoint, -1 - i, args.users) for i in range(min(args.concurrency, 8))),
+        return_exceptions=True
+    )
+
+    start = time.perf_counter()
+    if args.mode == "closed":
+        counter = iter(range(args.requests))
+
+        async def worker():
+            for i in counter:
+                await one(i, time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    else:
+        rng = random.Random(args.seed)
+        tasks = []
+        scheduled = start
+        for i in range(args.requests):
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(one(i, scheduled)))
+            scheduled += rng.expovariate(args.rate) if args.arrival == "poisson" else 1.0 / args.rate
+        await asyncio.gather(*tasks)
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def scenario_name(args) -> str:
+    load = f"closed-c{args.concurrency}" if args.mode == "closed" else f"open-{args.arrival}-r{args.rate:g}"
+    fakes = f"g{args.gemini_latency:g}-t{args.gemini_ttft:g}-f{args.firestore_latency:g}"
+    workers = f"-w{args.workers}" if args.workers > 1 else ""
+    return f"{load}-n{args.requests}-{fakes}{workers}"
+
+
+def compare(name: str, current: dict, baseline: Optional[dict], threshold: float) -> List[str]:
+    """Print current results next to the baseline; returns the regressed metrics"""
+    regressions = []
+    for endpoint, result in current.items():
+        base = (baseline or {}).get(endpoint)
+        print(f"\n📈 {endpoint}: {result['requests']} requests, "
+              f"{result['throughput_rps']} req/s, {result['error_rate']:.1%} errors")
+        rows = [("latency", k, v) for k, v in result["latency_ms"].items()]
+        rows += [("ttft", k, v) for k, v in result.get("ttft_ms", {}).items()]
+        rows += [("", "throughput_rps", result["throughput_rps"]), ("", "error_rate", result["error_rate"])]
+        for group, metric, value in rows:
+            label = f"{group} {metric}".strip()
+            base_value = None
+            if base is not None:
+                base_value = base.get(f"{group}_ms", {}).get(metric) if group else base.get(metric)
+            if base_value is None:
+                print(f"   {label:<18} {value:>10}")
+                continue
+            delta = (value - base_value) / base_value * 100 if base_value else 0.0
+            worse = HIGHER_IS_WORSE.get(metric)
+            flag = ""
+            if worse is not None and abs(delta) >= threshold and (delta > 0) == worse:
+                flag = " ⚠️ regression"
+                regressions.append(f"{endpoint} {label}")
+            print(f"   {label:<18} {value:>10} (baseline {base_value}, {delta:+.1f}%){flag}")
+    return regressions
+
+
+async def run(args) -> dict:
+    import httpx
+    servers = start_servers(args)
+    base_url = f"http://127.0.0.1:{servers[0].port}"
+    results = {}
+    histograms = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency if args.mode == "closed" else 1000)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            for endpoint in args.endpoints:
+                print(f"🚀 {endpoint}...")
+                stats = await run_endpoint(client, endpoint, args)
+                results[endpoint] = stats.result()
+                histograms[endpoint] = stats
+    finally:
+        for server in servers:
+            server.stop()
+    if args.histograms:
+        for endpoint, stats in histograms.items():
+            print(f"\n📊 {endpoint} latency")
+            print("\n".join(stats.latency.render()))
+            if stats.ttft.count:
+                print(f"📊 {endpoint} time to first token")
+                print("\n".join(stats.ttft.render()))
+    return results
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"comma-separated, from {ENDPOINTS}")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32, help="closed loop: concurrent workers")
+    parser.add_argument("--rate", type=float, default=200.0, help="open loop: arrivals per second")
+    parser.add_argument("--arrival", choices=["fixed", "poisson"], default="poisson", help="open loop arrival process")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="fake Gemini non-streaming reply delay")
+    parser.add_argument("--gemini-ttft", type=float, default=0.05, help="fake Gemini delay before the first chunk")
+    parser.add_argument("--gemini-chunk-delay", type=float, default=0.005, help="fake Gemini delay between chunks")
+    parser.add_argument("--gemini-chunks", type=int, default=8)
+    parser.add_argument("--firestore-latency", type=float, default=0.005, help="fake Firestore delay per call")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--history-messages", type=int, default=100, help="seeded history per user")
+    parser.add_argument("--workers", type=int, default=1, help="app worker processes (serve.py when > 1)")
+    parser.add_argument("--histograms", action="store_true", help="print latency histograms")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=25.0, help="percent change reported as a regression")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on a regression")
+    # Internal: run the app under test in this process
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--gemini-url", help=argparse.SUPPRESS)
+    return parser
+
+
+def parse_endpoints(parser, args):
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.serve:
+        serve_app(args)
+        return
+    parse_endpoints(parser, args)
+
+    name = scenario_name(args)
+    print(f"🧪 Load test {name}")
+    print("-" * 50)
+    results = asyncio.run(run(args))
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+    print("\n" + "-" * 50)
+    if name not in baselines:
+        print(f"ℹ️  No baseline for {name}")
+    regressions = compare(name, results, baselines.get(name), args.threshold)
+
+    if args.save_baseline:
+        baselines[name] = {**baselines.get(name, {}), **results}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\n💾 Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\n⚠️  {len(regressions)} metric(s) regressed by more than {args.threshold:g}%")
+        if args.check:
+            sys.exit(1)
+    else:
+        print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark how throughput scales with the number of worker processes.
+
+Runs the load test (benchmarks/load_test.py) against the app served by
+serve.py with each worker count in turn, and reports requests per second,
+latency and the speedup over a single worker. Any other option is passed
+through to the load test.
+
+Workers only add throughput while there are idle cores: on a machine with
+few cores the load generator competes with the workers, so expect the
+curve to flatten at (cores - 1) workers.
+
+Run from the backend directory:
+    python -m benchmarks.workers
+    python -m benchmarks.workers --counts 1,2,4,8 --endpoints chat,history --concurrency 128
+"""
+import argparse
+import asyncio
+import os
+from benchmarks import load_test
+
+DEFAULT_ENDPOINTS = "chat,generate_code,history"
+
+
+def available_cores() -> int:
+    # Same as serve.available_cores; serve.py needs app settings to import
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_counts() -> str:
+    cores = available_cores()
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return ",".join(str(n) for n in counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", default=default_counts(), help="comma-separated worker counts (default: powers of two up to the core count)")
+    args, rest = parser.parse_known_args()
+    counts = [int(n) for n in args.counts.split(",") if n.strip()]
+
+    load_parser = load_test.build_parser()
+    load_parser.set_defaults(endpoints=DEFAULT_ENDPOINTS, concurrency=64)
+    load_args = load_parser.parse_args(rest)
+    load_test.parse_endpoints(load_parser, load_args)
+
+    print(f"🧪 Worker scaling on {available_cores()} core(s): {counts} workers")
+    print("-" * 50)
+    results = {}
+    for workers in counts:
+        load_args.workers = workers
+        print(f"\n👷 {workers} worker(s)")
+        results[workers] = asyncio.run(load_test.run(load_args))
+
+    print("\n" + "-" * 50)
+    print(f"{'endpoint':<15} {'workers':>7} {'req/s':>9} {'speedup':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for endpoint in load_args.endpoints:
+        base = results[counts[0]][endpoint]["throughput_rps"] or 1.0
+        for workers in counts:
+            result = results[workers][endpoint]
+            print(
+                f"{endpoint:<15} {workers:>7} {result['throughput_rps']:>9} "
+                f"{result['throughput_rps'] / base:>7.2f}x {result['latency_ms'].get('p50', 0):>9} "
+                f"{result['latency_ms'].get('p99', 0):>9} {result['error_rate']:>7.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,17 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import List, Optional
 from pathlib import Path
-import os
+from logging_config import configure_logging
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Get the directory of this file
 BASE_DIR = Path(__file__).resolve().parent
 
-# Explicitly load .env file BEFORE anything else
+# Read by pydantic-settings; variables set in the environment take precedence
 env_path = BASE_DIR / ".env"
 
-# Force load .env using os.environ
-if env_path.exists():
-    print(f"🔍 Loading .env from: {env_path}")
-    with open(env_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ[key.strip()] = value.strip()
-                print(f"✅ Set {key.strip()}")
-else:
-    print(f"❌ .env file not found at: {env_path}")
-
-# Verify API key is loaded
-api_key = os.getenv('GEMINI_API_KEY')
-print(f"🔍 GEMINI_API_KEY loaded: {'✅ Yes' if api_key else '❌ No'}")
-if api_key:
-    print(f"🔑 Key preview: {api_key[:10]}...{api_key[-4:]}")
-
 
 class Settings(BaseSettings):
     """Application settings and configuration"""
@@ -39,6 +23,13 @@ class Settings(BaseSettings):
     # Server Configuration
     host: str = "0.0.0.0"
     port: int = 8000
+    # serve.py: worker processes (0 = one per available core), graceful stop/reload timeout
+    web_workers: int = 0
+    web_graceful_timeout: float = 30.0
+    # Redis URL shared by all workers; when set, the response cache, verified
+    # token cache, roadmap catalog and history deletion job status live there
+    # instead of in each process
+    shared_store_url: str = ""
     # Allow localhost and Vercel preview/deployed origins by default
     cors_origins: str = "http://localhost:3000,http://127.0.0.1:3000,https://*.vercel.app,https://ai-chat-bot-brown.vercel.app,https://ai-chat-bot-1-m0uq.onrender.com"
     
@@ -47,14 +38,118 @@ class Settings(BaseSettings):
     max_tokens: int = 2048
     temperature: float = 0.7
     
+    # Conversation context sent upstream (estimated tokens)
+    context_max_tokens: int = 4000
+    context_max_messages: int = 20
+    context_recent_full: int = 4
+    context_summary_enabled: bool = True
+    
+    # Upstream transport: "httpx" (native async REST) or "sdk" (SDK on a thread pool)
+    gemini_transport: str = "httpx"
+    gemini_api_base: str = "https://generativelanguage.googleapis.com"
+    gemini_http2: bool = True
+    gemini_http_max_connections: int = 200
+    gemini_request_timeout: float = 120.0
+    
+    # Upstream Gemini concurrency and admission control
+    gemini_max_workers: int = 64
+    gemini_max_concurrency: int = 48
+    gemini_per_key_concurrency: int = 8
+    gemini_max_queue: int = 200
+    gemini_queue_timeout: float = 10.0
+    gemini_retry_after: int = 5
+    
+    # /api/generate-code/batch: items per request and items generated at once per batch
+    code_batch_max_items: int = 100
+    code_batch_concurrency: int = 8
+    
+    # Share one upstream call between identical concurrent requests
+    single_flight_enabled: bool = True
+    
+    # Streaming: chunks buffered ahead of a slow client, and how often to check for disconnects
+    stream_queue_size: int = 32
+    stream_disconnect_poll: float = 0.5
+    
+    # SSE framing: coalesce chunks up to N bytes / N seconds, keep-alive comments, resume buffer
+    sse_coalesce_bytes: int = 1024
+    sse_coalesce_interval: float = 0.02
+    sse_heartbeat_interval: float = 15.0
+    sse_replay_ttl: float = 60.0
+    sse_resume_grace: float = 5.0
+    sse_replay_max_streams: int = 1000
+    
+    # Send roadmap_module events on /api/chat/stream as each roadmap module completes
+    roadmap_stream_modules: bool = True
+    
+    # Intent routing: rules compiled into one regex, optional local classifier for unmatched messages
+    intent_classifier_enabled: bool = False
+    intent_classifier_min_confidence: float = 0.6
+    
+    # Roadmap catalog keyed by (topic, prompt version), filled by pregenerate_roadmaps.py
+    roadmap_store_backend: str = "auto"  # "auto" (firestore if configured, else redis if SHARED_STORE_URL, else file), "firestore", "redis", "file" or "memory"
+    roadmap_catalog_path: str = "roadmap_catalog.json"
+    roadmap_store_max_entries: int = 512
+    
+    # Optional JSON file of prompt template overrides, hot-reloaded on change
+    prompt_overrides_path: Optional[str] = None
+    
+    # Model pool (one reusable model per API key, model and system prompt)
+    model_pool_max_size: int = 128
+    model_pool_idle_ttl: float = 900.0
+    
+    # Response cache (exact tier plus optional near-duplicate tier)
+    response_cache_enabled: bool = True
+    response_cache_backend: str = "memory"  # "memory" or "redis"
+    response_cache_redis_url: str = "redis://localhost:6379/0"
+    response_cache_max_entries: int = 1024
+    response_cache_ttl: float = 3600.0
+    response_cache_semantic: bool = False
+    response_cache_similarity: float = 0.9
+    response_cache_disabled_modes: str = ""  # comma-separated, e.g. "chat,explain"
+    
     # Firebase Configuration
     firebase_credentials_path: str = "firebase-credentials.json"
     
+    # Verified ID token cache; revocation checks are opt-in
+    auth_token_cache_size: int = 10000
+    auth_token_cache_ttl: float = 300.0
+    auth_check_revoked: bool = False
+    # Token verification runs on its own pool so it never queues behind Firestore
+    auth_verify_max_workers: int = 8
+    auth_verify_timeout: float = 10.0
+    
+    # Firestore calls run on a bounded thread pool with a timeout
+    firestore_max_workers: int = 16
+    firestore_max_concurrency: int = 32
+    firestore_timeout: float = 10.0
+    
+    # Write-behind chat history queue
+    history_batch_size: int = 500
+    history_flush_interval: float = 0.25
+    history_queue_max: int = 10000
+    history_max_retries: int = 5
+    history_drain_timeout: float = 10.0
+    history_delete_concurrency: int = 4
+    
+    # Prometheus metrics at /metrics
+    metrics_enabled: bool = True
+    # Set by serve.py with several workers: where each worker writes its samples
+    # so /metrics on any worker reports the whole deployment
+    metrics_multiproc_dir: str = ""
+    metrics_export_interval: float = 5.0
+    
+    # Logging: LOG_FORMAT is "json" or "text"; LOG_SAMPLE_RATE keeps that
+    # share of requests' routine success lines (warnings are always kept)
+    log_level: str = "INFO"
+    log_format: str = "json"
+    log_sample_rate: float = 0.1
+    log_queue_size: int = 10000
+    
     # Pydantic v2 configuration
     model_config = SettingsConfigDict(
         case_sensitive=False,
         extra="ignore",
-        env_file=".env",
+        env_file=env_path,
         env_file_encoding="utf-8"
     )
     
@@ -68,12 +163,22 @@ class Settings(BaseSettings):
         """Get full path to Firebase credentials"""
         return BASE_DIR / self.firebase_credentials_path
 
+    @property
+    def roadmap_catalog_full_path(self) -> Path:
+        """Get full path to the roadmap catalog file"""
+        return BASE_DIR / self.roadmap_catalog_path
+
 
 # Create settings instance
 try:
     settings = Settings()
-    print("✅ Settings loaded successfully")
 except Exception as e:
-    print(f"❌ Error loading settings: {e}")
-    print(f"📋 Available env vars: {list(os.environ.keys())[:10]}")
+    configure_logging()
+    logger.error("Error loading settings: %s", e, extra={"env_file": str(env_path)})
     raise
+
+configure_logging(settings.log_level, settings.log_format, settings.log_sample_rate, settings.log_queue_size)
+logger.info("Settings loaded", extra={
+    "env_file": str(env_path) if env_path.exists() else None,
+    "gemini_api_key_set": bool(settings.gemini_api_key)
+})
@@ -1,6 +1,10 @@
 from typing import Optional
+import logging
 from fastapi import Header
 from firebase_config import firebase_service
+from services.metrics import span
+
+logger = logging.getLogger(__name__)
 
 
 async def get_current_user(authorization: Optional[str] = Header(None)):
@@ -11,11 +15,12 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
     try:
         # Extract token from "Bearer <token>"
         token = authorization.replace("Bearer ", "")
-        decoded_token = firebase_service.verify_token(token)
+        with span("auth.verify"):
+            decoded_token = await firebase_service.verify_token_async(token)
         
         if decoded_token:
             return decoded_token
         return None
     except Exception as e:
-        print(f"Auth error: {e}")
+        logger.warning("Auth error: %s", e)
         return None
@@ -0,0 +1,250 @@
+"""
+In-memory stand-in for the Firestore client.
+
+Implements the subset of ``google.cloud.firestore.Client`` that
+``FirebaseService`` uses, so the persistence layer can be exercised without
+credentials or network access::
+
+    from fake_firestore import FakeFirestoreClient
+    from firebase_config import FirebaseService
+
+    service = FirebaseService(db=FakeFirestoreClient())
+"""
+from typing import Any, Dict, List, Optional
+import threading
+import time
+import uuid
+
+DESCENDING = "DESCENDING"
+ASCENDING = "ASCENDING"
+
+
+class FakeDocumentSnapshot:
+    """Snapshot of a document at read time"""
+
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = dict(data) if data is not None else None
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def get(self, field: str):
+        return (self._data or {}).get(field)
+
+    def to_dict(self) -> Optional[dict]:
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+    """Reference to a single document"""
+
+    def __init__(self, client: "FakeFirestoreClient", path: tuple):
+        self._client = client
+        self._path = path
+        self.id = path[-1]
+
+    @property
+    def path(self) -> str:
+        return "/".join(self._path)
+
+    def collection(self, name: str) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._client, self._path + (name,))
+
+    def get(self) -> FakeDocumentSnapshot:
+        self._client._rpc()
+        with self._client._lock:
+            self._client.reads += 1
+            return FakeDocumentSnapshot(self, self._client._docs.get(self._path))
+
+    def set(self, data: dict, merge: bool = False):
+        self._client._rpc()
+        with self._client._lock:
+            self._client._set(self._path, data, merge)
+
+    def update(self, data: dict):
+        self._client._rpc()
+        with self._client._lock:
+            if self._path not in self._client._docs:
+                raise KeyError(f"No document to update: {self.path}")
+            self._client._set(self._path, data, merge=True)
+
+    def delete(self):
+        self._client._rpc()
+        with self._client._lock:
+            self._client._delete(self._path)
+
+
+class FakeQuery:
+    """Ordered, limited view over a collection"""
+
+    def __init__(self, collection: "FakeCollectionReference", orders=(), limit=None, cursor=None):
+        self._collection = collection
+        self._orders = list(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    def order_by(self, field: str, direction: str = ASCENDING) -> "FakeQuery":
+        return FakeQuery(self._collection, self._orders + [(field, direction)], self._limit, self._cursor)
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self._collection, self._orders, count, self._cursor)
+
+    def start_after(self, values) -> "FakeQuery":
+        return FakeQuery(self._collection, self._orders, self._limit, values)
+
+    def select(self, field_paths) -> "FakeQuery":
+        # Projections only save bandwidth in Firestore; results are unchanged here
+        return self
+
+    def _sort_key(self, snapshot: FakeDocumentSnapshot, field: str):
+        value = snapshot.id if field == "__name__" else snapshot.get(field)
+        # None sorts first, mirroring Firestore's type ordering for nulls
+        return (value is not None, value)
+
+    def _after_cursor(self, snapshot: FakeDocumentSnapshot) -> bool:
+        values = self._cursor
+        if isinstance(values, dict):
+            values = [values.get(f) for f, _ in self._orders]
+        elif isinstance(values, FakeDocumentSnapshot):
+            values = [values.id if f == "__name__" else values.get(f) for f, _ in self._orders]
+        for (field, direction), bound in zip(self._orders, values):
+            current = self._sort_key(snapshot, field)
+            target = (bound is not None, bound)
+            if current == target:
+                continue
+            return current < target if direction == DESCENDING else current > target
+        return False
+
+    def stream(self):
+        snapshots = self._collection._snapshots()
+        for field, direction in reversed(self._orders):
+            snapshots.sort(key=lambda s, f=field: self._sort_key(s, f), reverse=direction == DESCENDING)
+        if self._cursor is not None:
+            snapshots = [s for s in snapshots if self._after_cursor(s)]
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        for snapshot in snapshots:
+            yield snapshot
+
+    def get(self) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    """Reference to a collection of documents"""
+
+    def __init__(self, client: "FakeFirestoreClient", path: tuple):
+        self._client = client
+        self._path = path
+        self.id = path[-1]
+        super().__init__(self)
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, self._path + (doc_id or uuid.uuid4().hex[:20],))
+
+    def add(self, data: dict):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def _snapshots(self) -> List[FakeDocumentSnapshot]:
+        depth = len(self._path) + 1
+        self._client._rpc()
+        with self._client._lock:
+            self._client.reads += 1
+            return [
+                FakeDocumentSnapshot(FakeDocumentReference(self._client, path), data)
+                for path, data in self._client._docs.items()
+                if len(path) == depth and path[:-1] == self._path
+            ]
+
+
+class FakeWriteBatch:
+    """Accumulates writes and applies them atomically on commit"""
+
+    MAX_OPS = 500
+
+    def __init__(self, client: "FakeFirestoreClient"):
+        self._client = client
+        self._ops: List[tuple] = []
+
+    def _add(self, op: tuple):
+        if len(self._ops) >= self.MAX_OPS:
+            raise ValueError(f"A write batch can contain at most {self.MAX_OPS} operations")
+        self._ops.append(op)
+
+    def set(self, reference: FakeDocumentReference, data: dict, merge: bool = False):
+        self._add(("set", reference._path, data, merge))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._add(("delete", reference._path, None, False))
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def commit(self):
+        self._client._rpc()
+        with self._client._lock:
+            if self._client.fail_next_commits > 0:
+                self._client.fail_next_commits -= 1
+                raise RuntimeError("Simulated commit failure")
+            for kind, path, data, merge in self._ops:
+                if kind == "set":
+                    self._client._set(path, data, merge)
+                else:
+                    self._client._delete(path)
+            self._client.commits += 1
+            if self._client.lose_next_acks > 0:
+                self._client.lose_next_acks -= 1
+                raise RuntimeError("Simulated timeout after the commit landed")
+        ops, self._ops = self._ops, []
+        return [None] * len(ops)
+
+
+class FakeFirestoreClient:
+    """
+    Thread-safe in-memory Firestore client.
+
+    ``latency`` seconds are slept (outside the lock, like a network round
+    trip) on every document read or write, query and batch commit.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._docs: Dict[tuple, dict] = {}
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+        # Number of upcoming batch commits that should raise, for retry tests
+        self.fail_next_commits = 0
+        # Number of upcoming batch commits that apply but still raise
+        self.lose_next_acks = 0
+
+    def _rpc(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, (name,))
+
+    def document(self, path: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self, tuple(path.split("/")))
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def _set(self, path: tuple, data: Dict[str, Any], merge: bool):
+        self.writes += 1
+        if merge and path in self._docs:
+            self._docs[path] = {**self._docs[path], **data}
+        else:
+            self._docs[path] = dict(data)
+
+    def _delete(self, path: tuple):
+        self.writes += 1
+        # Like Firestore, deleting a document leaves its subcollections intact
+        self._docs.pop(path, None)
@@ -0,0 +1,173 @@
+"""
+Local stand-in for the Gemini REST API, for tests and benchmarks.
+
+Serves ``generateContent`` and ``streamGenerateContent`` with deterministic
+replies and configurable latency, so the backend can run without a key or
+network access. Run it with:
+    uvicorn fake_gemini:app --port 9000
+and set GEMINI_API_BASE=http://localhost:9000 for the backend.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import json
+import os
+
+ROADMAP_REPLY = {
+    "title": "Learning Roadmap",
+    "description": "A structured path generated by the fake Gemini server",
+    "modules": [
+        {
+            "id": 1,
+            "title": "Foundations",
+            "description": "Core concepts and terminology",
+            "topics": ["Basics", "Terminology", "Tooling"],
+            "duration": "1 week",
+            "difficulty": "Beginner"
+        },
+        {
+            "id": 2,
+            "title": "Practice",
+            "description": "Hands-on exercises and small projects",
+            "topics": ["Exercises", "Projects", "Debugging"],
+            "duration": "2 weeks",
+            "difficulty": "Intermediate"
+        },
+        {
+            "id": 3,
+            "title": "Mastery",
+            "description": "Advanced techniques and real-world work",
+            "topics": ["Patterns", "Performance", "Deployment"],
+            "duration": "3 weeks",
+            "difficulty": "Advanced"
+        }
+    ]
+}
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _last_user_text(body: dict) -> str:
+    for turn in reversed(body.get("contents") or []):
+        if turn.get("role", "user") == "user":
+            return "".join(part.get("text", "") for part in turn.get("parts") or [])
+    return ""
+
+
+def _input_tokens(body: dict) -> int:
+    texts = [
+        part.get("text", "")
+        for turn in body.get("contents") or []
+        for part in turn.get("parts") or []
+    ]
+    system = body.get("systemInstruction") or {}
+    texts.extend(part.get("text", "") for part in system.get("parts") or [])
+    return sum(_estimate_tokens(text) for text in texts)
+
+
+def _wants_json(body: dict) -> bool:
+    config = body.get("generationConfig") or {}
+    if config.get("responseMimeType") == "application/json":
+        return True
+    system = body.get("systemInstruction") or {}
+    return any("JSON generator" in part.get("text", "") for part in system.get("parts") or [])
+
+
+def build_reply(body: dict) -> str:
+    """Deterministic reply text for a request body"""
+    if _wants_json(body):
+        return json.dumps(ROADMAP_REPLY)
+    message = _last_user_text(body)
+    return (
+        f"Here is a response to: {message[:200]}\n\n"
+        "```python\n"
+        "def example():\n"
+        "    return 'hello from fake gemini'\n"
+        "```\n\n"
+        "This reply was produced by the local fake Gemini server."
+    )
+
+
+def _usage(body: dict, text: str) -> dict:
+    prompt_tokens = _input_tokens(body)
+    output_tokens = _estimate_tokens(text)
+    return {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": output_tokens,
+        "totalTokenCount": prompt_tokens + output_tokens,
+    }
+
+
+def _payload(text: str, finish_reason: str = None, usage: dict = None) -> dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    payload = {"candidates": [candidate]}
+    if usage:
+        payload["usageMetadata"] = usage
+    return payload
+
+
+def _split(text: str, chunks: int) -> list:
+    size = max(1, -(-len(text) // max(1, chunks)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def create_fake_gemini_app(
+    latency: float = 0.0,
+    ttft: float = 0.0,
+    chunk_delay: float = 0.0,
+    chunks: int = 8
+) -> FastAPI:
+    """
+    Build the fake server.
+
+    ``latency`` delays each non-streaming reply, ``ttft`` delays the first
+    streamed chunk and ``chunk_delay`` spaces out the remaining ones.
+    """
+    fake = FastAPI(title="Fake Gemini API")
+    fake.state.requests = 0
+
+    @fake.post("/v1beta/models/{model}:generateContent")
+    async def generate_content(model: str, request: Request):
+        fake.state.requests += 1
+        body = await request.json()
+        if latency:
+            await asyncio.sleep(latency)
+        text = build_reply(body)
+        return JSONResponse(_payload(text, "STOP", _usage(body, text)))
+
+    @fake.post("/v1beta/models/{model}:streamGenerateContent")
+    async def stream_generate_content(model: str, request: Request):
+        fake.state.requests += 1
+        body = await request.json()
+        text = build_reply(body)
+        pieces = _split(text, chunks)
+
+        async def events():
+            if ttft:
+                await asyncio.sleep(ttft)
+            for index, piece in enumerate(pieces):
+                if index and chunk_delay:
+                    await asyncio.sleep(chunk_delay)
+                last = index == len(pieces) - 1
+                payload = _payload(piece, "STOP" if last else None, _usage(body, text) if last else None)
+                yield f"data: {json.dumps(payload)}\r\n\r\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @fake.get("/health")
+    async def health():
+        return {"status": "healthy", "requests": fake.state.requests}
+
+    return fake
+
+
+app = create_fake_gemini_app(
+    latency=float(os.getenv("FAKE_GEMINI_LATENCY", "0")),
+    ttft=float(os.getenv("FAKE_GEMINI_TTFT", "0")),
+    chunk_delay=float(os.getenv("FAKE_GEMINI_CHUNK_DELAY", "0")),
+    chunks=int(os.getenv("FAKE_GEMINI_CHUNKS", "8"))
+)
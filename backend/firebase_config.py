@@ -1,131 +1,446 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
+from concurrent.futures import ThreadPoolExecutor
 from config import settings
+from services.metrics import span
+from services.response_cache import create_redis_backend
+from services.token_verifier import TokenVerifier
+from typing import Callable, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import base64
+import contextvars
+import functools
+import json
+import logging
 import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects write batches with more than 500 operations
+MAX_BATCH_OPS = 500
+
+# Documents pulled per worker hop when streaming chat history
+HISTORY_STREAM_CHUNK = 100
+
+
+def encode_history_cursor(timestamp, doc_id: str) -> str:
+    """Encode a (timestamp, document id) position as an opaque cursor"""
+    if isinstance(timestamp, datetime):
+        timestamp = {"dt": timestamp.isoformat()}
+    payload = json.dumps({"t": timestamp, "id": doc_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple:
+    """Decode a cursor from encode_history_cursor; raises ValueError if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        timestamp = data["t"]
+        if isinstance(timestamp, dict):
+            timestamp = datetime.fromisoformat(timestamp["dt"])
+        return timestamp, str(data["id"])
+    except Exception:
+        raise ValueError("Invalid history cursor")
 
 
 class FirebaseService:
     """Firebase service for authentication and database operations"""
-    
-    def __init__(self):
+
+    def __init__(self, db=None):
         self.app = None
-        self.db = None
-        self.initialize_firebase()
-    
+        self.db = db
+        # The Admin SDK is imported and connected by start(), not at import time
+        self.initialized = db is not None
+        # Firestore's client is blocking, so every call runs on a dedicated,
+        # bounded pool instead of the event loop or the default executor.
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.firestore_max_workers,
+            thread_name_prefix="firestore"
+        )
+        # Token verification may fetch Google's signing keys over HTTP; a pool
+        # of its own keeps it from waiting behind (or starving) Firestore calls.
+        self._auth_executor = ThreadPoolExecutor(
+            max_workers=settings.auth_verify_max_workers,
+            thread_name_prefix="auth"
+        )
+        self._semaphore: asyncio.Semaphore = None
+        self.token_verifier = TokenVerifier(
+            project_id_fn=self._project_id,
+            revoked_check_fn=self._verify_revoked,
+            cache_size=settings.auth_token_cache_size,
+            cache_ttl=settings.auth_token_cache_ttl,
+            check_revoked=settings.auth_check_revoked,
+            shared=create_redis_backend(settings.shared_store_url, "authtok:", required=True) if settings.shared_store_url else None
+        )
+
+    async def start(self):
+        """Initialize Firebase once, on the Firestore pool so the event loop keeps running"""
+        if self.initialized or self.db is not None:
+            return
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.initialize_firebase)
+
     def initialize_firebase(self):
         """Initialize Firebase Admin SDK"""
+        import firebase_admin
+        from firebase_admin import credentials, firestore
         try:
             # Check if Firebase is already initialized
             if not firebase_admin._apps:
                 cred_path = settings.firebase_credentials_path
-                
+
                 if os.path.exists(cred_path):
                     cred = credentials.Certificate(cred_path)
                     self.app = firebase_admin.initialize_app(cred)
                     self.db = firestore.client()
-                    print("✅ Firebase initialized successfully")
+                    logger.info("Firebase initialized")
                 else:
-                    print(f"⚠️ Firebase credentials not found at {cred_path}")
-                    print("⚠️ Running without Firebase - authentication disabled")
+                    logger.warning("Firebase credentials not found, running without Firebase (authentication disabled)", extra={"path": cred_path})
                     self.app = None
                     self.db = None
             else:
                 self.app = firebase_admin.get_app()
                 self.db = firestore.client()
         except Exception as e:
-            print(f"❌ Error initializing Firebase: {e}")
+            logger.error("Error initializing Firebase: %s", e)
             self.app = None
             self.db = None
-    
+        self.initialized = True
+
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking Firestore call on the pool with a concurrency cap and timeout"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.firestore_max_concurrency)
+
+        # Timed from the caller's side, so the stage includes waiting for a worker
+        stage = "firestore." + getattr(fn, "__name__", "call").lstrip("_").replace("_sync", "")
+        with span(stage):
+            await self._semaphore.acquire()
+            loop = asyncio.get_running_loop()
+            # Copy the context so logs from the worker keep the request id
+            call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+            future = loop.run_in_executor(self._executor, call)
+            # A timed-out call keeps its worker thread busy, so the permit is
+            # released when the thread returns, not when the caller gives up;
+            # otherwise timeouts would admit more calls than the pool can run.
+            future.add_done_callback(self._release_permit)
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout=settings.firestore_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Firestore call timed out after {settings.firestore_timeout}s")
+
+    def _release_permit(self, future: asyncio.Future):
+        self._semaphore.release()
+        if not future.cancelled():
+            # Nobody may be awaiting it any more; don't log it as unretrieved
+            future.exception()
+
+    def close(self):
+        """Release the Firestore and token verification worker threads"""
+        self._executor.shutdown(wait=False)
+        self._auth_executor.shutdown(wait=False)
+
+    @staticmethod
+    def _verify_revoked(token: str):
+        from firebase_admin import auth
+        return auth.verify_id_token(token, check_revoked=True)
+
+    def server_timestamp(self):
+        """Firestore's server-side timestamp sentinel, or None without Firebase"""
+        if not self.db:
+            return None
+        from firebase_admin import firestore
+        return firestore.SERVER_TIMESTAMP
+
+    def _project_id(self):
+        return self.app.project_id if self.app else None
+
     def verify_token(self, token: str):
-        """Verify Firebase ID token"""
-        try:
-            decoded_token = auth.verify_id_token(token)
+        """Verify Firebase ID token, serving repeated tokens from the claims cache"""
+        return self.token_verifier.verify(token)
+
+    async def verify_token_async(self, token: str):
+        """Verify Firebase ID token without blocking the event loop on a cache miss"""
+        # Only the in-process tier here; verify() checks the shared one off the loop
+        decoded_token = self.token_verifier.get_cached(token, shared=False)
+        if decoded_token is not None:
             return decoded_token
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, self.token_verifier.verify, token)
+        try:
+            with span("auth.verify_token"):
+                return await asyncio.wait_for(
+                    loop.run_in_executor(self._auth_executor, call),
+                    timeout=settings.auth_verify_timeout
+                )
+        except asyncio.TimeoutError:
+            logger.warning("Token verification timed out after %ss", settings.auth_verify_timeout)
+            return None
         except Exception as e:
-            print(f"Token verification error: {e}")
+            logger.warning("Token verification error: %s", e)
             return None
-    
-    def get_user(self, uid: str):
+
+    def _chat_collection(self, uid: str):
+        return self.db.collection('users').document(uid).collection('chat_history')
+
+    async def get_user(self, uid: str):
         """Get user data from Firestore"""
         if not self.db:
             return None
-        
+
         try:
-            user_ref = self.db.collection('users').document(uid)
-            user_doc = user_ref.get()
-            
-            if user_doc.exists:
-                return user_doc.to_dict()
-            return None
+            return await self._run(self._get_user_sync, uid)
         except Exception as e:
-            print(f"Error getting user: {e}")
+            logger.error("Error getting user: %s", e)
             return None
-    
-    def create_or_update_user(self, uid: str, user_data: dict):
+
+    def _get_user_sync(self, uid: str):
+        user_doc = self.db.collection('users').document(uid).get()
+        if user_doc.exists:
+            return user_doc.to_dict()
+        return None
+
+    async def create_or_update_user(self, uid: str, user_data: dict):
         """Create or update user in Firestore"""
         if not self.db:
             return False
-        
+
         try:
-            user_ref = self.db.collection('users').document(uid)
-            user_ref.set(user_data, merge=True)
+            await self._run(self._create_or_update_user_sync, uid, user_data)
             return True
         except Exception as e:
-            print(f"Error creating/updating user: {e}")
+            logger.error("Error creating/updating user: %s", e)
             return False
-    
-    def save_chat_message(self, uid: str, message: dict):
+
+    def _create_or_update_user_sync(self, uid: str, user_data: dict):
+        self.db.collection('users').document(uid).set(user_data, merge=True)
+
+    async def save_chat_message(self, uid: str, message: dict):
         """Save chat message to user's history"""
         if not self.db:
             return False
-        
+
         try:
-            chat_ref = self.db.collection('users').document(uid).collection('chat_history')
-            chat_ref.add(message)
+            await self._run(self._save_chat_message_sync, uid, message)
             return True
         except Exception as e:
-            print(f"Error saving chat message: {e}")
+            logger.error("Error saving chat message: %s", e)
             return False
-    
-    def get_chat_history(self, uid: str, limit: int = 50):
+
+    def _save_chat_message_sync(self, uid: str, message: dict):
+        self._chat_collection(uid).add(message)
+
+    async def save_chat_messages_batch(self, items: List[Tuple[str, str, dict]]):
+        """Save (uid, document id, message) items for any number of users in one write batch"""
+        if not self.db:
+            return False
+
+        try:
+            await self._run(self._save_chat_messages_batch_sync, items)
+            return True
+        except Exception as e:
+            logger.error("Error saving chat message batch: %s", e)
+            return False
+
+    def _save_chat_messages_batch_sync(self, items: List[Tuple[str, str, dict]]):
+        batch = self.db.batch()
+        for uid, doc_id, message in items:
+            batch.set(self._chat_collection(uid).document(doc_id), message)
+        batch.commit()
+
+    async def get_roadmap(self, key: str) -> Optional[dict]:
+        """Get a stored roadmap from the roadmap catalog"""
+        if not self.db:
+            return None
+
+        try:
+            return await self._run(self._get_roadmap_sync, key)
+        except Exception as e:
+            logger.error("Error getting roadmap: %s", e)
+            return None
+
+    def _get_roadmap_sync(self, key: str):
+        doc = self.db.collection('roadmap_catalog').document(key).get()
+        return doc.to_dict() if doc.exists else None
+
+    async def save_roadmap(self, key: str, entry: dict):
+        """Save a roadmap to the roadmap catalog"""
+        if not self.db:
+            return False
+
+        try:
+            await self._run(self._save_roadmap_sync, key, entry)
+            return True
+        except Exception as e:
+            logger.error("Error saving roadmap: %s", e)
+            return False
+
+    def _save_roadmap_sync(self, key: str, entry: dict):
+        self.db.collection('roadmap_catalog').document(key).set(entry)
+
+    async def get_chat_history(self, uid: str, limit: int = 50):
         """Get user's chat history"""
+        messages, _ = await self.get_chat_history_page(uid, limit)
+        return messages
+
+    async def get_chat_history_page(self, uid: str, limit: int = 50, cursor: Optional[str] = None):
+        """
+        Get one page of a user's chat history.
+
+        Returns the ``limit`` most recent messages older than ``cursor`` in
+        chronological order, plus the cursor for the next (older) page or
+        None when there is nothing left. Raises ValueError for a bad cursor.
+        """
         if not self.db:
-            return []
-        
+            return [], None
+
+        position = decode_history_cursor(cursor) if cursor else None
         try:
-            chat_ref = self.db.collection('users').document(uid).collection('chat_history')
-            docs = chat_ref.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit).stream()
-            
-            messages = []
+            return await self._run(self._get_chat_history_page_sync, uid, limit, position)
+        except Exception as e:
+            logger.error("Error getting chat history: %s", e)
+            return [], None
+
+    def _history_query(self, uid: str, position: Optional[Tuple] = None, limit: Optional[int] = None):
+        from firebase_admin import firestore
+        # Document id breaks timestamp ties so the cursor is a total order
+        query = self._chat_collection(uid).order_by(
+            'timestamp', direction=firestore.Query.DESCENDING
+        ).order_by('__name__', direction=firestore.Query.DESCENDING)
+        if position is not None:
+            query = query.start_after({'timestamp': position[0], '__name__': position[1]})
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def _get_chat_history_page_sync(self, uid: str, limit: int, position: Optional[Tuple]):
+        # Fetch one extra document to learn whether an older page exists
+        docs = list(self._history_query(uid, position, limit + 1).stream())
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+
+        messages = []
+        for doc in docs:
+            msg = doc.to_dict()
+            msg['id'] = doc.id
+            messages.append(msg)
+
+        next_cursor = None
+        if has_more and messages:
+            oldest = messages[-1]
+            next_cursor = encode_history_cursor(oldest.get('timestamp'), oldest['id'])
+
+        # Return in chronological order
+        return list(reversed(messages)), next_cursor
+
+    async def stream_chat_history(self, uid: str, limit: Optional[int] = None, cursor: Optional[str] = None):
+        """
+        Yield a user's chat history newest first as Firestore produces it.
+
+        Documents are pulled from the query stream a chunk at a time, so
+        memory stays flat and the first message is available without waiting
+        for the whole history. Raises ValueError for a bad cursor.
+        """
+        if not self.db:
+            return
+
+        position = decode_history_cursor(cursor) if cursor else None
+        docs = self._history_query(uid, position, limit).stream()
+        # Held by a worker while it pulls a chunk, so closing waits for it
+        lock = threading.Lock()
+        try:
+            while True:
+                chunk = await self._run(self._next_history_chunk_sync, docs, lock)
+                if not chunk:
+                    break
+                for msg in chunk:
+                    yield msg
+        finally:
+            # Runs when the client disconnects too; release the Firestore
+            # stream without blocking the loop on a chunk still being pulled
+            try:
+                self._executor.submit(self._close_history_stream_sync, docs, lock)
+            except RuntimeError:
+                # The pool is already shut down at exit
+                pass
+
+    def _next_history_chunk_sync(self, docs, lock: threading.Lock) -> List[dict]:
+        chunk = []
+        with lock:
             for doc in docs:
                 msg = doc.to_dict()
                 msg['id'] = doc.id
-                messages.append(msg)
-            
-            # Return in chronological order
-            return list(reversed(messages))
-        except Exception as e:
-            print(f"Error getting chat history: {e}")
-            return []
-    
-    def delete_chat_history(self, uid: str):
-        """Delete all chat history for a user"""
+                chunk.append(msg)
+                if len(chunk) >= HISTORY_STREAM_CHUNK:
+                    break
+        return chunk
+
+    @staticmethod
+    def _close_history_stream_sync(docs, lock: threading.Lock):
+        with lock:
+            try:
+                docs.close()
+            except Exception as e:
+                logger.debug("Could not close history stream: %s", e)
+
+    async def delete_chat_history(self, uid: str, progress: Optional[Callable[[int], None]] = None):
+        """
+        Delete all chat history for a user.
+
+        Documents are listed page by page with a cursor and removed in write
+        batches of up to 500 deletes, with several batches committing
+        concurrently. ``progress`` is called with the running deleted count.
+        """
         if not self.db:
             return False
-        
+
+        pending = set()
         try:
-            chat_ref = self.db.collection('users').document(uid).collection('chat_history')
-            docs = chat_ref.stream()
-            
-            for doc in docs:
-                doc.reference.delete()
-            
+            deleted = 0
+            cursor = None
+            while True:
+                page = await self._run(self._list_chat_page_sync, uid, cursor)
+                if not page:
+                    break
+                cursor = page[-1]
+                pending.add(asyncio.ensure_future(
+                    self._run(self._delete_documents_sync, [doc.reference for doc in page])
+                ))
+                if len(pending) >= settings.history_delete_concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        deleted += task.result()
+                    if progress:
+                        progress(deleted)
+
+            for count in await asyncio.gather(*pending):
+                deleted += count
+            if progress:
+                progress(deleted)
             return True
         except Exception as e:
-            print(f"Error deleting chat history: {e}")
+            logger.error("Error deleting chat history: %s", e)
             return False
+        finally:
+            # After a failed batch, stop the others and wait for them to settle
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def _list_chat_page_sync(self, uid: str, cursor=None):
+        query = self._chat_collection(uid).order_by('__name__').select([]).limit(MAX_BATCH_OPS)
+        if cursor is not None:
+            query = query.start_after(cursor)
+        return list(query.stream())
 
+    def _delete_documents_sync(self, references: list) -> int:
+        batch = self.db.batch()
+        for ref in references:
+            batch.delete(ref)
+        batch.commit()
+        return len(references)
 
 # Singleton instance
 firebase_service = FirebaseService()
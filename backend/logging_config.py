@@ -0,0 +1,229 @@
+"""
+Structured, non-blocking application logging.
+
+Records are handed to a bounded in-memory queue on the calling thread and
+written as JSON lines by a background listener thread, so a slow or
+contended stdout never blocks the event loop. Every record carries the id
+of the request it was logged under.
+
+Usage::
+
+    logger = logging.getLogger(__name__)
+    logger.info("Chat request", extra={"mode": mode, "sample": True})
+
+    # Guard expensive debug payloads; the check is a single attribute read
+    if logging_config.DEBUG:
+        logger.debug("Prompt", extra={"prompt": render_prompt()})
+
+``extra={"sample": True}`` marks high-volume success lines, which are kept
+for ``LOG_SAMPLE_RATE`` of requests; warnings and errors are never sampled.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+import zlib
+
+# Request id of the request being handled, "-" outside of requests
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+# True when DEBUG records are emitted; set by configure_logging
+DEBUG = False
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+# LogRecord attributes that are not user-supplied ``extra`` fields
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "sample"
+}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+_options: tuple = ()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with the message, request id and extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(request_id)s] %(name)s: %(message)s")
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep ``rate`` of the records marked ``sample``.
+
+    The decision is made per request id, so a sampled request keeps all of
+    its lines and a dropped one loses all of them.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or not getattr(record, "sample", False) or record.levelno >= logging.WARNING:
+            return True
+        rid = getattr(record, "request_id", "-")
+        if rid == "-":
+            return random.random() < self.rate
+        return zlib.crc32(rid.encode()) / 0xFFFFFFFF < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue records for the listener thread without ever blocking the caller.
+
+    Formatting is left to the listener; only the message and traceback are
+    rendered here, since args and exc_info may not survive the thread hop.
+    A full queue drops the record and counts it.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {"queue_depth": self.queue.qsize(), "dropped": self.dropped}
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full; the listener thread is draining it, so wait
+        self.queue.put(self._sentinel)
+
+
+class _RequestIdFilter(logging.Filter):
+    # Runs on the calling thread, where the request's context is still set
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json", sample_rate: float = 1.0, queue_size: int = 10000):
+    """Route the root logger through the queue to a JSON (or text) stdout handler"""
+    global DEBUG, _listener, _handler, _options
+    stop_logging()
+    _options = (level, fmt, sample_rate, queue_size)
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+
+    _handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    _handler.addFilter(_RequestIdFilter())
+    _handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level.upper())
+    DEBUG = root.isEnabledFor(logging.DEBUG)
+    # httpx logs every upstream request at INFO
+    logging.getLogger("httpx").setLevel(logging.DEBUG if DEBUG else logging.WARNING)
+
+    _listener = _Listener(_handler.queue, stream, respect_handler_level=False)
+    _listener.start()
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _after_fork():
+    # The listener thread does not survive fork; start a fresh queue and thread
+    global _listener
+    if _listener is not None:
+        _listener = None
+        configure_logging(*_options)
+
+
+def logging_stats() -> Optional[dict]:
+    return _handler.stats() if _handler is not None else None
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware binding a request id to everything logged for a request.
+
+    Uses the caller's ``X-Request-ID`` when present, otherwise a new one, and
+    echoes it in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rid = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                rid = value.decode("latin-1")[:128]
+                break
+        rid = rid or uuid.uuid4().hex
+        token = request_id.set(rid)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
+
+
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
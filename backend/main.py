@@ -1,32 +1,85 @@
-from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
 import re
 from fastapi.responses import StreamingResponse
 import json
+import logging
+import time
 from datetime import datetime
 from typing import Optional
 from config import settings
+import logging_config
+from logging_config import RequestIdMiddleware, logging_stats
 from models import (
     ChatRequest, 
     ChatResponse, 
     CodeGenerationRequest, 
+    CodeGenerationBatchRequest,
     ErrorResponse,
     TokenVerifyRequest,
     UserProfileResponse,
-    ChatHistoryResponse
+    ChatHistoryResponse,
+    HistoryDeletionJobResponse
 )
 from services.ai_service import ai_service
-from firebase_config import firebase_service
+from services.admission import OverloadedError
+from services.streaming import StreamEvent, stream_until_disconnect
+from services.sse import DONE_DATA, dumps, parse_last_event_id, sse_replay
+from firebase_config import firebase_service, decode_history_cursor
+from services.history_writer import history_writer
+from services.history_jobs import history_deletion_jobs
+from services.metrics import MetricsMiddleware, merge_process_files, registry as metrics_registry, span, stream_first_chunk
 from routes import auth
 from dependencies import get_current_user
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Connect external services on startup and release them on shutdown.
+
+    Importing the app stays cheap: Firebase and the roadmap store are set
+    up here, and /ready reports 503 until this has finished.
+    """
+    start = time.perf_counter()
+    await ai_service.start()
+    # Under serve.py with several workers, publish this worker's samples for the merged /metrics
+    exporter = None
+    if settings.metrics_enabled and settings.metrics_multiproc_dir:
+        exporter = asyncio.get_running_loop().create_task(
+            metrics_registry.export(settings.metrics_multiproc_dir, settings.metrics_export_interval)
+        )
+    app.state.ready = True
+    logger.info("Startup complete", extra={
+        "startup_ms": round((time.perf_counter() - start) * 1000, 1),
+        "firebase_enabled": firebase_service.db is not None
+    })
+    yield
+    # Stop advertising readiness first so load balancers drain this instance
+    app.state.ready = False
+    await history_writer.stop(timeout=settings.history_drain_timeout)
+    firebase_service.close()
+    await ai_service.close()
+    if exporter is not None:
+        exporter.cancel()
+        await asyncio.gather(exporter, return_exceptions=True)
+
+
 # Create FastAPI app
 app = FastAPI(
     title="AI Code Generator Chatbot API",
     description="Backend API for AI-powered code generation chatbot",
     version="1.0.0",
-    debug=settings.debug
+    debug=settings.debug,
+    lifespan=lifespan
 )
+app.state.ready = False
 
 # Configure CORS
 # Support wildcard origins (e.g. https://*.vercel.app) by splitting
@@ -54,9 +107,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
+# Outermost, so everything logged while handling a request carries its id
+app.add_middleware(RequestIdMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 
+# Export the stats services already keep as Prometheus samples
+metrics_registry.add_collector(
+    "app_admission", "Admission control", ai_service.admission.stats,
+    counters=("admitted", "rejected")
+)
+metrics_registry.add_collector(
+    "app_single_flight", "Request coalescing", ai_service.single_flight.stats,
+    counters=("leaders", "coalesced", "stream_leaders", "stream_coalesced", "stream_cancelled")
+)
+metrics_registry.add_collector(
+    "app_response_cache", "Response cache", ai_service.response_cache.stats,
+    counters=("hits", "semantic_hits", "misses")
+)
+metrics_registry.add_collector(
+    "app_roadmap_store", "Roadmap catalog", lambda: ai_service.roadmap_store.stats(),
+    counters=("hits", "memory_hits", "misses", "writes")
+)
+metrics_registry.add_collector(
+    "app_streams", "Chat streams", ai_service.stream_metrics.stats,
+    counters=("started", "completed", "failed", "client_disconnects", "upstream_cancelled", "tokens_streamed", "tokens_saved")
+)
+metrics_registry.add_collector(
+    "app_model_pool", "Gemini client pool",
+    lambda: ai_service.transport.model_pool.stats() if hasattr(ai_service.transport, "model_pool") else None,
+    counters=("hits", "misses", "evictions")
+)
+metrics_registry.add_collector(
+    "app_token_cache", "Verified ID token cache", firebase_service.token_verifier.stats,
+    counters=("hits", "shared_hits", "misses", "key_fetches")
+)
+metrics_registry.add_collector(
+    "app_history_writer", "Batched chat history writes", history_writer.stats,
+    counters=("enqueued", "written", "dropped", "failed", "batches", "retries")
+)
+metrics_registry.add_collector(
+    "app_log", "Log queue", logging_stats,
+    counters=("dropped",)
+)
+metrics_registry.add_collector(
+    "app_sse_replay", "Resumable SSE streams", sse_replay.stats,
+    counters=("resumes",)
+)
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request, exc: OverloadedError):
+    """Reject requests that cannot be admitted with Retry-After"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 
 @app.get("/")
 async def root():
@@ -69,6 +181,7 @@ async def root():
         "endpoints": {
             "chat": "/api/chat",
             "code": "/api/generate-code",
+            "code_batch": "/api/generate-code/batch",
             "stream": "/api/chat/stream",
             "auth": "/api/auth/verify",
             "history": "/api/chat/history"
@@ -76,12 +189,74 @@ async def root():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.metrics_multiproc_dir:
+        # Whichever worker is scraped reports every worker's samples
+        metrics_registry.write_process_file(settings.metrics_multiproc_dir)
+        body = merge_process_files(settings.metrics_multiproc_dir)
+    else:
+        body = metrics_registry.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness check: the process is up and serving requests"""
     return {"status": "healthy", "service": "ai-chatbot-backend"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness check: 200 once startup has finished and new generations are
+    being admitted, 503 while starting, shutting down or overloaded
+    """
+    try:
+        ai_service.check_capacity()
+        accepting = True
+    except OverloadedError:
+        accepting = False
+    started = app.state.ready
+    ready = started and accepting
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else ("overloaded" if started else "not_ready"),
+            "firebase_enabled": firebase_service.db is not None
+        }
+    )
+
+
+def queue_chat_turns(current_user: Optional[dict], request: ChatRequest, result: dict):
+    """Queue a user turn and the assistant reply for a batched background write"""
+    if not current_user or not firebase_service.db:
+        return
+    uid = current_user.get('uid')
+    
+    with span("history.enqueue"):
+        # Save user message
+        history_writer.enqueue(uid, {
+            'role': 'user',
+            'content': request.message,
+            'language': request.language,
+            'mode': request.mode,
+            'timestamp': datetime.now()
+        })
+        
+        # Save assistant response
+        history_writer.enqueue(uid, {
+            'role': 'assistant',
+            'content': result["message"],
+            'language': result["language"],
+            'has_code': result["has_code"],
+            'timestamp': datetime.now()
+        })
+
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, current_user: Optional[dict] = Depends(get_current_user)):
     """
@@ -94,7 +269,9 @@ async def chat(request: ChatRequest, current_user: Optional[dict] = Depends(get_
     - **user_id**: Firebase UID (optional, from auth token)
     """
     try:
-        print(f"📨 Chat request: mode={request.mode}, lang={request.language}, msg={request.message[:50]}...")
+        logger.info("Chat request", extra={"mode": request.mode, "language": request.language, "sample": True})
+        if logging_config.DEBUG:
+            logger.debug("Chat message", extra={"content": request.message[:200]})
         result = await ai_service.generate_chat_response(
             message=request.message,
             conversation_history=request.conversation_history,
@@ -102,7 +279,7 @@ async def chat(request: ChatRequest, current_user: Optional[dict] = Depends(get_
             mode=request.mode,
             api_key=request.api_key
         )
-        print(f"✅ AI response received, has_code={result.get('has_code')}")
+        logger.info("AI response received", extra={"has_code": result.get("has_code"), "sample": True})
         
         response = ChatResponse(
             message=result["message"],
@@ -110,34 +287,15 @@ async def chat(request: ChatRequest, current_user: Optional[dict] = Depends(get_
             has_code=result["has_code"]
         )
         
-        # Save to Firebase if user is authenticated
-        if current_user and firebase_service.db:
-            uid = current_user.get('uid')
-            
-            # Save user message
-            firebase_service.save_chat_message(uid, {
-                'role': 'user',
-                'content': request.message,
-                'language': request.language,
-                'mode': request.mode,
-                'timestamp': datetime.now()
-            })
-            
-            # Save assistant response
-            firebase_service.save_chat_message(uid, {
-                'role': 'assistant',
-                'content': result["message"],
-                'language': result["language"],
-                'has_code': result["has_code"],
-                'timestamp': datetime.now()
-            })
+        # Queue both turns for a batched background write if user is authenticated
+        queue_chat_turns(current_user, request, result)
         
         return response
         
+    except OverloadedError:
+        raise
     except Exception as e:
-        import traceback
-        print(f"❌ Chat error: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Chat error: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Error processing chat request: {str(e)}"
@@ -169,6 +327,8 @@ async def generate_code(request: CodeGenerationRequest):
             "success": True
         }
         
+    except OverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -176,29 +336,139 @@ async def generate_code(request: CodeGenerationRequest):
         )
 
 
+@app.post("/api/generate-code/batch")
+async def generate_code_batch(request: CodeGenerationBatchRequest):
+    """
+    Generate code for a list of /api/generate-code requests
+    
+    - **items**: Code generation requests (same fields as /api/generate-code)
+    - **concurrency**: Items generated at once (optional, capped by the server)
+    
+    Streams NDJSON, one line per item in completion order:
+    ``{"index", "success", "code", "language"}``, or ``{"index", "success":
+    false, "error"}`` for an item that failed. Identical items are generated
+    once and reported under each of their indexes.
+    """
+    if len(request.items) > settings.code_batch_max_items:
+        raise HTTPException(
+            status_code=422,
+            detail=f"A batch can contain at most {settings.code_batch_max_items} items"
+        )
+    
+    # Fail fast with 503 before the stream starts if we are saturated
+    ai_service.check_capacity()
+    
+    concurrency = min(request.concurrency or settings.code_batch_concurrency, settings.code_batch_concurrency)
+    
+    async def generate():
+        async for result in ai_service.generate_code_batch(request.items, concurrency):
+            yield dumps(result) + b"\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/api/chat/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    current_user: Optional[dict] = Depends(get_current_user)
+):
     """
     Stream chat responses for real-time interaction
     
-    Returns a stream of text chunks for progressive display
+    Returns server-sent events carrying text chunks for progressive display,
+    with the same roadmap handling as /api/chat. Named events report code
+    blocks as they open (``code_start``) and close (``code_block``); a final
+    ``summary`` event carries ``has_code`` and ``code_blocks`` before
+    ``data: [DONE]``. Completed replies are saved to history for signed-in
+    users.
+    
+    Each event has an id; re-sending the request with a ``Last-Event-ID``
+    header resumes the stream after that event. Generation continues for
+    SSE_RESUME_GRACE seconds after the client disconnects, so a resume gets
+    the complete reply; if nobody resumes, the upstream generation is
+    cancelled and the stream ends with an ``error`` event marked truncated.
     """
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    uid = current_user.get('uid') if current_user else None
+    
+    last_event_id = http_request.headers.get("last-event-id")
+    if last_event_id:
+        position = parse_last_event_id(last_event_id)
+        stream = sse_replay.get(position[0], owner=uid) if position else None
+        if stream is None:
+            raise HTTPException(
+                status_code=410,
+                detail="Stream can no longer be resumed, retry without Last-Event-ID"
+            )
+        return StreamingResponse(
+            stream.follow(position[1], heartbeat=settings.sse_heartbeat_interval),
+            media_type="text/event-stream",
+            headers=headers
+        )
+    
     try:
-        async def generate():
-            async for chunk in ai_service.stream_chat_response(
+        # Fail fast with 503 before the stream starts if we are saturated
+        ai_service.check_capacity()
+        
+        started = time.perf_counter()
+        stream = sse_replay.create(owner=uid)
+        
+        async def produce():
+            # Writes into the replay buffer; readers follow it, so generation
+            # survives a dropped connection for the stream's grace period
+            parts = []
+            summary = None
+            chunks = ai_service.stream_chat(
                 message=request.message,
                 conversation_history=request.conversation_history,
                 language=request.language,
                 mode=request.mode,
                 api_key=request.api_key
-            ):
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
+            )
+            try:
+                async for chunk in stream_until_disconnect(
+                    stream,
+                    chunks,
+                    metrics=ai_service.stream_metrics,
+                    queue_size=settings.stream_queue_size,
+                    poll_interval=settings.stream_disconnect_poll,
+                    coalesce_bytes=settings.sse_coalesce_bytes,
+                    coalesce_interval=settings.sse_coalesce_interval
+                ):
+                    if isinstance(chunk, StreamEvent):
+                        if chunk.name == "summary":
+                            summary = chunk.data
+                        stream.event(dumps(chunk.data), event=chunk.name)
+                    else:
+                        if not parts:
+                            stream_first_chunk.labels("chat_stream").observe(time.perf_counter() - started)
+                        parts.append(chunk)
+                        stream.event(dumps({"content": chunk}))
+                if summary is not None:
+                    stream.event(DONE_DATA)
+                    queue_chat_turns(current_user, request, {**summary, "message": "".join(parts)})
+                else:
+                    stream.event(dumps({"error": "No client resumed the stream", "truncated": True}), event="error")
+            except Exception as e:
+                logger.exception("Chat stream failed")
+                stream.event(dumps({"error": str(e), "truncated": True}), event="error")
+            finally:
+                stream.finish()
         
+        stream.task = asyncio.get_running_loop().create_task(produce())
         return StreamingResponse(
-            generate(),
-            media_type="text/event-stream"
+            stream.follow(heartbeat=settings.sse_heartbeat_interval),
+            media_type="text/event-stream",
+            headers=headers
         )
         
+    except OverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -231,37 +501,76 @@ async def get_supported_languages():
 
 
 @app.get("/api/chat/history", response_model=ChatHistoryResponse)
-async def get_chat_history(limit: int = 50, current_user: Optional[dict] = Depends(get_current_user)):
-    """Get user's chat history"""
+async def get_chat_history(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    """Get one page of the user's chat history; pass next_cursor back to page further"""
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
         uid = current_user.get('uid')
-        messages = firebase_service.get_chat_history(uid, limit)
-        return ChatHistoryResponse(messages=messages, total=len(messages))
+        messages, next_cursor = await firebase_service.get_chat_history_page(uid, limit, cursor)
+        return ChatHistoryResponse(messages=messages, total=len(messages), next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting chat history: {str(e)}")
 
 
-@app.delete("/api/chat/history")
+@app.get("/api/chat/history/stream")
+async def stream_chat_history(
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    """Stream the user's chat history as NDJSON, newest message first"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if cursor:
+        try:
+            decode_history_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    async def generate():
+        async for msg in firebase_service.stream_chat_history(current_user.get('uid'), limit, cursor):
+            yield json.dumps(jsonable_encoder(msg)) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.delete("/api/chat/history", status_code=202, response_model=HistoryDeletionJobResponse)
 async def delete_chat_history(current_user: Optional[dict] = Depends(get_current_user)):
-    """Delete all chat history for the user"""
+    """Start deleting all chat history for the user in the background"""
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    if not firebase_service.db:
+        raise HTTPException(status_code=500, detail="Failed to delete chat history")
+    
     try:
         uid = current_user.get('uid')
-        success = firebase_service.delete_chat_history(uid)
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to delete chat history")
-        return {"message": "Chat history deleted successfully"}
-    except HTTPException:
-        raise
+        job = await history_deletion_jobs.start(uid)
+        return HistoryDeletionJobResponse(**job.to_dict(), message="Chat history deletion started")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting chat history: {str(e)}")
 
 
+@app.get("/api/chat/history/delete/{job_id}", response_model=HistoryDeletionJobResponse)
+async def get_delete_chat_history_status(job_id: str, current_user: Optional[dict] = Depends(get_current_user)):
+    """Get the status of a chat history deletion job"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    job = await history_deletion_jobs.get(job_id, current_user.get('uid'))
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    return HistoryDeletionJobResponse(**job.to_dict())
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -23,7 +23,7 @@ class ChatRequest(BaseModel):
     """Request model for chat endpoint"""
     message: str = Field(..., min_length=1, max_length=10000)
     conversation_history: List[Message] = Field(default_factory=list)
-    language: Optional[str] = Field(default="python", description="Programming language for code generation")
+    language: Optional[str] = Field(default="python", max_length=32, description="Programming language for code generation")
     mode: Literal["code", "chat", "explain", "roadmap"] = Field(default="code", description="Chat mode")
     user_id: Optional[str] = None  # Firebase UID
     api_key: Optional[str] = Field(default=None, description="User-supplied Gemini API key override")
@@ -32,12 +32,18 @@ class ChatRequest(BaseModel):
 class CodeGenerationRequest(BaseModel):
     """Request model for code generation endpoint"""
     prompt: str = Field(..., min_length=1, max_length=5000)
-    language: str = Field(default="python")
+    language: str = Field(default="python", max_length=32)
     include_comments: bool = Field(default=True)
     include_tests: bool = Field(default=False)
     api_key: Optional[str] = Field(default=None, description="User-supplied Gemini API key override")
 
 
+class CodeGenerationBatchRequest(BaseModel):
+    """Request model for batch code generation"""
+    items: List[CodeGenerationRequest] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(default=None, ge=1, description="Items generated at once (capped by the server)")
+
+
 class ChatResponse(BaseModel):
     """Response model for chat endpoint"""
     message: str
@@ -71,3 +77,33 @@ class ChatHistoryResponse(BaseModel):
     """Response model for chat history"""
     messages: List[dict]
     total: int
+    next_cursor: Optional[str] = Field(default=None, description="Cursor for the next (older) page, if any")
+
+
+class HistoryDeletionJobResponse(BaseModel):
+    """Response model for a background chat history deletion"""
+    job_id: str
+    status: Literal["pending", "running", "completed", "failed"]
+    deleted: int = 0
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    message: Optional[str] = None
+
+
+class RoadmapModule(BaseModel):
+    """One module of a learning roadmap"""
+    id: int
+    title: str
+    description: str = ""
+    topics: List[str] = Field(default_factory=list)
+    duration: str = ""
+    difficulty: Literal["Beginner", "Intermediate", "Advanced"] = "Beginner"
+    prerequisites: List[int] = Field(default_factory=list)
+
+
+class Roadmap(BaseModel):
+    """A structured learning roadmap as rendered by the frontend"""
+    title: str
+    description: str = ""
+    modules: List[RoadmapModule] = Field(..., min_length=1)
@@ -0,0 +1,68 @@
+"""
+Pre-generate roadmaps for the most requested topics into the roadmap catalog.
+
+Run from the backend directory, e.g. at build time or after changing the
+roadmap_json prompt (a new prompt version misses every old entry):
+    python pregenerate_roadmaps.py --top 50
+    python pregenerate_roadmaps.py --topics-file topics.txt --force
+"""
+import argparse
+import asyncio
+import time
+from services.ai_service import ai_service
+from services.roadmap import POPULAR_ROADMAP_TOPICS, normalize_topic
+
+
+def load_topics(args) -> list:
+    if args.topics_file:
+        with open(args.topics_file, "r", encoding="utf-8") as f:
+            topics = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    else:
+        topics = POPULAR_ROADMAP_TOPICS
+    # Keep order, drop spellings that share a catalog entry
+    unique = list(dict.fromkeys(normalize_topic(t) for t in topics))
+    return unique[:args.top] if args.top else unique
+
+
+async def pregenerate(args):
+    topics = load_topics(args)
+    await ai_service.start()
+    print(f"🗺️  Pre-generating {len(topics)} roadmaps (prompt v{ai_service.prompts.version('roadmap_json')})")
+    print("-" * 50)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    counts = {"cached": 0, "generated": 0, "failed": 0}
+    icons = {"cached": "💾", "generated": "✅", "failed": "❌"}
+
+    async def run(topic):
+        async with semaphore:
+            start = time.perf_counter()
+            status = await ai_service.pregenerate_roadmap(topic, force=args.force)
+            counts[status] += 1
+            print(f"{icons[status]} {topic:<35} {status:<10} {time.perf_counter() - start:6.2f}s")
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run(topic) for topic in topics))
+    finally:
+        await ai_service.close()
+
+    print("-" * 50)
+    print(f"📊 {counts['generated']} generated, {counts['cached']} already cached, "
+          f"{counts['failed']} failed in {time.perf_counter() - start:.1f}s")
+    return counts["failed"] == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=0, help="only the N most popular topics (default: all)")
+    parser.add_argument("--topics-file", help="one topic per line instead of the built-in list")
+    parser.add_argument("--concurrency", type=int, default=4, help="roadmaps generated at once")
+    parser.add_argument("--force", action="store_true", help="regenerate topics that are already stored")
+    args = parser.parse_args()
+    if not asyncio.run(pregenerate(args)):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
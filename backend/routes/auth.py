@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends
-from models import TokenVerifyRequest, UserProfileResponse, ChatHistoryResponse
-from firebase_config import firebase_service
-from firebase_admin import firestore
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from models import TokenVerifyRequest, UserProfileResponse, ChatHistoryResponse, HistoryDeletionJobResponse
+from firebase_config import firebase_service, decode_history_cursor
 from dependencies import get_current_user
+from services.history_jobs import history_deletion_jobs
 from typing import Optional
+import json
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
@@ -14,7 +17,7 @@ async def verify_token(request: TokenVerifyRequest):
     Verify Firebase ID token and return user info
     """
     try:
-        decoded_token = firebase_service.verify_token(request.token)
+        decoded_token = await firebase_service.verify_token_async(request.token)
         
         if not decoded_token:
             raise HTTPException(status_code=401, detail="Invalid token")
@@ -30,10 +33,10 @@ async def verify_token(request: TokenVerifyRequest):
             'email': email,
             'display_name': name,
             'photo_url': picture,
-            'last_login': firestore.SERVER_TIMESTAMP if firebase_service.db else None
+            'last_login': firebase_service.server_timestamp()
         }
         
-        firebase_service.create_or_update_user(uid, user_data)
+        await firebase_service.create_or_update_user(uid, user_data)
         
         return UserProfileResponse(
             uid=uid,
@@ -61,7 +64,7 @@ async def get_profile(current_user: Optional[dict] = Depends(get_current_user)):
     
     try:
         uid = current_user.get('uid')
-        user_data = firebase_service.get_user(uid)
+        user_data = await firebase_service.get_user(uid)
         
         if not user_data:
             raise HTTPException(status_code=404, detail="User not found")
@@ -84,24 +87,28 @@ async def get_profile(current_user: Optional[dict] = Depends(get_current_user)):
 
 @router.get("/chat/history", response_model=ChatHistoryResponse)
 async def get_chat_history(
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     current_user: Optional[dict] = Depends(get_current_user)
 ):
     """
-    Get user's chat history
+    Get one page of the user's chat history; pass next_cursor back to page further
     """
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
         uid = current_user.get('uid')
-        messages = firebase_service.get_chat_history(uid, limit)
+        messages, next_cursor = await firebase_service.get_chat_history_page(uid, limit, cursor)
         
         return ChatHistoryResponse(
             messages=messages,
-            total=len(messages)
+            total=len(messages),
+            next_cursor=next_cursor
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -109,27 +116,72 @@ async def get_chat_history(
         )
 
 
-@router.delete("/chat/history")
+@router.get("/chat/history/stream")
+async def stream_chat_history(
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    """
+    Stream the user's chat history as NDJSON, newest message first
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if cursor:
+        try:
+            decode_history_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    async def generate():
+        async for msg in firebase_service.stream_chat_history(current_user.get('uid'), limit, cursor):
+            yield json.dumps(jsonable_encoder(msg)) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.delete("/chat/history", status_code=202, response_model=HistoryDeletionJobResponse)
 async def delete_chat_history(current_user: Optional[dict] = Depends(get_current_user)):
     """
-    Delete all chat history for the user
+    Start deleting all chat history for the user in the background
     """
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    if not firebase_service.db:
+        raise HTTPException(status_code=500, detail="Failed to delete chat history")
+    
     try:
         uid = current_user.get('uid')
-        success = firebase_service.delete_chat_history(uid)
-        
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to delete chat history")
+        job = await history_deletion_jobs.start(uid)
         
-        return {"message": "Chat history deleted successfully"}
+        return HistoryDeletionJobResponse(
+            **job.to_dict(),
+            message="Chat history deletion started"
+        )
         
-    except HTTPException:
-        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error deleting chat history: {str(e)}"
         )
+
+
+@router.get("/chat/history/delete/{job_id}", response_model=HistoryDeletionJobResponse)
+async def get_delete_chat_history_status(
+    job_id: str,
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    """
+    Get the status of a chat history deletion job
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    job = await history_deletion_jobs.get(job_id, current_user.get('uid'))
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    
+    return HistoryDeletionJobResponse(**job.to_dict())
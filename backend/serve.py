@@ -0,0 +1,368 @@
+"""
+Production launcher: runs the API in several uvicorn worker processes.
+
+The master binds the listening socket, imports the app once (preload) and
+forks the workers, which share the socket and the preloaded modules'
+memory. Worker count defaults to WEB_WORKERS, or one per available core.
+
+Signals to the master:
+    SIGHUP           graceful reload: start a new set of workers, then stop the
+                     old ones once the new ones are serving
+    SIGTERM, SIGINT  graceful stop: workers finish in-flight requests and run
+                     their shutdown hooks (history flush) within WEB_GRACEFUL_TIMEOUT
+    SIGTTIN, SIGTTOU add or remove one worker
+
+Workers that exit unexpectedly are replaced. With --no-preload every worker
+imports the app itself, so a reload also picks up new code.
+
+Per-process limits are divided between workers so the whole deployment
+keeps the configured Gemini concurrency; set SHARED_STORE_URL so the
+response, token and roadmap caches and deletion job status are shared
+instead of per worker. Workers write their metrics to METRICS_MULTIPROC_DIR
+(a temporary directory by default), so /metrics on any of them reports
+the whole deployment.
+
+Run from the backend directory:
+    python serve.py
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import glob
+import logging
+import os
+import select
+import shutil
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Optional
+from config import settings
+import logging_config
+from services.metrics import retire_process_file
+
+logger = logging.getLogger("serve")
+
+MASTER_SIGNALS = (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD, signal.SIGTTIN, signal.SIGTTOU)
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects CPU affinity, e.g. in containers)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def load_app():
+    import main
+    return main.app
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def prepare_metrics_dir() -> Optional[str]:
+    """
+    Point the workers at a directory for their metrics samples.
+
+    Returns the directory if it was created here (and should be removed on
+    exit). Leftovers from an earlier run are cleared, like any restart.
+    """
+    if not settings.metrics_enabled:
+        return None
+    created = None
+    if not settings.metrics_multiproc_dir:
+        created = settings.metrics_multiproc_dir = tempfile.mkdtemp(prefix="app-metrics-")
+    os.makedirs(settings.metrics_multiproc_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(settings.metrics_multiproc_dir, "*.prom*")):
+        os.remove(path)
+    return created
+
+
+def split_limits(workers: int):
+    """Divide the per-process Gemini admission limits between the workers"""
+    settings.gemini_max_concurrency = max(1, settings.gemini_max_concurrency // workers)
+    settings.gemini_max_queue = max(1, settings.gemini_max_queue // workers)
+
+
+class _Worker:
+    __slots__ = ("pid", "generation", "ready", "stopping_since")
+
+    def __init__(self, pid: int, generation: int):
+        self.pid = pid
+        self.generation = generation
+        self.ready = False
+        self.stopping_since: Optional[float] = None
+
+
+class Master:
+    """Pre-forking process manager for uvicorn workers"""
+
+    def __init__(
+        self,
+        app_loader: Callable,
+        sock: socket.socket,
+        workers: int,
+        preload: bool = True,
+        graceful_timeout: float = 30.0,
+        **uvicorn_options
+    ):
+        self.app_loader = app_loader
+        self.sock = sock
+        self.num_workers = max(1, workers)
+        self.preload = preload
+        self.graceful_timeout = graceful_timeout
+        self.uvicorn_options = uvicorn_options
+        self.app = None
+        self.generation = 0
+        self.workers: Dict[int, _Worker] = {}
+        self.boot_failures = 0
+        self._signals = []
+        self._wake_r = self._wake_w = None
+        self._ready_r = self._ready_w = None
+
+    # Master
+
+    def run(self) -> int:
+        """Serve until stopped; returns the exit status"""
+        if self.preload:
+            self.app = self.app_loader()
+        self._ready_r, self._ready_w = os.pipe()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_w, False)
+        signal.set_wakeup_fd(self._wake_w)
+        for sig in MASTER_SIGNALS:
+            signal.signal(sig, self._on_signal)
+
+        logger.info("Master started", extra={
+            "pid": os.getpid(), "workers": self.num_workers, "preload": self.preload,
+            "address": "%s:%s" % self.sock.getsockname()[:2]
+        })
+        try:
+            while True:
+                self._maintain()
+                readable, _, _ = select.select([self._wake_r, self._ready_r], [], [], 1.0)
+                if self._wake_r in readable:
+                    os.read(self._wake_r, 4096)
+                if self._ready_r in readable:
+                    self._read_ready()
+                self._reap()
+                while self._signals:
+                    sig = self._signals.pop(0)
+                    if sig in (signal.SIGTERM, signal.SIGINT):
+                        self.stop()
+                        return 0
+                    if sig == signal.SIGHUP:
+                        self.reload()
+                    elif sig == signal.SIGTTIN:
+                        self.num_workers += 1
+                    elif sig == signal.SIGTTOU and self.num_workers > 1:
+                        self.num_workers -= 1
+                if self.boot_failures >= max(3, 2 * self.num_workers):
+                    logger.error("Workers keep failing to start, giving up")
+                    self.stop()
+                    return 1
+        finally:
+            signal.set_wakeup_fd(-1)
+
+    def _on_signal(self, sig, frame):
+        self._signals.append(sig)
+
+    def reload(self):
+        """Start a new generation of workers; the old one stops once it is serving"""
+        self.generation += 1
+        logger.info("Reloading workers", extra={"generation": self.generation})
+
+    def _maintain(self):
+        now = time.monotonic()
+        current = [w for w in self.workers.values() if w.generation == self.generation and w.stopping_since is None]
+        for _ in range(self.num_workers - len(current)):
+            self._spawn()
+        for worker in current[self.num_workers:]:
+            self._stop_worker(worker, now)
+
+        # Retire older generations only when the new one can take the traffic
+        current = [w for w in self.workers.values() if w.generation == self.generation and w.stopping_since is None]
+        if len(current) >= self.num_workers and all(w.ready for w in current):
+            for worker in self.workers.values():
+                if worker.generation != self.generation:
+                    self._stop_worker(worker, now)
+
+        for worker in self.workers.values():
+            if worker.stopping_since is not None and now - worker.stopping_since > self.graceful_timeout:
+                self._signal(worker.pid, signal.SIGKILL)
+
+    def _stop_worker(self, worker: _Worker, now: float):
+        if worker.stopping_since is None:
+            worker.stopping_since = now
+            self._signal(worker.pid, signal.SIGTERM)
+
+    @staticmethod
+    def _signal(pid: int, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _read_ready(self):
+        data = os.read(self._ready_r, 4096)
+        for (pid,) in struct.iter_unpack("i", data[:len(data) // 4 * 4]):
+            worker = self.workers.get(pid)
+            if worker is not None:
+                worker.ready = True
+                self.boot_failures = 0
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if settings.metrics_multiproc_dir:
+                retire_process_file(settings.metrics_multiproc_dir, pid)
+            if worker is None or worker.stopping_since is not None:
+                continue
+            if not worker.ready:
+                self.boot_failures += 1
+            logger.warning("Worker exited unexpectedly, replacing it", extra={
+                "pid": pid, "exit_status": os.waitstatus_to_exitcode(status)
+            })
+
+    def stop(self):
+        """Stop every worker gracefully, killing those that outlive the timeout"""
+        logger.info("Stopping workers", extra={"workers": len(self.workers)})
+        now = time.monotonic()
+        for worker in self.workers.values():
+            self._stop_worker(worker, now)
+        deadline = now + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            self._signal(pid, signal.SIGKILL)
+        while self.workers:
+            pid, _ = os.waitpid(-1, 0)
+            self.workers.pop(pid, None)
+            if settings.metrics_multiproc_dir:
+                retire_process_file(settings.metrics_multiproc_dir, pid)
+        self.sock.close()
+
+    # Worker
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = _Worker(pid, self.generation)
+            return
+        status = 0
+        try:
+            self._run_worker()
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            logger.exception("Worker crashed")
+            status = 1
+        finally:
+            # os._exit skips atexit, so flush the log queue here
+            logging_config.stop_logging()
+            os._exit(status)
+
+    def _run_worker(self):
+        import uvicorn
+
+        signal.set_wakeup_fd(-1)
+        for sig in MASTER_SIGNALS:
+            signal.signal(sig, signal.SIG_DFL)
+        # uvicorn re-raises the stop signal after a graceful shutdown; ignoring
+        # it lets the worker exit normally and flush its logs
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        os.close(self._ready_r)
+
+        app = self.app if self.app is not None else self.app_loader()
+        ready_w = self._ready_w
+
+        class WorkerServer(uvicorn.Server):
+            def handle_exit(self, sig, frame):
+                # Ctrl-C reaches the whole process group; the master turns it
+                # into one SIGTERM per worker, so a second signal does not force exit
+                if sig != signal.SIGINT:
+                    super().handle_exit(sig, frame)
+
+            async def startup(self, sockets=None):
+                await super().startup(sockets=sockets)
+                if not self.should_exit:
+                    os.write(ready_w, struct.pack("i", os.getpid()))
+
+        # log_config=None: uvicorn's loggers propagate to the app's JSON queue logging
+        config = uvicorn.Config(
+            app, log_config=None, timeout_graceful_shutdown=self.graceful_timeout, **self.uvicorn_options
+        )
+        WorkerServer(config).run(sockets=[self.sock])
+
+
+def serve(
+    app_loader: Callable = load_app,
+    host: str = settings.host,
+    port: int = settings.port,
+    workers: int = 0,
+    preload: bool = True,
+    graceful_timeout: float = settings.web_graceful_timeout,
+    split: bool = True,
+    **uvicorn_options
+) -> int:
+    """Run ``app_loader()``'s app in ``workers`` processes (0 = one per core)"""
+    workers = workers or settings.web_workers or available_cores()
+    if split and workers > 1:
+        split_limits(workers)
+    metrics_dir = prepare_metrics_dir() if workers > 1 else None
+    sock = bind_socket(host, port)
+    master = Master(app_loader, sock, workers, preload, graceful_timeout, **uvicorn_options)
+    try:
+        return master.run()
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: WEB_WORKERS, else one per core)")
+    parser.add_argument("--no-preload", action="store_true", help="import the app in each worker instead of once in the master")
+    parser.add_argument("--graceful-timeout", type=float, default=settings.web_graceful_timeout)
+    parser.add_argument("--no-split-limits", action="store_true", help="give every worker the full Gemini concurrency limits")
+    parser.add_argument("--access-log", action="store_true", help="log every request")
+    parser.add_argument("--log-level", default="info", help="uvicorn log level")
+    args = parser.parse_args()
+    sys.exit(serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        preload=not args.no_preload,
+        graceful_timeout=args.graceful_timeout,
+        split=not args.no_split_limits,
+        access_log=args.access_log,
+        log_level=args.log_level,
+        proxy_headers=True
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import asyncio
+
+
+class OverloadedError(Exception):
+    """Raised when a request cannot be admitted; maps to 429/503 with Retry-After"""
+
+    def __init__(self, message: str, status_code: int = 503, retry_after: int = 5):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _KeySlot:
+    """Per-key semaphore plus a count of requests holding or waiting on it"""
+
+    __slots__ = ("semaphore", "users")
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+class AdmissionController:
+    """
+    Admission control for upstream model calls.
+
+    A request needs a slot from its API key's semaphore (user-supplied keys
+    only) and one from the global semaphore. At most ``max_queue`` requests
+    may wait for a slot, each for at most ``queue_timeout`` seconds; beyond
+    that requests are rejected straight away instead of piling up. Per-key
+    exhaustion is reported as 429, global exhaustion as 503.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 48,
+        per_key_concurrency: int = 8,
+        max_queue: int = 200,
+        queue_timeout: float = 10.0,
+        retry_after: int = 5
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_key_concurrency = per_key_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._global: Optional[asyncio.Semaphore] = None
+        self._keys: Dict[str, _KeySlot] = {}
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def _global_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the serving event loop
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+        return self._global
+
+    def _reject(self, message: str, status_code: int):
+        self.rejected += 1
+        raise OverloadedError(message, status_code=status_code, retry_after=self.retry_after)
+
+    def check_capacity(self):
+        """Reject immediately if the wait queue is already full"""
+        if self.waiting >= self.max_queue and self._global_semaphore().locked():
+            self._reject("Server is at capacity, please retry shortly", 503)
+
+    @asynccontextmanager
+    async def admit(self, key: Optional[str] = None):
+        """Hold a per-key (if ``key`` is given) and a global slot for the block"""
+        self.check_capacity()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        slot = None
+        if key is not None:
+            slot = self._keys.get(key)
+            if slot is None:
+                slot = self._keys[key] = _KeySlot(self.per_key_concurrency)
+            slot.users += 1
+
+        acquired_key = acquired_global = False
+        self.waiting += 1
+        try:
+            if slot is not None:
+                try:
+                    await asyncio.wait_for(slot.semaphore.acquire(), timeout=self.queue_timeout)
+                    acquired_key = True
+                except asyncio.TimeoutError:
+                    self._reject("Too many concurrent requests for this API key", 429)
+            try:
+                await asyncio.wait_for(
+                    self._global_semaphore().acquire(),
+                    timeout=max(0.0, deadline - loop.time())
+                )
+                acquired_global = True
+            except asyncio.TimeoutError:
+                self._reject("Server is at capacity, please retry shortly", 503)
+        finally:
+            self.waiting -= 1
+            if not acquired_global:
+                self._release_key(key, slot, acquired_key)
+
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._global_semaphore().release()
+            self._release_key(key, slot, True)
+
+    def _release_key(self, key: Optional[str], slot: Optional[_KeySlot], acquired: bool):
+        if slot is None:
+            return
+        if acquired:
+            slot.semaphore.release()
+        slot.users -= 1
+        if slot.users == 0 and self._keys.get(key) is slot:
+            del self._keys[key]
+
+    def stats(self) -> dict:
+        """Return active/waiting counts and admission counters"""
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "tracked_keys": len(self._keys),
+        }
@@ -1,11 +1,27 @@
-import google.generativeai as genai
 from typing import List, Dict, Optional
-import re
-import json
 import asyncio
-import functools
+import logging
 from config import settings
-from models import Message
+from models import CodeGenerationRequest, Message, Roadmap
+from services.model_pool import hash_api_key
+from services.response_cache import create_response_cache, exact_text, history_digest
+from services.single_flight import SingleFlight
+from services.admission import AdmissionController, OverloadedError
+from services.context_builder import ContextBuilder, estimate_tokens
+from services.prompt_templates import PromptRegistry
+from services.gemini_transport import create_transport, user_turn
+from services.streaming import StreamEvent, StreamMetrics
+from services.code_blocks import BlockStart, FenceParser, extract_code_blocks
+from services.roadmap import (
+    ROADMAP_SCHEMA, ModuleStreamParser, extract_topic, fallback_roadmap,
+    format_roadmap_message, normalize_topic, parse_roadmap, roadmap_request
+)
+from services.roadmap_store import create_roadmap_store
+from services.intent_router import IntentMatch, create_intent_router
+from services.metrics import record_usage, span
+from firebase_config import firebase_service
+
+logger = logging.getLogger(__name__)
 
 
 class AIService:
@@ -14,118 +30,119 @@ class AIService:
     def __init__(self):
         self.default_api_key = settings.gemini_api_key
         self.model_name = settings.gemini_model
-        genai.configure(api_key=self.default_api_key)
-        self.model = genai.GenerativeModel(self.model_name)
-
-    def _get_model(self, override_key: Optional[str] = None):
-        """Return a Gemini model using override key when provided"""
-        if override_key:
-            genai.configure(api_key=override_key)
-        return genai.GenerativeModel(self.model_name)
+        self.prompts = PromptRegistry(overrides_path=settings.prompt_overrides_path)
+        self.prompts.precompile()
+        # Native async REST transport by default; GEMINI_TRANSPORT=sdk uses the
+        # SDK on a dedicated thread pool with pooled per-key models instead.
+        self.transport = create_transport(settings, self.default_api_key)
+        self.response_cache = create_response_cache(settings)
+        self.intent_router = create_intent_router(settings)
+        # Pre-generated and previously generated roadmaps, served without the LLM;
+        # built by start(), once Firebase is up, to pick the right backend
+        self._roadmap_store = None
+        self.single_flight = SingleFlight(
+            enabled=settings.single_flight_enabled,
+            max_ahead=settings.stream_queue_size
+        )
+        self.stream_metrics = StreamMetrics()
+        # Admission control keeps upstream calls within the transport's capacity
+        self.admission = AdmissionController(
+            max_concurrency=settings.gemini_max_concurrency,
+            per_key_concurrency=settings.gemini_per_key_concurrency,
+            max_queue=settings.gemini_max_queue,
+            queue_timeout=settings.gemini_queue_timeout,
+            retry_after=settings.gemini_retry_after
+        )
+        self.context_builder = ContextBuilder(
+            max_tokens=settings.context_max_tokens,
+            max_messages=settings.context_max_messages,
+            recent_full=settings.context_recent_full,
+            summary_enabled=settings.context_summary_enabled
+        )
+
+    def _flight_key(self, kind: str, message: str, mode: str, api_key: Optional[str], **fields) -> tuple:
+        """Key under which identical in-flight generations are coalesced"""
+        return (
+            kind,
+            exact_text(message),
+            mode,
+            hash_api_key(api_key or self.default_api_key),
+            tuple(sorted(fields.items()))
+        )
+
+    def _admission_key(self, api_key: Optional[str]) -> Optional[str]:
+        """Per-key admission applies to user-supplied keys only"""
+        if not api_key or api_key == self.default_api_key:
+            return None
+        return hash_api_key(api_key)
+
+    async def _admitted(self, api_key: Optional[str], fn):
+        """Await ``fn()`` once admitted for the given API key"""
+        async with self.admission.admit(self._admission_key(api_key)):
+            return await fn()
+
+    async def _admitted_stream(self, api_key: Optional[str], fn):
+        """Iterate ``fn()`` while holding an admission slot for the whole stream"""
+        async with self.admission.admit(self._admission_key(api_key)):
+            async for chunk in fn():
+                yield chunk
+
+    def check_capacity(self):
+        """Raise OverloadedError now if new generations would be rejected"""
+        self.admission.check_capacity()
+
+    @property
+    def roadmap_store(self):
+        if self._roadmap_store is None:
+            self._roadmap_store = create_roadmap_store(settings, firebase_service)
+        return self._roadmap_store
+
+    async def start(self):
+        """Initialize Firebase and the roadmap store; called at application startup"""
+        await firebase_service.start()
+        self._roadmap_store = create_roadmap_store(settings, firebase_service)
+        backend = self.response_cache.backend
+        if settings.shared_store_url and hasattr(backend, "ping"):
+            if not await asyncio.get_running_loop().run_in_executor(None, backend.ping):
+                logger.error("Shared store is not answering; shared caches miss until it is back")
+
+    async def close(self):
+        """Release upstream connections and workers"""
+        await self.transport.aclose()
+
+    async def _generate(self, operation: str, system_instruction: str, contents: List[Dict], config: Dict, api_key: Optional[str]):
+        """One upstream generation, timed and with its token usage counted"""
+        with span(f"{operation}.upstream"):
+            response = await self.transport.generate(system_instruction, contents, config, api_key)
+        record_usage(operation, response.usage)
+        return response
+
+    def _generation_config(self, max_output_tokens: Optional[int] = None, temperature: Optional[float] = None) -> Dict:
+        return {
+            "max_output_tokens": max_output_tokens or settings.max_tokens,
+            "temperature": settings.temperature if temperature is None else temperature
+        }
         
-    def _detect_roadmap_request(self, message: str) -> bool:
-        """Detect if user is asking for a roadmap"""
-        roadmap_keywords = [
-            'roadmap', 'learning path', 'course outline', 'study plan',
-            'curriculum', 'learning roadmap', 'learning plan', 'study roadmap'
-        ]
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in roadmap_keywords)
+    @staticmethod
+    def _is_roadmap(routed: IntentMatch) -> bool:
+        """Whether a routing decision sends the message to the roadmap generator"""
+        return routed.intent == "roadmap" and routed.source == "rule"
+
+    def _cache_fields(self, template: str, **fields) -> Dict:
+        """Response cache fields, including what makes a cached answer stale"""
+        return dict(fields, model=self.model_name, prompt=f"{template}@{self.prompts.version(template)}")
+
+    def _chat_template(self, routed: IntentMatch) -> str:
+        """Template whose prompt generates the reply to a routed chat message"""
+        return "roadmap_json" if self._is_roadmap(routed) else self.prompts.mode_template(routed.intent)
 
     def _create_system_prompt(self, mode: str, language: str) -> str:
-        """Create system prompt based on mode and language"""
-        
-        if mode == "code":
-            return f"""You are an expert AI code generator and programming assistant.
-Focus on producing high-quality, production-ready {language} solutions with minimal fluff.
-
-Use concise Markdown with these sections (omit a section if not relevant):
-## Summary
-- One to two bullet points describing what you will deliver
-
-## Plan
-- Short, ordered steps you will follow before coding
-
-## Code
-```{language}
-# code
-```
-
-## Explanation
-- Bullet points explaining key choices, inputs/outputs, and important behaviors
-
-## Edge Cases
-- Bulleted risks or edge cases the user should know
-
-Rules:
-- Keep code idiomatic for {language}; add docstrings/comments only when they clarify intent.
-- Prefer complete solutions over fragments; include error handling and input validation when sensible.
-- Use tables when comparing options or configurations.
-- Keep wording tight and avoid greetings or filler.
-"""
-        elif mode == "explain":
-            return f"""You are an expert programming tutor specializing in {language}.
-Provide clear, layered explanations with Markdown structure.
-
-Required layout (skip irrelevant sections gracefully):
-## Summary
-- Plain-language answer in one or two bullets
-
-## Breakdown
-- Short bullets for the main concepts, definitions, and relationships
-
-## Example
-```{language}
-# small example
-```
-
-## Best Practices
-- Bullets with dos and don'ts tailored to the topic
-
-## Quick Checks
-- Bullets listing common pitfalls or sanity checks
-
-Formatting rules:
-- Use headings and bullets liberally; prefer lists over long paragraphs.
-- Use inline code for identifiers; fenced code blocks for longer snippets.
-- Use tables for comparisons when helpful.
-- Highlight key terms with bold only when it improves clarity.
-"""
-        elif mode == "roadmap":
-            return f"""You are an expert learning path designer and programming mentor.
-Create comprehensive, structured learning roadmaps for programming topics.
-Focus on {language} when relevant. Provide clear progression paths with specific topics."""
-        else:  # chat mode
-            return f"""You are a helpful AI programming assistant with expertise in {language}.
-Respond with actionable guidance and compact Markdown.
-
-Default layout (drop sections that do not apply):
-## Answer
-- Direct response in one or two bullets
-
-## Details
-- Supporting bullets or short paragraphs with reasoning
-
-## Example
-```{language}
-# example
-```
-
-## Next Steps
-- Bulleted follow-ups, related tips, or checks
-
-Guidelines:
-- Start with the direct answer before elaborating.
-- Use headings and bullets liberally; tables for comparisons.
-- Use inline code for identifiers and fenced code blocks for snippets.
-- Keep tone concise and professional.
-"""
+        """Return the precompiled system prompt for a mode and language"""
+        return self.prompts.system_prompt(mode, language)
     
     def _extract_code_blocks(self, text: str) -> List[Dict[str, str]]:
         """Extract code blocks from markdown formatted text"""
-        pattern = r'```(\w+)?\n(.*?)```'
-        matches = re.findall(pattern, text, re.DOTALL)
-        return [{"language": lang or "text", "code": code.strip()} for lang, code in matches]
+        return extract_code_blocks(text)
     
     async def generate_chat_response(
         self,
@@ -133,51 +150,72 @@ Guidelines:
         conversation_history: List[Message],
         language: str = "python",
         mode: str = "code",
+        api_key: Optional[str] = None,
+        routed: Optional[IntentMatch] = None
+    ) -> Dict:
+        """
+        Generate AI response for chat, serving repeated requests from cache.
+
+        ``routed`` is the intent router's decision when the caller already made it.
+        """
+        routed = routed or self.intent_router.resolve(message, mode)
+        cache_fields = self._cache_fields(
+            self._chat_template(routed),
+            language=language,
+            history=history_digest(conversation_history)
+        )
+        cached = await self.response_cache.get("chat", message, mode, **cache_fields)
+        if cached is not None:
+            return cached
+        if self._is_roadmap(routed):
+            stored = await self._stored_roadmap(self._roadmap_topic(message))
+            if stored is not None:
+                return self._roadmap_result(stored)
+        
+        result = await self.single_flight.do(
+            self._flight_key("chat", message, mode, api_key, **cache_fields),
+            lambda: self._admitted(
+                api_key,
+                lambda: self._generate_chat_response(message, conversation_history, language, routed, api_key)
+            )
+        )
+        if not result.get("is_fallback"):
+            await self.response_cache.set("chat", message, mode, result, **cache_fields)
+        return result
+    
+    async def _generate_chat_response(
+        self,
+        message: str,
+        conversation_history: List[Message],
+        language: str,
+        routed: IntentMatch,
         api_key: Optional[str] = None
     ) -> Dict:
         """Generate AI response for chat"""
         
         try:
-            model = self._get_model(api_key)
-            
-            # Detect if this is a roadmap request
-            is_roadmap_request = self._detect_roadmap_request(message)
-            
-            if is_roadmap_request:
+            if self._is_roadmap(routed):
                 # Special handling for roadmap requests
-                return await self._generate_roadmap_response(message, language, api_key)
-            
-            # Create system prompt
-            system_prompt = self._create_system_prompt(mode, language)
+                return await self._generate_roadmap_response(message, api_key)
             
-            # Build conversation history for Gemini
-            history = []
-            for msg in conversation_history[-10:]:  # Keep last 10 messages for context
-                role = "user" if msg.role == "user" else "model"
-                history.append({
-                    "role": role,
-                    "parts": [msg.content]
-                })
+            # Fit conversation history into the context token budget
+            with span("chat.context"):
+                history = self.context_builder.build(conversation_history)
             
-            # Create chat with history
-            chat = model.start_chat(history=history)
-
-            # Combine system prompt with user message
-            full_message = f"{system_prompt}\n\nUser request: {message}"
-
-            # Generate response in a thread to avoid blocking the event loop
-            gen_cfg = genai.types.GenerationConfig(
-                max_output_tokens=settings.max_tokens,
-                temperature=settings.temperature
+            # The system prompt travels as the model's system_instruction
+            response = await self._generate(
+                "chat",
+                self._create_system_prompt(routed.intent, language),
+                history + [user_turn(message)],
+                self._generation_config(),
+                api_key
             )
 
-            send_fn = functools.partial(chat.send_message, full_message, generation_config=gen_cfg)
-            response = await asyncio.to_thread(send_fn)
-
-            assistant_message = getattr(response, 'text', str(response))
+            assistant_message = response.text
             
             # Check if response contains code
-            code_blocks = self._extract_code_blocks(assistant_message)
+            with span("chat.code_extract"):
+                code_blocks = self._extract_code_blocks(assistant_message)
             has_code = len(code_blocks) > 0
             
             return {
@@ -190,186 +228,130 @@ Guidelines:
         except Exception as e:
             raise Exception(f"Error generating AI response: {str(e)}")
     
-    async def _generate_roadmap_response(self, message: str, language: str = "python", api_key: Optional[str] = None) -> Dict:
+    def _roadmap_config(self) -> Dict:
+        """Constrained JSON output following the roadmap schema"""
+        config = self._generation_config(max_output_tokens=2048, temperature=0.7)
+        config["response_mime_type"] = "application/json"
+        config["response_schema"] = ROADMAP_SCHEMA
+        return config
+
+    @staticmethod
+    def _roadmap_result(roadmap: Roadmap, is_fallback: bool = False) -> Dict:
+        result = {
+            "message": format_roadmap_message(roadmap),
+            "has_code": False,
+            "language": "json",
+            "code_blocks": []
+        }
+        if is_fallback:
+            result["is_fallback"] = True
+        return result
+
+    @staticmethod
+    def _roadmap_topic(message: str) -> str:
+        return normalize_topic(extract_topic(message))
+
+    # The roadmap prompt does not depend on the chat language, so neither does the catalog
+    async def _stored_roadmap(self, topic: str) -> Optional[Roadmap]:
+        return await self.roadmap_store.get(topic, self.prompts.version("roadmap_json"))
+
+    async def _store_roadmap(self, topic: str, roadmap: Roadmap):
+        await self.roadmap_store.put(topic, self.prompts.version("roadmap_json"), roadmap)
+
+    async def _generate_roadmap(self, topic: str, api_key: Optional[str] = None) -> Roadmap:
+        # One constrained generation; near-misses are repaired locally, not regenerated
+        response = await self._generate(
+            "roadmap",
+            self.prompts.render("roadmap_json"),
+            [user_turn(roadmap_request(topic))],
+            self._roadmap_config(),
+            api_key
+        )
+        with span("roadmap.parse"):
+            return parse_roadmap(response.text)
+
+    async def _generate_roadmap_response(self, message: str, api_key: Optional[str] = None) -> Dict:
         """Generate a structured roadmap in JSON format"""
         
+        topic = self._roadmap_topic(message)
         try:
-            model = self._get_model(api_key)
-            
-            # Extract the topic from the message
-            topic = message.lower()
-            for keyword in ['roadmap for', 'learning path for', 'study plan for', 'roadmap to learn', 'roadmap', 'learning path']:
-                if keyword in topic:
-                    topic = topic.split(keyword)[-1].strip()
-                    break
-            
-            # Clean up topic
-            topic = topic.replace('?', '').replace('.', '').strip()
-            if not topic:
-                topic = "programming"
-            
-            prompt = f"""Generate a comprehensive learning roadmap for: {topic}
-
-You MUST return ONLY valid JSON with NO extra text, following this EXACT structure:
-
-{{
-  "title": "Complete {topic.title()} Learning Path",
-  "description": "A comprehensive guide to mastering {topic}",
-  "modules": [
-    {{
-      "id": 1,
-      "title": "Getting Started with {topic.title()}",
-      "description": "Introduction and fundamentals",
-      "topics": ["Basic concepts", "Setup and installation", "First steps"],
-      "duration": "2 weeks",
-      "difficulty": "Beginner",
-      "prerequisites": []
-    }},
-    {{
-      "id": 2,
-      "title": "Intermediate Concepts",
-      "description": "Building on the basics",
-      "topics": ["Advanced features", "Best practices", "Common patterns"],
-      "duration": "3 weeks",
-      "difficulty": "Intermediate",
-      "prerequisites": [1]
-    }}
-  ]
-}}
-
-CRITICAL RULES:
-1. Return ONLY the JSON object, nothing else
-2. Create 5-8 modules with logical progression
-3. Each module must have 3-6 specific, practical topics
-4. Difficulty MUST be exactly: "Beginner", "Intermediate", or "Advanced"
-5. Duration should be realistic (1-4 weeks per module)
-6. Prerequisites array contains module IDs (use [] for first modules)
-7. Make titles and descriptions specific to {topic}
-8. Use double quotes for all strings
-9. Do NOT wrap in ```json code blocks
-10. Do NOT add any explanatory text
-
-Return pure JSON only."""
-
-            # Generate roadmap with retry logic
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    full_prompt = "You are a JSON generator. Return only valid JSON, no markdown, no extra text.\n\n" + prompt
-                    gen_cfg = genai.types.GenerationConfig(max_output_tokens=2048, temperature=0.7)
-                    gen_fn = functools.partial(model.generate_content, full_prompt, generation_config=gen_cfg)
-                    response = await asyncio.to_thread(gen_fn)
+            roadmap = await self._generate_roadmap(topic, api_key)
+        except Exception as e:
+            logger.warning("Roadmap generation failed (%s), using fallback roadmap", e, extra={"topic": topic})
+            return self._roadmap_result(fallback_roadmap(topic), is_fallback=True)
+        await self._store_roadmap(topic, roadmap)
+        return self._roadmap_result(roadmap)
+
+    async def pregenerate_roadmap(self, topic: str, force: bool = False) -> str:
+        """
+        Fill the roadmap catalog for one topic.
+
+        Returns "cached" if an entry for the current prompt version already
+        exists, "generated" or "failed".
+        """
+        topic = normalize_topic(topic)
+        if not force and await self._stored_roadmap(topic) is not None:
+            return "cached"
+        try:
+            roadmap = await self._admitted(None, lambda: self._generate_roadmap(topic))
+        except Exception as e:
+            logger.warning("Roadmap pre-generation failed: %s", e, extra={"topic": topic})
+            return "failed"
+        await self._store_roadmap(topic, roadmap)
+        return "generated"
+
+    async def _stream_roadmap(self, message: str, api_key: Optional[str], outcome: Dict):
+        """
+        Stream a roadmap, yielding a ``roadmap_module`` event as each module
+        completes; the final result is stored in ``outcome["result"]``.
+        """
+        topic = self._roadmap_topic(message)
+        stored = await self._stored_roadmap(topic)
+        if stored is not None:
+            for module in stored.modules:
+                yield StreamEvent("roadmap_module", module.model_dump())
+            outcome["result"] = self._roadmap_result(stored)
+            return
+
+        parser = ModuleStreamParser()
+        parts = []
+        complete = False
+        usage: Dict[str, int] = {}
+        try:
+            async for chunk in self.single_flight.stream(
+                self._flight_key("roadmap", topic, "roadmap", api_key),
+                lambda: self._admitted_stream(
+                    api_key,
+                    lambda: self.transport.stream(
+                        self.prompts.render("roadmap_json"),
+                        [user_turn(roadmap_request(topic))],
+                        self._roadmap_config(),
+                        api_key,
+                        usage=usage
+                    )
+                )
+            ):
+                parts.append(chunk)
+                for module in parser.feed(chunk):
+                    yield StreamEvent("roadmap_module", module.model_dump())
+            complete = True
+        except OverloadedError:
+            raise
+        except Exception as e:
+            logger.warning("Roadmap stream failed (%s), salvaging what arrived", e, extra={"topic": topic})
+        # Only the leader's upstream call fills in usage; followers add nothing
+        record_usage("roadmap_stream", usage)
 
-                    assistant_message = getattr(response, 'text', str(response)).strip()
-                    
-                    # Clean up the response
-                    # Remove markdown code blocks if present
-                    if '```json' in assistant_message:
-                        assistant_message = assistant_message.split('```json')[1].split('```')[0].strip()
-                    elif '```' in assistant_message:
-                        assistant_message = assistant_message.split('```')[1].split('```')[0].strip()
-                    
-                    # Try to parse JSON to validate
-                    parsed = json.loads(assistant_message)
-                    
-                    # Validate structure
-                    if 'title' in parsed and 'modules' in parsed and isinstance(parsed['modules'], list):
-                        # Valid roadmap structure
-                        # Re-wrap in JSON markdown for frontend
-                        formatted_json = json.dumps(parsed, indent=2)
-                        final_message = f"```json\n{formatted_json}\n```"
-                        
-                        return {
-                            "message": final_message,
-                            "has_code": False,
-                            "language": "json",
-                            "code_blocks": []
-                        }
-                    else:
-                        raise ValueError("Invalid roadmap structure")
-                        
-                except json.JSONDecodeError:
-                    if attempt == max_retries - 1:
-                        # Last attempt failed, return error message
-                        error_roadmap = {
-                            "title": f"Learning Path for {topic.title()}",
-                            "description": "An error occurred generating the roadmap. Here's a basic structure.",
-                            "modules": [
-                                {
-                                    "id": 1,
-                                    "title": "Introduction",
-                                    "description": f"Getting started with {topic}",
-                                    "topics": ["Fundamentals", "Core concepts", "Basic setup"],
-                                    "duration": "2 weeks",
-                                    "difficulty": "Beginner",
-                                    "prerequisites": []
-                                },
-                                {
-                                    "id": 2,
-                                    "title": "Intermediate Skills",
-                                    "description": f"Building your {topic} knowledge",
-                                    "topics": ["Advanced features", "Best practices", "Real-world applications"],
-                                    "duration": "3 weeks",
-                                    "difficulty": "Intermediate",
-                                    "prerequisites": [1]
-                                },
-                                {
-                                    "id": 3,
-                                    "title": "Advanced Topics",
-                                    "description": f"Mastering {topic}",
-                                    "topics": ["Expert techniques", "Optimization", "Production deployment"],
-                                    "duration": "4 weeks",
-                                    "difficulty": "Advanced",
-                                    "prerequisites": [2]
-                                }
-                            ]
-                        }
-                        formatted_json = json.dumps(error_roadmap, indent=2)
-                        final_message = f"```json\n{formatted_json}\n```"
-                        
-                        return {
-                            "message": final_message,
-                            "has_code": False,
-                            "language": "json",
-                            "code_blocks": []
-                        }
-                    continue
-                    
+        try:
+            roadmap = parse_roadmap("".join(parts))
         except Exception as e:
-            # Return fallback roadmap on any error
-            fallback_roadmap = {
-                "title": f"Learning Path for {topic.title() if 'topic' in locals() else 'Programming'}",
-                "description": "A structured approach to learning",
-                "modules": [
-                    {
-                        "id": 1,
-                        "title": "Fundamentals",
-                        "description": "Core concepts and basics",
-                        "topics": ["Getting started", "Basic concepts", "Essential tools"],
-                        "duration": "2 weeks",
-                        "difficulty": "Beginner",
-                        "prerequisites": []
-                    },
-                    {
-                        "id": 2,
-                        "title": "Intermediate Concepts",
-                        "description": "Building on the fundamentals",
-                        "topics": ["Advanced features", "Best practices", "Common patterns"],
-                        "duration": "3 weeks",
-                        "difficulty": "Intermediate",
-                        "prerequisites": [1]
-                    }
-                ]
-            }
-            formatted_json = json.dumps(fallback_roadmap, indent=2)
-            final_message = f"```json\n{formatted_json}\n```"
-            
-            return {
-                "message": final_message,
-                "has_code": False,
-                "language": "json",
-                "code_blocks": []
-            }
+            logger.warning("Roadmap could not be parsed (%s), using fallback roadmap", e, extra={"topic": topic})
+            outcome["result"] = self._roadmap_result(fallback_roadmap(topic), is_fallback=True)
+            return
+        if complete:
+            # A roadmap salvaged from a broken stream is served but not kept
+            await self._store_roadmap(topic, roadmap)
+        outcome["result"] = self._roadmap_result(roadmap)
     
     async def generate_code(
         self,
@@ -381,30 +363,97 @@ Return pure JSON only."""
     ) -> str:
         """Generate code based on prompt"""
         
+        cache_fields = self._cache_fields(
+            "code_generation",
+            language=language,
+            include_comments=include_comments,
+            include_tests=include_tests
+        )
+        cached = await self.response_cache.get("code", prompt, "code", **cache_fields)
+        if cached is not None:
+            return cached
+        
+        code = await self.single_flight.do(
+            self._flight_key("code", prompt, "code", api_key, **cache_fields),
+            lambda: self._admitted(
+                api_key,
+                lambda: self._generate_code(prompt, language, include_comments, include_tests, api_key)
+            )
+        )
+        await self.response_cache.set("code", prompt, "code", code, **cache_fields)
+        return code
+    
+    async def generate_code_batch(self, items: List[CodeGenerationRequest], concurrency: int):
+        """
+        Generate code for many requests, yielding one result per item as it completes.
+
+        Identical items are generated once; at most ``concurrency`` distinct
+        items are in flight, each still going through admission control. A
+        result is ``{"index", "success", "code", "language"}`` or, for an
+        item that failed, ``{"index", "success": False, "error"}`` plus
+        ``status`` and ``retry_after`` if it was rejected as overloaded.
+        """
+        groups: Dict[tuple, List[int]] = {}
+        for index, item in enumerate(items):
+            key = (
+                item.prompt, item.language, item.include_comments, item.include_tests,
+                hash_api_key(item.api_key or self.default_api_key)
+            )
+            groups.setdefault(key, []).append(index)
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def run(indices: List[int]):
+            item = items[indices[0]]
+            async with semaphore:
+                try:
+                    code = await self.generate_code(
+                        prompt=item.prompt,
+                        language=item.language,
+                        include_comments=item.include_comments,
+                        include_tests=item.include_tests,
+                        api_key=item.api_key
+                    )
+                    return indices, {"success": True, "code": code, "language": item.language}
+                except OverloadedError as e:
+                    return indices, {
+                        "success": False, "error": str(e),
+                        "status": e.status_code, "retry_after": e.retry_after
+                    }
+                except Exception as e:
+                    return indices, {"success": False, "error": str(e)}
+        
+        tasks = [asyncio.ensure_future(run(indices)) for indices in groups.values()]
         try:
-            model = self._get_model(api_key)
-            
-            # Create detailed prompt
-            system_prompt = f"""You are an expert {language} code generator.
-Generate clean, efficient, and production-ready code based on user requirements.
-
-Requirements:
-- Write {language} code only
-- {'Include helpful comments and docstrings' if include_comments else 'Minimize comments, focus on code'}
-- {'Include unit tests' if include_tests else 'No tests needed'}
-- Follow {language} best practices and conventions
-- Handle edge cases and errors appropriately
-- Format code with proper indentation
-- Wrap code in markdown code blocks with language specified
-"""
-            
-            # Generate code (run blocking call in thread)
-            full_prompt = f"{system_prompt}\n\n{prompt}"
-            gen_cfg = genai.types.GenerationConfig(max_output_tokens=settings.max_tokens, temperature=settings.temperature)
-            gen_fn = functools.partial(model.generate_content, full_prompt, generation_config=gen_cfg)
-            response = await asyncio.to_thread(gen_fn)
+            for next_done in asyncio.as_completed(tasks):
+                indices, result = await next_done
+                for index in indices:
+                    yield {"index": index, **result}
+        finally:
+            # The client went away: stop generating what nobody will read
+            for task in tasks:
+                task.cancel()
+    
+    async def _generate_code(
+        self,
+        prompt: str,
+        language: str,
+        include_comments: bool,
+        include_tests: bool,
+        api_key: Optional[str]
+    ) -> str:
+        """Generate code with a single upstream call"""
+        
+        try:
+            response = await self._generate(
+                "code",
+                self.prompts.code_prompt(language, include_comments, include_tests),
+                [user_turn(prompt)],
+                self._generation_config(),
+                api_key
+            )
 
-            return getattr(response, 'text', str(response))
+            return response.text
             
         except Exception as e:
             raise Exception(f"Error generating code: {str(e)}")
@@ -416,58 +465,137 @@ Requirements:
         language: str = "python",
         mode: str = "code",
         api_key: Optional[str] = None
+    ):
+        """Stream AI response for real-time chat, sharing identical in-flight streams"""
+        
+        key = self._flight_key(
+            "stream", message, mode, api_key,
+            language=language, history=history_digest(conversation_history)
+        )
+        async for chunk in self.single_flight.stream(
+            key,
+            lambda: self._admitted_stream(
+                api_key,
+                lambda: self._stream_chat_response(message, conversation_history, language, mode, api_key)
+            )
+        ):
+            yield chunk
+    
+    @staticmethod
+    def _code_event(event) -> StreamEvent:
+        if isinstance(event, BlockStart):
+            return StreamEvent("code_start", {"index": event.index, "language": event.language})
+        return StreamEvent("code_block", {
+            "index": event.index,
+            "language": event.language,
+            "code": event.code,
+            "closed": event.closed
+        })
+
+    @staticmethod
+    def _stream_summary(result: Dict) -> StreamEvent:
+        return StreamEvent("summary", {
+            "has_code": result["has_code"],
+            "language": result["language"],
+            "code_blocks": result.get("code_blocks", [])
+        })
+
+    async def stream_chat(
+        self,
+        message: str,
+        conversation_history: List[Message],
+        language: str = "python",
+        mode: str = "code",
+        api_key: Optional[str] = None
+    ):
+        """
+        Stream a chat reply with the same behaviour as generate_chat_response.
+
+        Yields text chunks, ``code_start``/``code_block`` events as fences open
+        and close, and finally a ``summary`` event with ``has_code`` and
+        ``code_blocks``. Roadmap requests and cached replies arrive as a single
+        chunk, roadmaps preceded by ``roadmap_module`` events as modules
+        complete; completed replies are stored in the response cache.
+        """
+        routed = self.intent_router.resolve(message, mode)
+        cache_fields = self._cache_fields(
+            self._chat_template(routed),
+            language=language,
+            history=history_digest(conversation_history)
+        )
+        result = await self.response_cache.get("chat", message, mode, **cache_fields)
+        if result is None and self._is_roadmap(routed):
+            if settings.roadmap_stream_modules:
+                outcome = {}
+                async for event in self._stream_roadmap(message, api_key, outcome):
+                    yield event
+                result = outcome["result"]
+                if not result.get("is_fallback"):
+                    await self.response_cache.set("chat", message, mode, result, **cache_fields)
+            else:
+                # Roadmaps are generated as whole JSON documents
+                result = await self.generate_chat_response(
+                    message, conversation_history, language, mode, api_key, routed=routed
+                )
+        if result is not None:
+            yield result["message"]
+            yield self._stream_summary(result)
+            return
+
+        parser = FenceParser(emit_deltas=False)
+        parts = []
+        async for chunk in self.stream_chat_response(message, conversation_history, language, routed.intent, api_key):
+            parts.append(chunk)
+            yield chunk
+            for event in parser.feed(chunk):
+                yield self._code_event(event)
+        for event in parser.close():
+            yield self._code_event(event)
+
+        text = "".join(parts)
+        code_blocks = [block.as_dict() for block in parser.blocks]
+        result = {
+            "message": text,
+            "has_code": len(code_blocks) > 0,
+            "language": language if code_blocks else None,
+            "code_blocks": code_blocks
+        }
+        await self.response_cache.set("chat", message, mode, result, **cache_fields)
+        yield self._stream_summary(result)
+    
+    async def _stream_chat_response(
+        self,
+        message: str,
+        conversation_history: List[Message],
+        language: str = "python",
+        mode: str = "code",
+        api_key: Optional[str] = None
     ):
         """Stream AI response for real-time chat (generator)"""
         
+        emitted_tokens = 0
+        usage: Dict[str, int] = {}
         try:
-            model = self._get_model(api_key)
-            system_prompt = self._create_system_prompt(mode, language)
-            
-            # Build conversation history for Gemini
-            history = []
-            for msg in conversation_history[-10:]:
-                role = "user" if msg.role == "user" else "model"
-                history.append({
-                    "role": role,
-                    "parts": [msg.content]
-                })
-            
-            # Create chat with history
-            chat = model.start_chat(history=history)
-            
-            # Combine system prompt with user message
-            full_message = f"{system_prompt}\n\nUser request: {message}"
+            # Fit conversation history into the context token budget
+            with span("chat.context"):
+                history = self.context_builder.build(conversation_history)
             
-            # Stream response using a background thread and an asyncio queue bridge
-            gen_cfg = genai.types.GenerationConfig(max_output_tokens=settings.max_tokens, temperature=settings.temperature)
-
-            loop = asyncio.get_event_loop()
-            q: asyncio.Queue = asyncio.Queue()
-
-            def produce():
-                try:
-                    resp_iter = chat.send_message(full_message, generation_config=gen_cfg, stream=True)
-                    for chunk in resp_iter:
-                        text = getattr(chunk, 'text', None)
-                        if text:
-                            # safely put into asyncio queue from thread
-                            loop.call_soon_threadsafe(q.put_nowait, text)
-                except Exception as e:
-                    loop.call_soon_threadsafe(q.put_nowait, f"__ERROR__:{str(e)}")
-                finally:
-                    loop.call_soon_threadsafe(q.put_nowait, None)
-
-            # start producer in thread
-            asyncio.create_task(asyncio.to_thread(produce))
-
-            while True:
-                item = await q.get()
-                if item is None:
-                    break
-                if isinstance(item, str) and item.startswith("__ERROR__:"):
-                    raise Exception(item.replace("__ERROR__:", ""))
-                yield item
+            with span("stream.upstream"):
+                async for chunk in self.transport.stream(
+                    self._create_system_prompt(mode, language),
+                    history + [user_turn(message)],
+                    self._generation_config(),
+                    api_key,
+                    usage=usage
+                ):
+                    emitted_tokens += estimate_tokens(chunk)
+                    yield chunk
+            record_usage("chat_stream", usage)
                     
+        except (asyncio.CancelledError, GeneratorExit):
+            # Every listener went away; the upstream stream closes as this unwinds
+            self.stream_metrics.record_upstream_cancelled(emitted_tokens, settings.max_tokens)
+            raise
         except Exception as e:
             raise Exception(f"Error streaming response: {str(e)}")
 
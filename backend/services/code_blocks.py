@@ -0,0 +1,209 @@
+from typing import Dict, List
+import re
+
+FENCE = "```"
+_NON_SPACE = re.compile(r"\S")
+
+
+class BlockStart:
+    """A fenced code block opened"""
+
+    __slots__ = ("index", "language")
+
+    def __init__(self, index: int, language: str):
+        self.index = index
+        self.language = language
+
+
+class BlockDelta:
+    """Code appended to the open block"""
+
+    __slots__ = ("index", "text")
+
+    def __init__(self, index: int, text: str):
+        self.index = index
+        self.text = text
+
+
+class BlockEnd:
+    """A code block finished; ``closed`` is False if the text ended inside it"""
+
+    __slots__ = ("index", "language", "code", "closed")
+
+    def __init__(self, index: int, language: str, code: str, closed: bool = True):
+        self.index = index
+        self.language = language
+        self.code = code
+        self.closed = closed
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"language": self.language, "code": self.code}
+
+
+def _language(info: str) -> str:
+    words = info.split()
+    return words[0] if words else "text"
+
+
+def _trailing_backticks(text: str, start: int) -> int:
+    """Backticks (at most two) ending ``text[start:]`` that may begin a split fence"""
+    count = 0
+    end = len(text)
+    while count < 2 and end - 1 - count >= start and text[end - 1 - count] == "`":
+        count += 1
+    return count
+
+
+class FenceParser:
+    """
+    Incremental parser for fenced code blocks in streamed Markdown.
+
+    Feed chunks as they arrive; each call returns the ``BlockStart``,
+    ``BlockDelta`` and ``BlockEnd`` events the chunk completed. Scanning uses
+    ``str.find`` from the last position, so work is linear in the input no
+    matter how it is chunked, and a fence split across chunks is still seen.
+
+    Fences follow the previous ``(\\w+)?\\n(.*?)`` regex: a block opens at
+    three backticks followed by an optional language and a newline, and
+    closes at the next three backticks. In addition:
+
+    - at the start of a line, any info string is accepted and its first
+      word is the language (``c++``, ``objective-c``, ``c#``, ``python title``)
+    - mid-line, the language must directly follow the backticks with no
+      spaces, as with the regex
+    - ``\\r\\n`` line endings are accepted
+    - a block still open when the text ends is reported by ``close()``
+    """
+
+    TEXT, INFO, CODE = range(3)
+
+    def __init__(self, emit_deltas: bool = True, max_info: int = 200):
+        self.emit_deltas = emit_deltas
+        self.max_info = max_info
+        self.blocks: List[BlockEnd] = []
+        self._state = self.TEXT
+        self._tail = ""
+        self._line_start = True
+        self._fence_at_line_start = False
+        self._info: List[str] = []
+        self._info_len = 0
+        self._code: List[str] = []
+        self._language = "text"
+
+    def feed(self, chunk: str) -> List[object]:
+        """Consume a chunk and return the events it completed"""
+        events: List[object] = []
+        buf = self._tail + chunk if self._tail else chunk
+        self._tail = ""
+        pos = 0
+        end = len(buf)
+
+        while pos < end:
+            if self._state == self.TEXT:
+                i = buf.find(FENCE, pos)
+                if i == -1:
+                    keep = _trailing_backticks(buf, pos)
+                    self._note_text(buf, pos, end - keep)
+                    self._tail = buf[end - keep:]
+                    break
+                self._note_text(buf, pos, i)
+                self._fence_at_line_start = self._line_start
+                self._line_start = False
+                self._info = []
+                self._info_len = 0
+                self._state = self.INFO
+                pos = i + 3
+
+            elif self._state == self.INFO:
+                newline = buf.find("\n", pos)
+                stop = end if newline == -1 else newline
+                tick = buf.find("`", pos, stop)
+                if tick != -1:
+                    if tick == pos and not self._info_len:
+                        # Four or more backticks: the fence is the last three
+                        pos += 1
+                        continue
+                    # Backticks inside the info string: inline code, not a fence
+                    self._state = self.TEXT
+                    pos = tick
+                    continue
+                self._info.append(buf[pos:stop])
+                self._info_len += stop - pos
+                if newline == -1:
+                    if self._info_len > self.max_info:
+                        self._state = self.TEXT
+                    break
+                info = "".join(self._info)
+                if self._accepts(info):
+                    self._language = _language(info)
+                    self._code = []
+                    self._state = self.CODE
+                    events.append(BlockStart(len(self.blocks), self._language))
+                else:
+                    self._state = self.TEXT
+                    self._line_start = True
+                pos = newline + 1
+
+            else:
+                k = buf.find(FENCE, pos)
+                if k == -1:
+                    keep = _trailing_backticks(buf, pos)
+                    self._add_code(buf[pos:end - keep], events)
+                    self._tail = buf[end - keep:]
+                    break
+                self._add_code(buf[pos:k], events)
+                events.append(self._finish(closed=True))
+                # Text after a closing fence continues the same line
+                self._state = self.TEXT
+                self._line_start = False
+                pos = k + 3
+
+        return events
+
+    def close(self) -> List[object]:
+        """Flush the end of the text, reporting an unterminated block"""
+        events: List[object] = []
+        if self._state == self.CODE:
+            self._add_code(self._tail, events)
+            events.append(self._finish(closed=False))
+        self._tail = ""
+        self._state = self.TEXT
+        return events
+
+    def _accepts(self, info: str) -> bool:
+        if self._fence_at_line_start:
+            return True
+        # Mid-line fences need the language right after the backticks, like the regex
+        info = info.rstrip("\r")
+        return not info or not any(ch.isspace() for ch in info)
+
+    def _note_text(self, buf: str, start: int, stop: int):
+        if start >= stop:
+            return
+        newline = buf.rfind("\n", start, stop)
+        if newline != -1:
+            start = newline + 1
+            self._line_start = True
+        if self._line_start and _NON_SPACE.search(buf, start, stop):
+            self._line_start = False
+
+    def _add_code(self, text: str, events: List[object]):
+        if not text:
+            return
+        self._code.append(text)
+        if self.emit_deltas:
+            events.append(BlockDelta(len(self.blocks), text))
+
+    def _finish(self, closed: bool) -> BlockEnd:
+        block = BlockEnd(len(self.blocks), self._language, "".join(self._code).strip(), closed)
+        self.blocks.append(block)
+        self._code = []
+        return block
+
+
+def extract_code_blocks(text: str, include_unterminated: bool = True) -> List[Dict[str, str]]:
+    """One-shot extraction of ``{"language", "code"}`` blocks from Markdown"""
+    parser = FenceParser(emit_deltas=False)
+    parser.feed(text)
+    parser.close()
+    return [b.as_dict() for b in parser.blocks if b.closed or include_unterminated]
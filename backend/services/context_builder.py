@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import hashlib
+import re
+import threading
+
+_CODE_BLOCK_RE = re.compile(r"```([^\n`]*)\n(.*?)```", re.DOTALL)
+_WORD_RE = re.compile(r"\S+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate.
+
+    Averages the usual ~4 characters per token with ~0.75 words per token,
+    which tracks Gemini's tokenizer closely enough for budgeting prose and
+    code without a network round trip.
+    """
+    if not text:
+        return 0
+    by_chars = len(text) / 4
+    by_words = len(_WORD_RE.findall(text)) / 0.75
+    return int((by_chars + by_words) / 2) + 1
+
+
+def collapse_code_blocks(text: str) -> str:
+    """Replace the body of each fenced code block with a one-line placeholder"""
+    def _collapse(match):
+        lang = match.group(1).strip()
+        lines = match.group(2).count("\n") + 1
+        return f"```{lang}\n# ... {lines} lines of code omitted ...\n```"
+    return _CODE_BLOCK_RE.sub(_collapse, text)
+
+
+def _role_of(msg) -> str:
+    return "user" if getattr(msg, "role", None) == "user" else "model"
+
+
+class ContextBuilder:
+    """
+    Fits conversation history into a token budget for Gemini.
+
+    The most recent ``recent_full`` messages are sent verbatim. Older ones
+    have their code blocks collapsed, and whatever no longer fits the budget
+    is either dropped or folded into a short rolling summary. Summaries are
+    extractive (built locally, no model call) and cached by the digest of the
+    turns they cover, so a growing conversation reuses them.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 4000,
+        max_messages: int = 20,
+        recent_full: int = 4,
+        summary_enabled: bool = True,
+        summary_max_tokens: int = 300,
+        summary_cache_size: int = 512
+    ):
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.recent_full = recent_full
+        self.summary_enabled = summary_enabled
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_cache_size = summary_cache_size
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _summarize(self, messages: list) -> Optional[str]:
+        """Build (or reuse) an extractive summary of dropped turns"""
+        digest = hashlib.sha256()
+        for msg in messages:
+            digest.update(f"{msg.role}\x1f{msg.content}\x1e".encode("utf-8"))
+        key = digest.hexdigest()
+
+        with self._lock:
+            if key in self._summaries:
+                self._summaries.move_to_end(key)
+                return self._summaries[key]
+
+        lines = []
+        budget = self.summary_max_tokens
+        # Newest dropped turns are the most relevant, so fill the budget from the end
+        for msg in reversed(messages):
+            text = _CODE_BLOCK_RE.sub("[code]", msg.content).strip()
+            first_line = next((line.strip() for line in text.splitlines() if line.strip()), "")
+            if not first_line:
+                continue
+            line = f"- {'User' if msg.role == 'user' else 'Assistant'}: {first_line[:160]}"
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            budget -= cost
+            lines.append(line)
+
+        summary = None
+        if lines:
+            summary = "Summary of earlier conversation:\n" + "\n".join(reversed(lines))
+
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > self.summary_cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def build(self, conversation_history: list) -> List[Dict]:
+        """Return Gemini chat history entries that fit within the token budget"""
+        candidates = list(conversation_history[-self.max_messages:]) if self.max_messages else list(conversation_history)
+        older = list(conversation_history[:len(conversation_history) - len(candidates)])
+
+        budget = self.max_tokens
+        kept: List[Dict] = []
+        for index, msg in enumerate(reversed(candidates)):
+            content = msg.content
+            if index >= self.recent_full:
+                content = collapse_code_blocks(content)
+            cost = estimate_tokens(content)
+            if cost > budget:
+                if index == 0 and budget > 0:
+                    # Never drop the latest turn entirely; keep its tail
+                    content = content[-budget * 4:]
+                    cost = budget
+                else:
+                    older = older + list(candidates[:len(candidates) - index])
+                    break
+            budget -= cost
+            kept.append({"role": _role_of(msg), "parts": [content]})
+
+        kept.reverse()
+
+        if older and self.summary_enabled:
+            summary = self._summarize(older)
+            if summary:
+                kept = [
+                    {"role": "user", "parts": [summary]},
+                    {"role": "model", "parts": ["Noted."]}
+                ] + kept
+        return kept
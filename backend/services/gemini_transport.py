@@ -0,0 +1,329 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import functools
+import json
+import threading
+import httpx
+
+
+class GeminiAPIError(Exception):
+    """Non-success response from the Gemini API"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Gemini API error {status_code}: {message}")
+        self.status_code = status_code
+
+
+class GenerationResult:
+    """Text of a completed generation plus its token usage"""
+
+    __slots__ = ("text", "usage")
+
+    def __init__(self, text: str, usage: Optional[Dict[str, int]] = None):
+        self.text = text
+        self.usage = usage or {}
+
+
+def user_turn(text: str) -> Dict:
+    """A user message in the chat history format used by AIService"""
+    return {"role": "user", "parts": [text]}
+
+
+def _usage_from_metadata(metadata) -> Dict[str, int]:
+    """Normalize usage metadata from a REST payload or SDK response"""
+    if not metadata:
+        return {}
+    get = metadata.get if isinstance(metadata, dict) else functools.partial(getattr, metadata)
+    return {
+        "prompt_tokens": int(get("promptTokenCount", None) or get("prompt_token_count", None) or 0),
+        "output_tokens": int(get("candidatesTokenCount", None) or get("candidates_token_count", None) or 0),
+        "total_tokens": int(get("totalTokenCount", None) or get("total_token_count", None) or 0),
+    }
+
+
+def _text_from_payload(payload: dict) -> str:
+    candidates = payload.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+class HttpxGeminiTransport:
+    """
+    Native async transport speaking the Gemini REST API over one pooled
+    ``httpx.AsyncClient`` (HTTP/2 when ``h2`` is installed).
+
+    Generations and streams are plain coroutines on the event loop, so
+    concurrent requests cost sockets rather than threads. The API key travels
+    per request in a header, so one connection pool serves every key. Point
+    ``base_url`` at ``fake_gemini`` to run offline.
+    """
+
+    def __init__(
+        self,
+        default_api_key: str,
+        model_name: str,
+        base_url: str = "https://generativelanguage.googleapis.com",
+        http2: bool = True,
+        max_connections: int = 200,
+        timeout: float = 120.0,
+        client: Optional[httpx.AsyncClient] = None
+    ):
+        self.default_api_key = default_api_key
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = client
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+                except ImportError:
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    def _url(self, method: str) -> str:
+        return f"{self.base_url}/v1beta/models/{self.model_name}:{method}"
+
+    def _body(self, system_instruction: Optional[str], contents: List[Dict], config: Dict) -> Dict:
+        body = {
+            "contents": [
+                {
+                    "role": turn["role"],
+                    "parts": [p if isinstance(p, dict) else {"text": p} for p in turn["parts"]]
+                }
+                for turn in contents
+            ],
+            "generationConfig": {
+                "maxOutputTokens": config.get("max_output_tokens"),
+                "temperature": config.get("temperature"),
+            },
+        }
+        if config.get("response_mime_type"):
+            body["generationConfig"]["responseMimeType"] = config["response_mime_type"]
+        if config.get("response_schema"):
+            body["generationConfig"]["responseSchema"] = config["response_schema"]
+        if system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        return body
+
+    def _headers(self, api_key: Optional[str]) -> Dict[str, str]:
+        return {"x-goog-api-key": api_key or self.default_api_key}
+
+    @staticmethod
+    def _error_message(raw: bytes) -> str:
+        try:
+            return json.loads(raw)["error"]["message"]
+        except Exception:
+            return raw.decode("utf-8", "replace")[:500]
+
+    async def generate(
+        self,
+        system_instruction: Optional[str],
+        contents: List[Dict],
+        config: Dict,
+        api_key: Optional[str] = None
+    ) -> GenerationResult:
+        """Run one generation and return its text and usage"""
+        response = await self._get_client().post(
+            self._url("generateContent"),
+            headers=self._headers(api_key),
+            json=self._body(system_instruction, contents, config)
+        )
+        if response.status_code != 200:
+            raise GeminiAPIError(response.status_code, self._error_message(response.content))
+
+        payload = response.json()
+        text = _text_from_payload(payload)
+        if not text:
+            reason = ((payload.get("candidates") or [{}])[0]).get("finishReason", "no candidates")
+            raise ValueError(f"Gemini returned no text (finish reason: {reason})")
+        return GenerationResult(text, _usage_from_metadata(payload.get("usageMetadata")))
+
+    async def stream(
+        self,
+        system_instruction: Optional[str],
+        contents: List[Dict],
+        config: Dict,
+        api_key: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        """Yield text chunks as they arrive; ``usage`` is filled in when known"""
+        async with self._get_client().stream(
+            "POST",
+            self._url("streamGenerateContent"),
+            params={"alt": "sse"},
+            headers=self._headers(api_key),
+            json=self._body(system_instruction, contents, config)
+        ) as response:
+            if response.status_code != 200:
+                raise GeminiAPIError(response.status_code, self._error_message(await response.aread()))
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = json.loads(line[5:].strip())
+                if usage is not None and payload.get("usageMetadata"):
+                    usage.update(_usage_from_metadata(payload["usageMetadata"]))
+                text = _text_from_payload(payload)
+                if text:
+                    yield text
+
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class SDKThreadTransport:
+    """
+    Transport over the ``google-generativeai`` SDK.
+
+    The SDK's calls are blocking, so they run on a dedicated thread pool with
+    models taken from the per-key ``ModelPool``. Kept for deployments that
+    need the SDK's gRPC path.
+    """
+
+    def __init__(self, model_pool, model_name: str, max_workers: int = 64, queue_size: int = 32):
+        self.model_pool = model_pool
+        self.model_name = model_name
+        self.queue_size = max(1, queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini")
+
+    @staticmethod
+    def _generation_config(config: Dict):
+        import google.generativeai as genai
+        return genai.types.GenerationConfig(**{k: v for k, v in config.items() if v is not None})
+
+    async def generate(
+        self,
+        system_instruction: Optional[str],
+        contents: List[Dict],
+        config: Dict,
+        api_key: Optional[str] = None
+    ) -> GenerationResult:
+        """Run one generation on the worker pool"""
+        model = self.model_pool.get(self.model_name, api_key, system_instruction)
+        gen_fn = functools.partial(model.generate_content, contents, generation_config=self._generation_config(config))
+        response = await asyncio.get_running_loop().run_in_executor(self._executor, gen_fn)
+        return GenerationResult(response.text, _usage_from_metadata(getattr(response, "usage_metadata", None)))
+
+    async def stream(
+        self,
+        system_instruction: Optional[str],
+        contents: List[Dict],
+        config: Dict,
+        api_key: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Bridge the SDK's blocking stream onto the event loop.
+
+        The worker thread hands chunks over through a bounded queue and
+        blocks while it is full, so it never reads far ahead of the
+        consumer. Closing this generator tells the thread to stop and close
+        the SDK stream at its next chunk.
+        """
+        model = self.model_pool.get(self.model_name, api_key, system_instruction)
+        gen_cfg = self._generation_config(config)
+        loop = asyncio.get_running_loop()
+        q: asyncio.Queue = asyncio.Queue()
+        # Credits bound how many chunks may wait in the queue
+        credits = threading.Semaphore(self.queue_size)
+        stop = threading.Event()
+        done = object()
+
+        def hand_over(item) -> bool:
+            while not credits.acquire(timeout=0.5):
+                if stop.is_set():
+                    return False
+            loop.call_soon_threadsafe(q.put_nowait, item)
+            return True
+
+        def produce():
+            response = None
+            try:
+                response = model.generate_content(contents, generation_config=gen_cfg, stream=True)
+                for chunk in response:
+                    if stop.is_set():
+                        break
+                    if usage is not None and getattr(chunk, "usage_metadata", None):
+                        usage.update(_usage_from_metadata(chunk.usage_metadata))
+                    text = getattr(chunk, 'text', None)
+                    if text and not hand_over(text):
+                        break
+            except Exception as e:
+                if not stop.is_set():
+                    loop.call_soon_threadsafe(q.put_nowait, e)
+            finally:
+                if stop.is_set():
+                    # Cancel the underlying gRPC call rather than leave it to the GC
+                    close = getattr(getattr(response, "_iterator", None), "cancel", None)
+                    if close is not None:
+                        close()
+                else:
+                    loop.call_soon_threadsafe(q.put_nowait, done)
+
+        loop.run_in_executor(self._executor, produce)
+
+        try:
+            while True:
+                item = await q.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                credits.release()
+                yield item
+        finally:
+            stop.set()
+            # Free the worker if it is blocked waiting for a credit
+            credits.release()
+
+    async def aclose(self):
+        """Release the worker threads"""
+        self._executor.shutdown(wait=False)
+
+
+def create_transport(settings, default_api_key: str):
+    """Build the transport selected by GEMINI_TRANSPORT"""
+    if settings.gemini_transport == "sdk":
+        import google.generativeai as genai
+        from services.model_pool import ModelPool
+        genai.configure(api_key=default_api_key)
+        pool = ModelPool(
+            default_api_key=default_api_key,
+            max_size=settings.model_pool_max_size,
+            idle_ttl=settings.model_pool_idle_ttl
+        )
+        return SDKThreadTransport(
+            pool,
+            settings.gemini_model,
+            max_workers=settings.gemini_max_workers,
+            queue_size=settings.stream_queue_size
+        )
+
+    return HttpxGeminiTransport(
+        default_api_key=default_api_key,
+        model_name=settings.gemini_model,
+        base_url=settings.gemini_api_base,
+        http2=settings.gemini_http2,
+        max_connections=settings.gemini_http_max_connections,
+        timeout=settings.gemini_request_timeout
+    )
@@ -0,0 +1,168 @@
+from typing import Dict, Optional
+from datetime import datetime
+import asyncio
+import logging
+import uuid
+from config import settings
+from firebase_config import FirebaseService, firebase_service
+from services.response_cache import create_redis_backend
+
+logger = logging.getLogger(__name__)
+
+
+class DeletionJob:
+    """Progress record for a background chat history deletion"""
+
+    def __init__(self, uid: str):
+        self.id = uuid.uuid4().hex
+        self.uid = uid
+        self.status = "pending"  # pending -> running -> completed | failed
+        self.deleted = 0
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("pending", "running")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "deleted": self.deleted,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    def to_record(self) -> dict:
+        """JSON-safe form kept in the shared store"""
+        return dict(
+            self.to_dict(),
+            uid=self.uid,
+            created_at=self.created_at.isoformat(),
+            finished_at=self.finished_at.isoformat() if self.finished_at else None
+        )
+
+    @classmethod
+    def from_record(cls, record: dict) -> "DeletionJob":
+        job = cls(record["uid"])
+        job.id = record["job_id"]
+        job.status = record["status"]
+        job.deleted = record["deleted"]
+        job.created_at = datetime.fromisoformat(record["created_at"])
+        job.finished_at = datetime.fromisoformat(record["finished_at"]) if record["finished_at"] else None
+        job.error = record["error"]
+        return job
+
+
+class HistoryDeletionJobs:
+    """
+    Runs chat history deletions as background jobs.
+
+    Starting a deletion returns at once with a job whose progress can be
+    polled; a user has at most one active job, and finished jobs are kept
+    for ``retention`` seconds so clients can read the final status. With a
+    ``shared`` store the job status is published there, so any worker
+    process can answer a status poll, not only the one running the job.
+    """
+
+    def __init__(self, firebase: FirebaseService, retention: float = 3600.0, shared=None):
+        self.firebase = firebase
+        self.retention = retention
+        self.shared = shared
+        self._jobs: Dict[str, DeletionJob] = {}
+        self._publishing: Dict[str, asyncio.Task] = {}
+
+    def _prune(self):
+        now = datetime.now()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at and (now - job.finished_at).total_seconds() > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _publish(self, job: DeletionJob):
+        if self.shared is None:
+            return
+        await self.shared.aset("job:" + job.id, job.to_record(), ttl=self.retention)
+        if job.active:
+            await self.shared.aset("user:" + job.uid, job.id, ttl=self.retention)
+
+    def _publish_progress(self, job: DeletionJob):
+        # Progress arrives once per deleted batch; keep one write in flight per job
+        if self.shared is None or job.id in self._publishing:
+            return
+        task = asyncio.get_running_loop().create_task(self._publish(job))
+        self._publishing[job.id] = task
+        task.add_done_callback(lambda _: self._publishing.pop(job.id, None))
+
+    async def _shared_job(self, job_id: str) -> Optional[DeletionJob]:
+        if self.shared is None:
+            return None
+        record = await self.shared.aget("job:" + job_id)
+        return DeletionJob.from_record(record) if record else None
+
+    async def start(self, uid: str) -> DeletionJob:
+        """Start deleting a user's history, or return their job already in progress"""
+        self._prune()
+        for job in self._jobs.values():
+            if job.uid == uid and job.active:
+                return job
+
+        # An active job may be running in another worker
+        if self.shared is not None:
+            job_id = await self.shared.aget("user:" + uid)
+            job = await self._shared_job(job_id) if job_id else None
+            if job is not None and job.active:
+                return job
+
+        job = DeletionJob(uid)
+        self._jobs[job.id] = job
+        await self._publish(job)
+        job.task = asyncio.get_running_loop().create_task(self._run(job))
+        return job
+
+    async def _run(self, job: DeletionJob):
+        job.status = "running"
+
+        def progress(count: int):
+            job.deleted = count
+            self._publish_progress(job)
+
+        try:
+            success = await self.firebase.delete_chat_history(job.uid, progress=progress)
+            job.status = "completed" if success else "failed"
+            if not success:
+                job.error = "Failed to delete chat history"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now()
+            pending = self._publishing.get(job.id)
+            if pending is not None:
+                await asyncio.gather(pending, return_exceptions=True)
+            try:
+                await self._publish(job)
+            except Exception as e:
+                logger.warning("Could not publish deletion job status: %s", e, extra={"job_id": job.id})
+
+    async def get(self, job_id: str, uid: str) -> Optional[DeletionJob]:
+        """Return a job if it exists and belongs to the user"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = await self._shared_job(job_id)
+        if job is None or job.uid != uid:
+            return None
+        return job
+
+
+# Singleton instance
+history_deletion_jobs = HistoryDeletionJobs(
+    firebase_service,
+    shared=create_redis_backend(settings.shared_store_url, "deljob:", required=True) if settings.shared_store_url else None
+)
@@ -0,0 +1,170 @@
+from typing import List, Optional, Tuple
+import asyncio
+import logging
+import uuid
+from config import settings
+from firebase_config import MAX_BATCH_OPS, FirebaseService, firebase_service
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class ChatHistoryWriter:
+    """
+    Write-behind queue for chat history.
+
+    ``enqueue`` returns immediately; a background task groups queued messages
+    from any number of requests and users into write batches, committing when
+    a batch is full or ``flush_interval`` seconds after its first message.
+    Failed commits are retried with exponential backoff, and ``stop`` drains
+    everything still queued before returning. Document ids are assigned at
+    enqueue time, so retrying a commit that actually landed (e.g. after a
+    timeout) overwrites the same documents instead of duplicating them.
+    """
+
+    def __init__(
+        self,
+        firebase: FirebaseService,
+        batch_size: int = MAX_BATCH_OPS,
+        flush_interval: float = 0.25,
+        max_queue: int = 10000,
+        max_retries: int = 5,
+        retry_base_delay: float = 0.2
+    ):
+        self.firebase = firebase
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_OPS))
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.retries = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of messages waiting to be written"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        """Start the background flush task on the running loop"""
+        if self._task is not None and not self._task.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def enqueue(self, uid: str, message: dict) -> bool:
+        """Queue a chat message for writing; never waits on Firestore"""
+        if not self.firebase.db or self._stopping:
+            return False
+
+        self.start()
+        try:
+            self._queue.put_nowait((uid, uuid.uuid4().hex, message))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Chat history queue full, dropping message", extra={"max_queue": self.max_queue})
+            return False
+
+        self.enqueued += 1
+        self._wakeup.set()
+        return True
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Flush every queued message and stop the background task"""
+        if self._task is None or self._task.done():
+            return
+        self._stopping = True
+        await self._queue.put(_STOP)
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("Chat history writer did not drain in %ss, %d messages lost", timeout, self.queue_depth)
+            self._task.cancel()
+
+    def _drain_into(self, batch: List[Tuple[str, str, dict]]) -> bool:
+        """Move queued messages into the batch; returns True if stop was requested"""
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return False
+            if item is _STOP:
+                return True
+            batch.append(item)
+        return False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            stop = False
+            while True:
+                stop = self._drain_into(batch)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            await self._flush(batch)
+            if stop:
+                return
+
+    async def _flush(self, batch: List[Tuple[str, str, dict]]):
+        """Commit one batch, retrying with exponential backoff"""
+        for attempt in range(self.max_retries + 1):
+            if await self.firebase.save_chat_messages_batch(batch):
+                self.written += len(batch)
+                self.batches += 1
+                return
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(self.retry_base_delay * (2 ** attempt))
+
+        self.failed += len(batch)
+        logger.error("Dropping %d chat messages after %d retries", len(batch), self.max_retries)
+
+    def stats(self) -> dict:
+        """Return queue depth and write counters"""
+        return {
+            "queue_depth": self.queue_depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "retries": self.retries,
+        }
+
+
+# Singleton instance
+history_writer = ChatHistoryWriter(
+    firebase_service,
+    batch_size=settings.history_batch_size,
+    flush_interval=settings.history_flush_interval,
+    max_queue=settings.history_queue_max,
+    max_retries=settings.history_max_retries
+)
@@ -0,0 +1,285 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+import re
+
+# Rule phrases per intent, highest priority first (same order as the
+# frontend's mode detection). Patterns must not use named groups.
+INTENT_RULES: Dict[str, List[str]] = {
+    "roadmap": [
+        # The old substring keywords; no trailing \b so "roadmaps" still matches
+        r"\broadmap", r"\blearning\s*path", r"\bcourse\s*outline", r"\bstudy\s*plan",
+        r"\bcurriculum", r"\blearning\s*plan", r"\bstudy\s*roadmap",
+        r"\bsyllabus\b", r"\bcourse\s*(?:plan|path)\b", r"\bplan\s*(?:to|for)\s*learn",
+    ],
+    "code": [
+        r"\bwrite\s*(?:me\s*)?(?:a\s*)?(?:the\s*)?(?:code|function|program|script|class)\b",
+        r"\bcreate\s*(?:a\s*)?(?:the\s*)?(?:function|class|program|snippet)\b",
+        r"\bgenerate\s*(?:a\s*)?(?:code|function|snippet)\b", r"\bimplement\b",
+        r"\bcode\s*(?:for|to)\b", r"\bfunction\s*(?:to|that|for)\b",
+        r"\bclass\s*(?:to|that|for)\b", r"\balgorithm\s*(?:for|to)\b",
+        r"\bdebug\s*(?:this|my)", r"\bfix\s*(?:this|my)\s*(?:code|bug|error)",
+        r"\brefactor", r"\boptimize", r"\bunit\s*tests?\b", r"\bapi\s*endpoint\b",
+    ],
+    "explain": [
+        r"\bexplain\b", r"\bwhat\s*(?:is|are|does|do)\b", r"\bhow\s*(?:does|do|is|are)\b",
+        r"\bwhy\s*(?:does|do|is|are)\b", r"\bdescribe\b", r"\btell\s*me\s*(?:about|what)\b",
+        r"\bdifference\s*between\b", r"\bhelp\s*me\s*understand\b",
+        r"\bdefine\b", r"\bmeaning\s*of\b", r"\bcompare\b",
+    ],
+}
+
+# Seed sentences for the optional classifier, used only when no rule matches
+CLASSIFIER_EXAMPLES: List[Tuple[str, str]] = [
+    ("reverse a linked list in python", "code"),
+    ("sort a list of dicts by key", "code"),
+    ("parse a csv file and sum a column", "code"),
+    ("my loop throws an index error", "code"),
+    ("this query is too slow, can you speed it up", "code"),
+    ("convert this javascript to typescript", "code"),
+    ("add type hints to this", "code"),
+    ("regex to validate an email address", "code"),
+    ("binary search in go", "code"),
+    ("read a json file in node", "code"),
+    ("async vs threads in python", "explain"),
+    ("when should i use a tuple instead of a list", "explain"),
+    ("big o of quicksort", "explain"),
+    ("is rust faster than go", "explain"),
+    ("pros and cons of microservices", "explain"),
+    ("what happens when i type a url in the browser", "explain"),
+    ("closures in javascript", "explain"),
+    ("the purpose of a virtual dom", "explain"),
+    ("hello", "chat"),
+    ("thanks, that helped a lot", "chat"),
+    ("good morning", "chat"),
+    ("which laptop should i buy for programming", "chat"),
+    ("i feel stuck in my career", "chat"),
+    ("recommend a good book", "chat"),
+    ("can you help me", "chat"),
+    ("who are you", "chat"),
+]
+
+_WORDS = re.compile(r"[a-z0-9+#]+")
+_ANCHOR = re.compile(r"\\b([A-Za-z]+)")
+
+
+def _trie_pattern(words) -> str:
+    """Regex alternation of literal words, factored into a trie so each position costs one branch"""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node) -> str:
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            body = f"(?:{body})?"
+        return body
+
+    return emit(trie)
+
+
+def _features(text: str) -> List[str]:
+    words = _WORDS.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class IntentMatch:
+    """Routing decision: the intent and whether a rule, the classifier, the default or the client chose it"""
+
+    __slots__ = ("intent", "source", "confidence")
+
+    def __init__(self, intent: str, source: str, confidence: float = 1.0):
+        self.intent = intent
+        self.source = source
+        self.confidence = confidence
+
+    def __repr__(self) -> str:
+        return f"IntentMatch({self.intent!r}, {self.source!r}, {self.confidence:.2f})"
+
+
+class NaiveBayesClassifier:
+    """
+    Tiny multinomial Naive Bayes over word unigrams and bigrams.
+
+    Trained in memory at startup from a few dozen sentences; predicting a
+    message is a dictionary lookup per feature, with no model files or
+    dependencies.
+    """
+
+    def __init__(self, examples: Sequence[Tuple[str, str]] = CLASSIFIER_EXAMPLES, alpha: float = 1.0):
+        self.alpha = alpha
+        counts: Dict[str, Dict[str, int]] = {}
+        totals: Dict[str, int] = {}
+        docs: Dict[str, int] = {}
+        vocabulary = set()
+        for text, label in examples:
+            docs[label] = docs.get(label, 0) + 1
+            label_counts = counts.setdefault(label, {})
+            for feature in _features(text):
+                label_counts[feature] = label_counts.get(feature, 0) + 1
+                totals[label] = totals.get(label, 0) + 1
+                vocabulary.add(feature)
+
+        size = len(vocabulary)
+        self.labels = list(docs)
+        self._prior = {label: math.log(docs[label] / len(examples)) for label in self.labels}
+        self._unseen = {label: math.log(alpha / (totals.get(label, 0) + alpha * size)) for label in self.labels}
+        self._log_prob = {
+            label: {
+                feature: math.log((n + alpha) / (totals[label] + alpha * size))
+                for feature, n in counts[label].items()
+            }
+            for label in self.labels
+        }
+        self._vocabulary = vocabulary
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """Return (label, probability), or (None, 0.0) if no feature is known"""
+        features = [f for f in _features(text) if f in self._vocabulary]
+        if not features:
+            return None, 0.0
+        scores = {}
+        for label in self.labels:
+            log_prob = self._log_prob[label]
+            unseen = self._unseen[label]
+            scores[label] = self._prior[label] + sum(log_prob.get(f, unseen) for f in features)
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        total = sum(math.exp(s - top) for s in scores.values())
+        return best, 1.0 / total
+
+
+class IntentRouter:
+    """
+    Single-pass intent detection for chat messages.
+
+    Rules are regexes that start with a literal word (``\\broadmap``). The
+    leading words of every rule of every intent are compiled into one
+    trie-shaped regex, so a message is scanned once however many phrases are
+    registered, and only the rules anchored on a word actually found are
+    checked, at that position; rules without a literal first word are
+    searched separately. When several intents match, the one registered
+    first wins. With no rule match, the optional classifier may pick code,
+    explain or chat (never roadmap, whose false positives cost a JSON
+    generation).
+    """
+
+    def __init__(
+        self,
+        rules: Dict[str, Sequence[str]] = INTENT_RULES,
+        default: str = "chat",
+        classifier: Optional[NaiveBayesClassifier] = None,
+        min_confidence: float = 0.6,
+        client_default: str = "code"
+    ):
+        self.default = default
+        # The mode a request carries when the client did not pick one
+        self.client_default = client_default
+        self.classifier = classifier
+        self.min_confidence = min_confidence
+        self._rules: Dict[str, List[str]] = {intent: list(patterns) for intent, patterns in rules.items()}
+        self._compile()
+
+    def register(self, intent: str, patterns: Sequence[str]):
+        """Add rule patterns to an intent (new intents get the lowest priority)"""
+        self._rules.setdefault(intent, []).extend(patterns)
+        self._compile()
+
+    def _compile(self):
+        self._priority = {intent: rank for rank, intent in enumerate(self._rules)}
+        self._top = next(iter(self._rules), None)
+        by_anchor: Dict[str, List[Tuple[int, str, re.Pattern]]] = {}
+        self._unanchored: List[Tuple[int, str, re.Pattern]] = []
+        for intent, patterns in self._rules.items():
+            rank = self._priority[intent]
+            for pattern in patterns:
+                rule = (rank, intent, re.compile(pattern, re.IGNORECASE))
+                anchor = _ANCHOR.match(pattern)
+                if anchor:
+                    by_anchor.setdefault(anchor.group(1).lower(), []).append(rule)
+                else:
+                    self._unanchored.append(rule)
+
+        # A matched anchor also carries the rules of every anchor it starts with,
+        # since the trie prefers the longest ("plan" inside "planning")
+        self._candidates = {
+            word: sorted(
+                (rule for other, rules in by_anchor.items() if word.startswith(other) for rule in rules),
+                key=lambda rule: rule[0]
+            )
+            for word in by_anchor
+        }
+        # No leading \b: it defeats the regex engine's first-character skip, so
+        # the word boundary is checked by hand on the few matches instead
+        self._anchors = re.compile(_trie_pattern(by_anchor)) if by_anchor else None
+
+    def match_rules(self, message: str) -> Optional[str]:
+        """Highest-priority intent with a matching rule, or None"""
+        text = message.lower()
+        best = None
+        best_rank = len(self._priority)
+        for rank, intent, rule in self._unanchored:
+            if rank < best_rank and rule.search(text):
+                best, best_rank = intent, rank
+        if self._anchors is None:
+            return best
+        for match in self._anchors.finditer(text):
+            start = match.start()
+            if start and (text[start - 1].isalnum() or text[start - 1] == "_"):
+                continue
+            for rank, intent, rule in self._candidates[match.group()]:
+                if rank >= best_rank:
+                    break
+                if rule.match(text, start):
+                    if intent == self._top:
+                        return intent
+                    best, best_rank = intent, rank
+                    break
+        return best
+
+    def classify(self, message: str) -> IntentMatch:
+        """Detect the intent of a message"""
+        intent = self.match_rules(message)
+        if intent is not None:
+            return IntentMatch(intent, "rule")
+        if self.classifier is not None:
+            label, confidence = self.classifier.predict(message)
+            if label is not None and label != "roadmap" and confidence >= self.min_confidence:
+                return IntentMatch(label, "classifier", confidence)
+        return IntentMatch(self.default, "default", 0.0)
+
+    def resolve(self, message: str, mode: Optional[str] = None) -> IntentMatch:
+        """
+        Decide how a chat message is served, given the mode the client chose.
+
+        Roadmap requests go to the roadmap generator (source "rule"). When the
+        client sent no mode or ``client_default``, a message no rule matches
+        is routed by the classifier if it is enabled and confident. Anything
+        else keeps the client's mode (source "client"): an explicit choice
+        outranks a bag-of-words guess, and the UI already switches modes with
+        the same rules before sending.
+        """
+        mode = mode or self.client_default
+        intent = self.match_rules(message)
+        if intent == "roadmap":
+            return IntentMatch("roadmap", "rule")
+        if intent is None and mode == self.client_default and self.classifier is not None:
+            label, confidence = self.classifier.predict(message)
+            if label is not None and label != "roadmap" and confidence >= self.min_confidence:
+                return IntentMatch(label, "classifier", confidence)
+        return IntentMatch(mode, "client")
+
+    def route(self, message: str, mode: Optional[str] = None) -> str:
+        """Mode whose handler serves a message"""
+        return self.resolve(message, mode).intent
+
+
+def create_intent_router(settings) -> IntentRouter:
+    """Build the intent router described by the application settings"""
+    classifier = NaiveBayesClassifier() if settings.intent_classifier_enabled else None
+    return IntentRouter(classifier=classifier, min_confidence=settings.intent_classifier_min_confidence)
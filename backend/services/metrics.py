@@ -0,0 +1,375 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import bisect
+import glob
+import os
+import threading
+import time
+
+# Seconds; covers cache hits through long generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        """Child metric for one set of label values"""
+        key = tuple(str(v) for v in values) if values else tuple(str(kwargs[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """Fresh state for one set of label values"""
+
+    @abstractmethod
+    def _render_child(self, key: tuple, child) -> List[str]:
+        """Exposition lines for one child"""
+
+    def _default(self):
+        # Metrics without labels act as their own single child
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonic counter"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(child.value)}"]
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _render_child(self, key, child):
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += n
+            le = 'le="' + _number(bound) + '"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(child.sum)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics rendered in the Prometheus text exposition format.
+
+    Besides metrics recorded as requests run, collectors registered with
+    ``add_collector`` turn the ``stats()`` counters that services already
+    keep (caches, admission control, queues) into samples at scrape time, so
+    the hot path pays nothing extra for them.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Tuple[str, str, frozenset, Callable[[], Optional[dict]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, prefix: str, documentation: str, stats: Callable[[], Optional[dict]], counters: Iterable[str] = ()):
+        """
+        Expose the numeric values of ``stats()`` as ``<prefix>_<key>``.
+
+        Keys listed in ``counters`` are typed as counters (and get a
+        ``_total`` suffix), everything else as gauges; non-numeric values
+        are skipped.
+        """
+        self._collectors.append((prefix, documentation, frozenset(counters), stats))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, documentation, counters, stats in self._collectors:
+            try:
+                values = stats() or {}
+            except Exception as e:
+                lines.append(f"# {prefix} unavailable: {_escape(e)}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                kind = "counter" if key in counters else "gauge"
+                name = f"{prefix}_{key}_total" if kind == "counter" else f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {documentation}: {key.replace('_', ' ')}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_number(float(value))}")
+        return "\n".join(lines) + "\n"
+
+    def write_process_file(self, directory: str, pid: Optional[int] = None):
+        """Write this process's samples to ``<directory>/<pid>.prom`` for merge_process_files"""
+        path = os.path.join(directory, f"{pid or os.getpid()}.prom")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(path + ".tmp", path)
+
+    async def export(self, directory: str, interval: float):
+        """Refresh this process's samples file every ``interval`` seconds until cancelled"""
+        try:
+            while True:
+                self.write_process_file(directory)
+                await asyncio.sleep(interval)
+        finally:
+            # Final counts, so nothing recorded before shutdown is lost
+            self.write_process_file(directory)
+
+
+def retire_process_file(directory: str, pid: int):
+    """Keep an exited process's counters in the merge, but not its gauges"""
+    path = os.path.join(directory, f"{pid}.prom")
+    if os.path.exists(path):
+        os.replace(path, os.path.join(directory, f"{pid}.dead.prom"))
+
+
+def _with_label(sample: str, label: str) -> str:
+    return sample[:-1] + "," + label + "}" if sample.endswith("}") else sample + "{" + label + "}"
+
+
+def merge_process_files(directory: str) -> str:
+    """
+    Merge the samples files of every worker process into one exposition.
+
+    Counters and histograms are summed across processes, including exited
+    ones, so totals never go backwards between scrapes whichever worker
+    answers. Gauges are point-in-time values that do not add up in general
+    (hit rates), so each live process's gauges get a ``worker`` label.
+    """
+    families: "OrderedDict[str, Tuple[str, str, OrderedDict]]" = OrderedDict()
+    for path in sorted(glob.glob(os.path.join(directory, "*.prom"))):
+        pid, _, rest = os.path.basename(path).partition(".")
+        dead = rest.startswith("dead")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        help_line, family = "", None
+        for line in lines:
+            if line.startswith("# HELP "):
+                help_line = line
+            elif line.startswith("# TYPE "):
+                _, _, name, kind = line.split(" ", 3)
+                family = families.setdefault(name, (help_line, kind, OrderedDict()))
+            elif line and not line.startswith("#") and family is not None:
+                sample, _, value = line.rpartition(" ")
+                kind, samples = family[1], family[2]
+                if kind == "gauge":
+                    if not dead:
+                        samples[_with_label(sample, f'worker="{pid}"')] = float(value)
+                else:
+                    samples[sample] = samples.get(sample, 0.0) + float(value)
+
+    out: List[str] = []
+    for name, (help_line, kind, samples) in families.items():
+        out.append(help_line)
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(f"{sample} {_number(value)}" for sample, value in samples.items())
+    return "\n".join(out) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_duration = registry.histogram(
+    "app_stage_duration_seconds",
+    "Time spent in one stage of handling a request",
+    ["stage"]
+)
+stream_first_chunk = registry.histogram(
+    "app_stream_first_chunk_seconds",
+    "Time from request start to the first streamed content chunk",
+    ["endpoint"]
+)
+upstream_tokens = registry.counter(
+    "app_upstream_tokens_total",
+    "Tokens reported in Gemini usage metadata",
+    ["operation", "kind"]
+)
+http_requests = registry.counter(
+    "app_http_requests_total",
+    "HTTP requests by route and status",
+    ["method", "route", "status"]
+)
+http_duration = registry.histogram(
+    "app_http_request_duration_seconds",
+    "HTTP request duration until the response body is complete",
+    ["method", "route"]
+)
+http_in_flight = registry.gauge(
+    "app_http_requests_in_flight",
+    "HTTP requests currently being served"
+)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block of a request as ``app_stage_duration_seconds{stage=...}``"""
+    child = stage_duration.labels(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        child.observe(time.perf_counter() - start)
+
+
+def record_usage(operation: str, usage: Optional[Dict[str, int]]):
+    """Count prompt and output tokens from a generation's usage metadata"""
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "output_tokens"):
+        if usage.get(kind):
+            upstream_tokens.labels(operation, kind[:-len("_tokens")]).inc(usage[kind])
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, durations and in-flight requests.
+
+    Durations run until the last body chunk is sent, so streamed responses
+    are measured in full. Requests are labelled with the matched route
+    template, never the raw path, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        http_in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_requests.labels(method, path, status).inc()
+            http_duration.labels(method, path).observe(time.perf_counter() - start)
@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional, Tuple
+import hashlib
+import threading
+import time
+
+if TYPE_CHECKING:
+    from google.ai import generativelanguage as glm
+
+
+def hash_api_key(api_key: str) -> str:
+    """Return a stable, non-reversible identifier for an API key"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+
+
+class _PoolEntry:
+    """A pooled model together with its bookkeeping"""
+
+    __slots__ = ("model", "last_used")
+
+    def __init__(self, model):
+        self.model = model
+        self.last_used = time.monotonic()
+
+
+class ModelPool:
+    """
+    Keyed pool of reusable Gemini models.
+
+    Models are keyed by (API key hash, model name, system instruction), so
+    each prompt variant gets a model with its instruction baked in. Each
+    entry is bound to its own GenerativeService client, so a request made
+    with a user-supplied key never touches the process-global ``genai.configure``
+    state and never leaks into concurrent requests using a different key.
+    Entries are evicted least-recently-used once ``max_size`` is reached and
+    dropped after ``idle_ttl`` seconds without use.
+    """
+
+    def __init__(self, default_api_key: str, max_size: int = 128, idle_ttl: float = 900.0):
+        self.default_api_key = default_api_key
+        self.max_size = max(1, max_size)
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[Tuple[str, str, Optional[str]], _PoolEntry]" = OrderedDict()
+        # One transport per API key, shared by all of that key's models
+        self._clients: "OrderedDict[str, glm.GenerativeServiceClient]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _client_for(self, key_hash: str, api_key: str):
+        """Return the shared client for an API key, creating it if needed"""
+        with self._lock:
+            client = self._clients.get(key_hash)
+            if client is not None:
+                self._clients.move_to_end(key_hash)
+                return client
+        from google.ai import generativelanguage as glm
+        client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        with self._lock:
+            client = self._clients.setdefault(key_hash, client)
+            self._clients.move_to_end(key_hash)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+            return client
+
+    def _build_model(self, api_key: str, model_name: str, system_instruction: Optional[str] = None):
+        """Create a model bound to its key's pre-authenticated client"""
+        # Imported on first use: the SDK takes most of a second to import
+        import google.generativeai as genai
+        model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        # Bind the transport up front so the first request skips client setup
+        # and never falls back to the globally configured key.
+        model._client = self._client_for(hash_api_key(api_key), api_key)
+        return model
+
+    def _evict_expired(self, now: float):
+        """Drop entries that have been idle for longer than the TTL"""
+        if self.idle_ttl <= 0:
+            return
+        # Entries are kept in last-used order, so expired ones sit at the front
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.last_used <= self.idle_ttl:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def get(self, model_name: str, api_key: Optional[str] = None, system_instruction: Optional[str] = None):
+        """Return the pooled model for (api_key, model_name, system_instruction), creating it if needed"""
+        api_key = api_key or self.default_api_key
+        # The instruction string itself is part of the key; str caches its hash
+        key = (hash_api_key(api_key), model_name, system_instruction)
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.last_used = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.model
+
+        # Build outside the lock; a concurrent builder for the same key is harmless
+        model = self._build_model(api_key, model_name, system_instruction)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _PoolEntry(model)
+                self._entries[key] = entry
+                self.misses += 1
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            entry.last_used = now
+            self._entries.move_to_end(key)
+            return entry.model
+
+    def prewarm(self, model_name: str, api_key: Optional[str] = None, system_instruction: Optional[str] = None):
+        """Eagerly create the model for a key so the first request is fast"""
+        return self.get(model_name, api_key, system_instruction)
+
+    def clear(self):
+        """Remove all pooled models"""
+        with self._lock:
+            self._entries.clear()
+            self._clients.clear()
+
+    def stats(self) -> dict:
+        """Return pool size and hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "clients": len(self._clients),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
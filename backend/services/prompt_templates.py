@@ -0,0 +1,273 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Languages offered by /api/languages; their prompts are compiled at startup
+PRECOMPILED_LANGUAGES = [
+    "python", "javascript", "typescript", "java", "csharp", "cpp", "go", "rust",
+    "ruby", "php", "swift", "kotlin", "sql", "html", "css",
+]
+
+# Chat mode -> template name
+MODE_TEMPLATES = {
+    "code": "chat_code",
+    "explain": "chat_explain",
+    "roadmap": "chat_roadmap",
+    "chat": "chat_general",
+}
+
+
+class PromptTemplate:
+    """A named, versioned prompt with ``str.format`` placeholders"""
+
+    def __init__(self, name: str, text: str, version: str = "1"):
+        self.name = name
+        self.text = text
+        self.version = version
+
+    def render(self, **params) -> str:
+        return self.text.format(**params)
+
+
+DEFAULT_TEMPLATES = [
+    PromptTemplate("chat_code", """You are an expert AI code generator and programming assistant.
+Focus on producing high-quality, production-ready {language} solutions with minimal fluff.
+
+Use concise Markdown with these sections (omit a section if not relevant):
+## Summary
+- One to two bullet points describing what you will deliver
+
+## Plan
+- Short, ordered steps you will follow before coding
+
+## Code
+```{language}
+# code
+```
+
+## Explanation
+- Bullet points explaining key choices, inputs/outputs, and important behaviors
+
+## Edge Cases
+- Bulleted risks or edge cases the user should know
+
+Rules:
+- Keep code idiomatic for {language}; add docstrings/comments only when they clarify intent.
+- Prefer complete solutions over fragments; include error handling and input validation when sensible.
+- Use tables when comparing options or configurations.
+- Keep wording tight and avoid greetings or filler.
+"""),
+    PromptTemplate("chat_explain", """You are an expert programming tutor specializing in {language}.
+Provide clear, layered explanations with Markdown structure.
+
+Required layout (skip irrelevant sections gracefully):
+## Summary
+- Plain-language answer in one or two bullets
+
+## Breakdown
+- Short bullets for the main concepts, definitions, and relationships
+
+## Example
+```{language}
+# small example
+```
+
+## Best Practices
+- Bullets with dos and don'ts tailored to the topic
+
+## Quick Checks
+- Bullets listing common pitfalls or sanity checks
+
+Formatting rules:
+- Use headings and bullets liberally; prefer lists over long paragraphs.
+- Use inline code for identifiers; fenced code blocks for longer snippets.
+- Use tables for comparisons when helpful.
+- Highlight key terms with bold only when it improves clarity.
+"""),
+    PromptTemplate("chat_roadmap", """You are an expert learning path designer and programming mentor.
+Create comprehensive, structured learning roadmaps for programming topics.
+Focus on {language} when relevant. Provide clear progression paths with specific topics."""),
+    PromptTemplate("chat_general", """You are a helpful AI programming assistant with expertise in {language}.
+Respond with actionable guidance and compact Markdown.
+
+Default layout (drop sections that do not apply):
+## Answer
+- Direct response in one or two bullets
+
+## Details
+- Supporting bullets or short paragraphs with reasoning
+
+## Example
+```{language}
+# example
+```
+
+## Next Steps
+- Bulleted follow-ups, related tips, or checks
+
+Guidelines:
+- Start with the direct answer before elaborating.
+- Use headings and bullets liberally; tables for comparisons.
+- Use inline code for identifiers and fenced code blocks for snippets.
+- Keep tone concise and professional.
+"""),
+    PromptTemplate("code_generation", """You are an expert {language} code generator.
+Generate clean, efficient, and production-ready code based on user requirements.
+
+Requirements:
+- Write {language} code only
+- {comments_rule}
+- {tests_rule}
+- Follow {language} best practices and conventions
+- Handle edge cases and errors appropriately
+- Format code with proper indentation
+- Wrap code in markdown code blocks with language specified
+"""),
+    PromptTemplate("roadmap_json", """You are a JSON generator that designs learning roadmaps. Return only valid JSON matching the response schema, no markdown, no extra text.
+
+Rules:
+- Create 5-8 modules with logical progression
+- Each module must have 3-6 specific, practical topics
+- Difficulty must be exactly "Beginner", "Intermediate", or "Advanced"
+- Duration should be realistic (1-4 weeks per module)
+- Prerequisites contains module ids (use [] for first modules)
+- Make titles and descriptions specific to the requested topic
+""", version="2"),
+]
+
+
+class PromptRegistry:
+    """
+    Registry of prompt templates with a cache of rendered prompts.
+
+    Rendered prompts are keyed by (template, version, parameters), so each
+    (mode, language) prompt is built once and then returned as the same
+    string object, which also lets the model pool key on it cheaply. The
+    language comes from the client, so the cache keeps at most
+    ``max_rendered`` prompts, evicting the least recently used.
+    When ``overrides_path`` points to a JSON file of the form
+    ``{"name": {"version": "2", "text": "..."}}`` it is re-read whenever its
+    modification time changes (checked at most every ``reload_interval``
+    seconds), hot-swapping templates without a restart.
+    """
+
+    def __init__(
+        self,
+        templates: Iterable[PromptTemplate] = DEFAULT_TEMPLATES,
+        overrides_path: Optional[str] = None,
+        reload_interval: float = 5.0,
+        max_rendered: int = 1024
+    ):
+        self._defaults = {t.name: t for t in templates}
+        self._templates: Dict[str, PromptTemplate] = dict(self._defaults)
+        self.max_rendered = max(1, max_rendered)
+        self._rendered: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.overrides_path = overrides_path
+        self.reload_interval = reload_interval
+        self._overrides_mtime: Optional[float] = None
+        self._next_check = 0.0
+        if overrides_path:
+            self.reload()
+
+    def register(self, template: PromptTemplate):
+        """Add or replace a template, invalidating its rendered prompts"""
+        with self._lock:
+            self._templates[template.name] = template
+            self._rendered = OrderedDict((k, v) for k, v in self._rendered.items() if k[0] != template.name)
+
+    def versions(self) -> Dict[str, str]:
+        """Return the active version of every template"""
+        return {name: t.version for name, t in self._templates.items()}
+
+    def version(self, name: str) -> str:
+        """Return the active version of one template"""
+        self._maybe_reload()
+        return self._templates[name].version
+
+    def reload(self) -> bool:
+        """Re-read the overrides file; returns True if templates changed"""
+        if not self.overrides_path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.overrides_path)
+        except OSError:
+            mtime = None
+        if mtime == self._overrides_mtime:
+            return False
+
+        templates = dict(self._defaults)
+        if mtime is not None:
+            try:
+                with open(self.overrides_path, "r", encoding="utf-8") as f:
+                    for name, spec in json.load(f).items():
+                        templates[name] = PromptTemplate(name, spec["text"], str(spec.get("version", "override")))
+            except Exception as e:
+                logger.warning("Could not load prompt overrides from %s: %s", self.overrides_path, e)
+                return False
+
+        with self._lock:
+            self._templates = templates
+            self._rendered = OrderedDict()
+            self._overrides_mtime = mtime
+        logger.info("Prompt templates loaded", extra={"versions": self.versions()})
+        return True
+
+    def _maybe_reload(self):
+        if not self.overrides_path:
+            return
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            self.reload()
+
+    def render(self, name: str, **params) -> str:
+        """Return the rendered prompt, building it only on first use"""
+        self._maybe_reload()
+        template = self._templates[name]
+        key = (name, template.version, tuple(sorted(params.items())))
+        with self._lock:
+            prompt = self._rendered.get(key)
+            if prompt is not None:
+                self._rendered.move_to_end(key)
+                return prompt
+        prompt = template.render(**params)
+        with self._lock:
+            prompt = self._rendered.setdefault(key, prompt)
+            self._rendered.move_to_end(key)
+            while len(self._rendered) > self.max_rendered:
+                self._rendered.popitem(last=False)
+        return prompt
+
+    @staticmethod
+    def mode_template(mode: str) -> str:
+        """Name of the template behind a chat mode's system prompt"""
+        return MODE_TEMPLATES.get(mode, "chat_general")
+
+    def system_prompt(self, mode: str, language: str) -> str:
+        """System instruction for a chat mode and language"""
+        return self.render(self.mode_template(mode), language=language)
+
+    def code_prompt(self, language: str, include_comments: bool = True, include_tests: bool = False) -> str:
+        """System instruction for /api/generate-code"""
+        return self.render(
+            "code_generation",
+            language=language,
+            comments_rule="Include helpful comments and docstrings" if include_comments else "Minimize comments, focus on code",
+            tests_rule="Include unit tests" if include_tests else "No tests needed"
+        )
+
+    def precompile(self, languages: Iterable[str] = PRECOMPILED_LANGUAGES):
+        """Render every mode and code-generation prompt for the given languages"""
+        for language in languages:
+            for mode in MODE_TEMPLATES:
+                self.system_prompt(mode, language)
+            for include_comments in (True, False):
+                for include_tests in (True, False):
+                    self.code_prompt(language, include_comments, include_tests)
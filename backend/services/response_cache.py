@@ -0,0 +1,372 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?.!]+$")
+_TRAILING_SPACE_RE = re.compile(r"[ \t]+(?=\n)")
+
+
+def exact_text(text: str) -> str:
+    """
+    Trim, unify line endings and drop trailing spaces on each line.
+
+    Case and indentation are kept: two pastes of code that differ only
+    there are different requests.
+    """
+    return _TRAILING_SPACE_RE.sub("", (text or "").replace("\r\n", "\n").strip())
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, collapse whitespace and strip trailing punctuation (near-duplicate matching only)"""
+    text = _WHITESPACE_RE.sub(" ", (text or "").strip().lower())
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def history_digest(conversation_history: Iterable[Any]) -> str:
+    """Digest of the (role, content) pairs of a conversation history"""
+    h = hashlib.sha256()
+    for msg in conversation_history or []:
+        role = getattr(msg, "role", None) or (msg.get("role") if isinstance(msg, dict) else "")
+        content = getattr(msg, "content", None) or (msg.get("content") if isinstance(msg, dict) else "")
+        h.update(f"{role}\x1f{content}\x1e".encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    """Character shingles of a normalized string"""
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class InMemoryCacheBackend:
+    """In-process LRU cache backend with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max(1, max_entries)
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + ttl if ttl else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.set(key, value, ttl)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCacheBackend:
+    """
+    Cache backend for Redis or any Redis-protocol compatible server.
+
+    Shared by every worker process pointed at the same server. Lookups and
+    writes that fail (server down, timeout) are logged and treated as a miss
+    or skipped, so an outage degrades to uncached behaviour, not errors.
+    The client is blocking: async code uses ``aget``/``aset``, which run the
+    round-trip on a small thread pool instead of the event loop.
+    """
+
+    _executor: Optional[ThreadPoolExecutor] = None
+
+    def __init__(self, url: str, prefix: str = "respcache:", socket_timeout: float = 0.5):
+        import redis  # only imported when a Redis store is configured
+
+        self.client = redis.Redis.from_url(url, socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout)
+        self.prefix = prefix
+        self.errors = 0
+
+    def _failed(self, op: str, e: Exception):
+        self.errors += 1
+        logger.warning("Redis %s failed for %s*: %s", op, self.prefix, e)
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as e:
+            self._failed("get", e)
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        payload = json.dumps(value, default=str)
+        try:
+            if ttl:
+                self.client.set(self.prefix + key, payload, px=max(1, int(ttl * 1000)))
+            else:
+                self.client.set(self.prefix + key, payload)
+        except Exception as e:
+            self._failed("set", e)
+
+    def delete(self, key: str):
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as e:
+            self._failed("delete", e)
+
+    def clear(self):
+        try:
+            for key in self.client.scan_iter(match=self.prefix + "*"):
+                self.client.delete(key)
+        except Exception as e:
+            self._failed("clear", e)
+
+    async def _offload(self, fn, *args):
+        if RedisCacheBackend._executor is None:
+            RedisCacheBackend._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="redis")
+        return await asyncio.get_running_loop().run_in_executor(RedisCacheBackend._executor, fn, *args)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return await self._offload(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self._offload(self.set, key, value, ttl)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+    def ping(self) -> bool:
+        """Whether the server answers"""
+        try:
+            return bool(self.client.ping())
+        except Exception:
+            return False
+
+
+class _ShingleIndex:
+    """
+    Bounded inverted index from character shingles to cache keys.
+
+    Entries are grouped by a scope (everything in the cache key except the
+    message itself) so a near-duplicate match never crosses modes, languages
+    or conversations.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, Tuple[str, Set[str]]]" = OrderedDict()
+        self._postings: Dict[Tuple[str, str], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, scope: str, key: str, text: str):
+        shingles = _shingles(text)
+        with self._lock:
+            self._remove_locked(key)
+            self._entries[key] = (scope, shingles)
+            for s in shingles:
+                self._postings.setdefault((scope, s), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+
+    def remove(self, key: str):
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: str):
+        item = self._entries.pop(key, None)
+        if item is None:
+            return
+        scope, shingles = item
+        for s in shingles:
+            posting = self._postings.get((scope, s))
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[(scope, s)]
+
+    def best_match(self, scope: str, text: str, threshold: float) -> Optional[str]:
+        """Return the key with the highest Jaccard similarity above threshold"""
+        query = _shingles(text)
+        if not query:
+            return None
+        with self._lock:
+            overlap: Dict[str, int] = {}
+            for s in query:
+                for key in self._postings.get((scope, s), ()):
+                    overlap[key] = overlap.get(key, 0) + 1
+            best_key, best_score = None, 0.0
+            for key, shared in overlap.items():
+                size = len(self._entries[key][1])
+                score = shared / (len(query) + size - shared)
+                if score > best_score:
+                    best_key, best_score = key, score
+        return best_key if best_score >= threshold else None
+
+
+class ResponseCache:
+    """
+    Two-tier cache for generated responses.
+
+    The exact tier is keyed by a digest of the request fields and the
+    message with only surrounding and trailing whitespace normalized. The
+    optional near-duplicate tier indexes the aggressively normalized message
+    (lowercased, whitespace collapsed) by character shingles and serves the closest cached response within the same scope
+    when its Jaccard similarity reaches ``similarity_threshold``.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        ttl: Optional[float] = 3600.0,
+        max_entries: int = 1024,
+        semantic: bool = False,
+        similarity_threshold: float = 0.9,
+        disabled_modes: Iterable[str] = (),
+        enabled: bool = True
+    ):
+        self.backend = backend if backend is not None else InMemoryCacheBackend(max_entries)
+        self.ttl = ttl
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.disabled_modes = {m.strip() for m in disabled_modes if m and m.strip()}
+        self._index = _ShingleIndex(max_entries) if semantic else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def is_enabled_for(self, mode: str) -> bool:
+        """Whether responses for the given mode may be cached"""
+        return self.enabled and mode not in self.disabled_modes
+
+    @staticmethod
+    def _scope(namespace: str, fields: Dict[str, Any]) -> str:
+        payload = json.dumps(fields, sort_keys=True, default=str)
+        return hashlib.sha256(f"{namespace}|{payload}".encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def _key(scope: str, normalized: str) -> str:
+        return hashlib.sha256(f"{scope}|{normalized}".encode("utf-8")).hexdigest()
+
+    def _count(self, attr: str):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    async def get(self, namespace: str, message: str, mode: str, **fields) -> Optional[Any]:
+        """Look up a cached response, trying the exact tier before near-duplicates"""
+        if not self.is_enabled_for(mode):
+            return None
+
+        scope = self._scope(namespace, dict(fields, mode=mode))
+        key = self._key(scope, exact_text(message))
+
+        value = await self.backend.aget(key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        if self._index is not None:
+            match = self._index.best_match(scope, normalize_text(message), self.similarity_threshold)
+            if match is not None:
+                value = await self.backend.aget(match)
+                if value is not None:
+                    self._count("semantic_hits")
+                    return value
+                # Backend already evicted the entry; keep the index in step
+                self._index.remove(match)
+
+        self._count("misses")
+        return None
+
+    async def set(self, namespace: str, message: str, mode: str, value: Any, **fields):
+        """Store a response under its exact key and index it for near-duplicates"""
+        if not self.is_enabled_for(mode):
+            return
+
+        scope = self._scope(namespace, dict(fields, mode=mode))
+        key = self._key(scope, exact_text(message))
+        await self.backend.aset(key, value, self.ttl)
+        if self._index is not None:
+            self._index.add(scope, key, normalize_text(message))
+
+    def clear(self):
+        """Drop every cached response"""
+        self.backend.clear()
+        if self._index is not None:
+            self._index = _ShingleIndex(self._index.max_entries)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the hit rate"""
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+
+def create_redis_backend(url: str, prefix: str, required: bool = False) -> Optional[RedisCacheBackend]:
+    """
+    Redis backend under ``prefix``, or None if the client cannot be created.
+
+    With ``required`` (an explicitly configured shared store) a client that
+    cannot be created raises instead of quietly falling back to memory.
+    """
+    try:
+        return RedisCacheBackend(url, prefix=prefix)
+    except Exception as e:
+        if required:
+            raise RuntimeError(f"SHARED_STORE_URL is set but the Redis store cannot be used: {e}") from e
+        logger.warning("Redis store unavailable (%s), falling back to memory", e, extra={"prefix": prefix})
+        return None
+
+
+def create_response_cache(settings) -> ResponseCache:
+    """Build the response cache described by the application settings"""
+    backend = None
+    # A shared store puts every worker's responses in one cache
+    if settings.shared_store_url:
+        backend = create_redis_backend(settings.shared_store_url, "respcache:", required=True)
+    elif settings.response_cache_backend == "redis":
+        backend = create_redis_backend(settings.response_cache_redis_url, "respcache:")
+    return ResponseCache(
+        backend=backend if backend is not None else InMemoryCacheBackend(settings.response_cache_max_entries),
+        ttl=settings.response_cache_ttl,
+        max_entries=settings.response_cache_max_entries,
+        semantic=settings.response_cache_semantic,
+        similarity_threshold=settings.response_cache_similarity,
+        disabled_modes=settings.response_cache_disabled_modes.split(","),
+        enabled=settings.response_cache_enabled
+    )
@@ -0,0 +1,323 @@
+from typing import List, Optional
+import json
+import re
+from pydantic import ValidationError
+from models import Roadmap, RoadmapModule
+
+# Gemini response_schema for constrained JSON output
+ROADMAP_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "title": {"type": "STRING"},
+        "description": {"type": "STRING"},
+        "modules": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "id": {"type": "INTEGER"},
+                    "title": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                    "topics": {"type": "ARRAY", "items": {"type": "STRING"}},
+                    "duration": {"type": "STRING"},
+                    "difficulty": {"type": "STRING", "enum": ["Beginner", "Intermediate", "Advanced"]},
+                    "prerequisites": {"type": "ARRAY", "items": {"type": "INTEGER"}},
+                },
+                "required": ["id", "title", "description", "topics", "duration", "difficulty", "prerequisites"],
+            },
+        },
+    },
+    "required": ["title", "description", "modules"],
+}
+
+TOPIC_KEYWORDS = ['roadmap for', 'learning path for', 'study plan for', 'roadmap to learn', 'roadmap', 'learning path']
+
+
+def extract_topic(message: str) -> str:
+    """Pull the roadmap topic out of a request like "roadmap for rust" """
+    topic = message.lower()
+    for keyword in TOPIC_KEYWORDS:
+        if keyword in topic:
+            topic = topic.split(keyword)[-1].strip()
+            break
+
+    # Clean up topic
+    topic = topic.replace('?', '').replace('.', '').strip()
+    return topic or "programming"
+
+
+# Topics pre-generated by pregenerate_roadmaps.py, most requested first
+POPULAR_ROADMAP_TOPICS = [
+    "python", "web development", "data science", "javascript", "machine learning",
+    "java", "react", "frontend development", "backend development", "full stack development",
+    "devops", "cloud computing", "cybersecurity", "artificial intelligence", "deep learning",
+    "sql", "typescript", "node.js", "go", "rust",
+    "c++", "c#", "kotlin", "swift", "android development",
+    "ios development", "docker", "kubernetes", "aws", "data engineering",
+    "data structures and algorithms", "system design", "blockchain", "game development", "ui ux design",
+    "flutter", "django", "spring boot", "angular", "vue",
+    "php", "ruby", "linux", "git", "mobile development",
+    "computer vision", "natural language processing", "data analysis", "excel", "power bi",
+]
+
+# Spellings that should share one catalog entry
+TOPIC_ALIASES = {
+    "js": "javascript", "ts": "typescript", "py": "python", "python3": "python",
+    "golang": "go", "cpp": "c++", "csharp": "c#", "k8s": "kubernetes",
+    "ml": "machine learning", "ai": "artificial intelligence", "dl": "deep learning",
+    "nlp": "natural language processing", "cv": "computer vision", "ds": "data science",
+    "dsa": "data structures and algorithms", "data structures": "data structures and algorithms",
+    "algorithms": "data structures and algorithms", "web dev": "web development",
+    "webdev": "web development", "web": "web development", "frontend": "frontend development",
+    "front end": "frontend development", "front end development": "frontend development",
+    "backend": "backend development", "back end": "backend development",
+    "back end development": "backend development", "full stack": "full stack development",
+    "fullstack": "full stack development", "fullstack development": "full stack development",
+    "reactjs": "react", "react.js": "react", "vuejs": "vue", "vue.js": "vue",
+    "angularjs": "angular", "node": "node.js", "nodejs": "node.js", "node js": "node.js",
+    "amazon web services": "aws",
+    "ux": "ui ux design", "ui/ux": "ui ux design", "ui ux": "ui ux design", "ui/ux design": "ui ux design",
+    "android": "android development", "ios": "ios development", "security": "cybersecurity",
+    "cyber security": "cybersecurity", "game dev": "game development", "spring": "spring boot",
+}
+
+# Words that do not change what the roadmap is about
+TOPIC_FILLER = {
+    "a", "an", "the", "to", "in", "on", "of", "for", "me", "my", "please", "become", "becoming",
+    "learn", "master", "mastering", "complete", "comprehensive", "beginner",
+    "beginners", "from", "scratch", "zero", "hero", "path", "guide", "course", "developer",
+    "engineer", "create", "make", "generate", "show", "give", "i", "want", "how",
+}
+
+_TOPIC_CLEAN = re.compile(r"[^\w\s.+#/-]")
+
+
+def normalize_topic(topic: str) -> str:
+    """Canonical form of a roadmap topic, so spellings of one subject share a cache entry"""
+    text = _TOPIC_CLEAN.sub(" ", topic.lower()).replace("-", " ")
+    words = [w.strip("./") for w in text.split()]
+    phrase = " ".join(w for w in words if w and w not in TOPIC_FILLER)
+    return TOPIC_ALIASES.get(phrase, phrase) or "programming"
+
+
+def roadmap_request(topic: str) -> str:
+    """User turn asking for a roadmap; the rules live in the roadmap_json system prompt"""
+    return (
+        f"Generate a comprehensive learning roadmap for: {topic}\n"
+        f"Title: \"Complete {topic.title()} Learning Path\"\n"
+        f"Description: \"A comprehensive guide to mastering {topic}\""
+    )
+
+
+def _trim_trailing_comma(out: List[str]):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_json(text: str) -> str:
+    """
+    Make almost-valid model JSON parseable without another generation.
+
+    Skips prose or code fences around the object, drops trailing commas,
+    escapes raw newlines inside strings, fixes mismatched closing brackets
+    and, for output cut off mid-way, truncates back to the last complete
+    object or array and closes whatever is still open.
+    """
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object in response")
+
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escaped = False
+    last_safe = None
+    for ch in text[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch == "{" or ch == "[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch == "}" or ch == "]":
+            if not stack:
+                break
+            _trim_trailing_comma(out)
+            out.append(stack.pop())
+            if not stack:
+                return "".join(out)
+            last_safe = (len(out), list(stack))
+        else:
+            out.append(ch)
+
+    # Cut off mid-way: keep everything up to the last completed container
+    if last_safe is None:
+        raise ValueError("Truncated JSON could not be repaired")
+    length, stack = last_safe
+    del out[length:]
+    for closer in reversed(stack):
+        _trim_trailing_comma(out)
+        out.append(closer)
+    return "".join(out)
+
+
+def _validate(data) -> Roadmap:
+    if isinstance(data, dict) and "modules" not in data and len(data) == 1:
+        # {"roadmap": {...}} style wrappers
+        data = next(iter(data.values()))
+    if not isinstance(data, dict):
+        raise ValueError("Roadmap JSON is not an object")
+
+    modules = []
+    for item in data.get("modules") or []:
+        try:
+            modules.append(RoadmapModule.model_validate(item))
+        except ValidationError:
+            # Drop a malformed (usually truncated) module rather than the roadmap
+            continue
+    try:
+        return Roadmap(
+            title=data.get("title") or "Learning Roadmap",
+            description=data.get("description") or "",
+            modules=modules
+        )
+    except ValidationError as e:
+        raise ValueError(f"Invalid roadmap structure: {e.errors()[0]['msg']}")
+
+
+def parse_roadmap(text: str) -> Roadmap:
+    """Parse and validate a roadmap, repairing the JSON locally if needed"""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = json.loads(repair_json(text))
+    return _validate(data)
+
+
+def format_roadmap_message(roadmap: Roadmap) -> str:
+    """Wrap a roadmap in the ```json block the frontend renders"""
+    return f"```json\n{json.dumps(roadmap.model_dump(), indent=2)}\n```"
+
+
+def fallback_roadmap(topic: str) -> Roadmap:
+    """Basic roadmap returned when generation fails"""
+    return Roadmap(
+        title=f"Learning Path for {topic.title()}",
+        description="An error occurred generating the roadmap. Here's a basic structure.",
+        modules=[
+            RoadmapModule(
+                id=1,
+                title="Introduction",
+                description=f"Getting started with {topic}",
+                topics=["Fundamentals", "Core concepts", "Basic setup"],
+                duration="2 weeks",
+                difficulty="Beginner",
+                prerequisites=[]
+            ),
+            RoadmapModule(
+                id=2,
+                title="Intermediate Skills",
+                description=f"Building your {topic} knowledge",
+                topics=["Advanced features", "Best practices", "Real-world applications"],
+                duration="3 weeks",
+                difficulty="Intermediate",
+                prerequisites=[1]
+            ),
+            RoadmapModule(
+                id=3,
+                title="Advanced Topics",
+                description=f"Mastering {topic}",
+                topics=["Expert techniques", "Optimization", "Production deployment"],
+                duration="4 weeks",
+                difficulty="Advanced",
+                prerequisites=[2]
+            ),
+        ]
+    )
+
+
+class ModuleStreamParser:
+    """
+    Picks complete modules out of a roadmap while its JSON is streaming.
+
+    Tracks string and nesting state across chunks; each object that closes
+    directly inside the top-level ``modules`` array is parsed and validated
+    as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self._buf: List[str] = []
+        self._length = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_key: Optional[str] = None
+        self._in_modules = False
+        self._module_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[RoadmapModule]:
+        """Consume a chunk and return modules it completed"""
+        modules = []
+        self._buf.append(chunk)
+        offset = self._length
+        self._length += len(chunk)
+        text = None
+
+        for i, ch in enumerate(chunk):
+            pos = offset + i
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        text = text or self._text()
+                        self._last_key = text[self._string_start + 1:pos]
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif ch == "{" or ch == "[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._last_key == "modules":
+                    self._in_modules = True
+                elif ch == "{" and self._depth == 3 and self._in_modules:
+                    self._module_start = pos
+            elif ch == "}" or ch == "]":
+                if ch == "}" and self._depth == 3 and self._module_start is not None:
+                    text = self._text()
+                    module = self._module(text[self._module_start:pos + 1])
+                    if module is not None:
+                        modules.append(module)
+                    self._module_start = None
+                elif ch == "]" and self._depth == 2:
+                    self._in_modules = False
+                self._depth -= 1
+        return modules
+
+    def _text(self) -> str:
+        if len(self._buf) > 1:
+            self._buf = ["".join(self._buf)]
+        return self._buf[0]
+
+    @staticmethod
+    def _module(raw: str) -> Optional[RoadmapModule]:
+        try:
+            return RoadmapModule.model_validate_json(raw)
+        except ValidationError:
+            return None
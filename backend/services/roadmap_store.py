@@ -0,0 +1,203 @@
+from datetime import datetime
+from typing import Dict, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from models import Roadmap
+from services.response_cache import InMemoryCacheBackend, create_redis_backend
+
+logger = logging.getLogger(__name__)
+
+
+def roadmap_key(topic: str, prompt_version: str) -> str:
+    """Document id for a (topic, prompt version) catalog entry"""
+    raw = f"{topic}\x1f{prompt_version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:40]
+
+
+class FileRoadmapBackend:
+    """
+    Roadmap catalog kept in a local JSON file.
+
+    Suited to a catalog pre-generated at build time and shipped with the
+    image; entries added at runtime are written back atomically. Each
+    process keeps its own copy, so with several workers use the redis or
+    firestore backend for runtime additions.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: Optional[Dict[str, dict]] = None
+        self._lock = asyncio.Lock()
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning("Could not read roadmap catalog %s: %s", self.path, e)
+            return {}
+
+    def _load(self) -> Dict[str, dict]:
+        if self._data is None:
+            self._data = self._read()
+        return self._data
+
+    async def _loaded(self) -> Dict[str, dict]:
+        # The first read parses the whole catalog; keep it off the event loop
+        if self._data is None:
+            data = await asyncio.get_running_loop().run_in_executor(None, self._read)
+            if self._data is None:
+                self._data = data
+        return self._data
+
+    def _write(self, data: Dict[str, dict]):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    async def get(self, key: str) -> Optional[dict]:
+        return (await self._loaded()).get(key)
+
+    async def put(self, key: str, entry: dict):
+        async with self._lock:
+            data = await self._loaded()
+            data[key] = entry
+            snapshot = dict(data)
+            await asyncio.get_running_loop().run_in_executor(None, self._write, snapshot)
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+
+class FirestoreRoadmapBackend:
+    """Roadmap catalog in the Firestore ``roadmap_catalog`` collection"""
+
+    def __init__(self, firebase):
+        self.firebase = firebase
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await self.firebase.get_roadmap(key)
+
+    async def put(self, key: str, entry: dict):
+        await self.firebase.save_roadmap(key, entry)
+
+
+class RedisRoadmapBackend:
+    """Roadmap catalog in Redis, shared by every worker process"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await self.cache.aget(key)
+
+    async def put(self, key: str, entry: dict):
+        await self.cache.aset(key, entry)
+
+
+class RoadmapStore:
+    """
+    Persistent roadmap catalog keyed by (topic, prompt version).
+
+    Topics are expected in canonical form (``normalize_topic``). Lookups hit
+    an in-process LRU first and fall through to the persistent backend;
+    bumping the roadmap prompt version naturally misses old entries.
+    """
+
+    def __init__(self, backend, max_entries: int = 512):
+        self.backend = backend
+        self._memory = InMemoryCacheBackend(max_entries)
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    async def get(self, topic: str, prompt_version: str) -> Optional[Roadmap]:
+        """Return the stored roadmap, or None on a miss"""
+        key = roadmap_key(topic, prompt_version)
+        roadmap = self._memory.get(key)
+        if roadmap is not None:
+            self.hits += 1
+            self.memory_hits += 1
+            return roadmap
+
+        entry = None
+        if self.backend is not None:
+            try:
+                entry = await self.backend.get(key)
+            except Exception as e:
+                logger.warning("Roadmap store read failed: %s", e)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        try:
+            roadmap = Roadmap.model_validate(entry["roadmap"])
+        except Exception as e:
+            logger.warning("Ignoring invalid stored roadmap: %s", e, extra={"topic": topic})
+            self.misses += 1
+            return None
+        self._memory.set(key, roadmap)
+        self.hits += 1
+        return roadmap
+
+    async def put(self, topic: str, prompt_version: str, roadmap: Roadmap):
+        """Store a generated roadmap; failures are logged, never raised"""
+        key = roadmap_key(topic, prompt_version)
+        self._memory.set(key, roadmap)
+        if self.backend is None:
+            return
+        entry = {
+            "topic": topic,
+            "prompt_version": prompt_version,
+            "generated_at": datetime.now().isoformat(),
+            "roadmap": roadmap.model_dump(),
+        }
+        try:
+            await self.backend.put(key, entry)
+            self.writes += 1
+        except Exception as e:
+            logger.warning("Roadmap store write failed: %s", e)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def create_roadmap_store(settings, firebase) -> RoadmapStore:
+    """Build the roadmap store described by the application settings"""
+    backend = None
+    kind = settings.roadmap_store_backend
+    if kind == "auto":
+        if firebase.db is not None:
+            kind = "firestore"
+        else:
+            kind = "redis" if settings.shared_store_url else "file"
+    if kind == "firestore":
+        if firebase.db is None:
+            logger.warning("Firestore roadmap store requested but Firebase is not configured, using memory only")
+        else:
+            backend = FirestoreRoadmapBackend(firebase)
+    elif kind == "redis":
+        if settings.shared_store_url:
+            cache = create_redis_backend(settings.shared_store_url, "roadmap:", required=True)
+        else:
+            cache = create_redis_backend(settings.response_cache_redis_url, "roadmap:")
+        if cache is not None:
+            backend = RedisRoadmapBackend(cache)
+    elif kind == "file":
+        backend = FileRoadmapBackend(str(settings.roadmap_catalog_full_path))
+    return RoadmapStore(backend, max_entries=settings.roadmap_store_max_entries)
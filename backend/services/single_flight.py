@@ -0,0 +1,154 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+import asyncio
+
+
+class _StreamFlight:
+    """Replay buffer shared by every subscriber of one upstream stream"""
+
+    def __init__(self, max_ahead: int = 32):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.max_ahead = max(1, max_ahead)
+        # Highest chunk index any subscriber has taken; paces the producer
+        self.consumed = 0
+        self._changed = asyncio.Event()
+        self._drained = asyncio.Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_room(self):
+        """Block the producer while it is ``max_ahead`` chunks ahead of the fastest subscriber"""
+        while self.subscribers and len(self.chunks) - self.consumed >= self.max_ahead:
+            self._drained.clear()
+            await self._drained.wait()
+
+    def _advance(self, index: int):
+        if index > self.consumed:
+            self.consumed = index
+            self._drained.set()
+
+    def push(self, chunk: Any):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def follow(self) -> AsyncIterator[Any]:
+        """Replay chunks emitted so far, then follow the live stream"""
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+                self._advance(index)
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one upstream call.
+
+    ``do`` runs the coroutine once per key while it is in flight and hands
+    the same result (or exception) to every caller. ``stream`` does the same
+    for async generators: the first caller starts the upstream stream, and
+    late joiners replay the chunks already emitted before following along.
+    The shared work runs in its own task, so a caller going away does not
+    cancel it for the others; once the last subscriber of a stream leaves,
+    the upstream stream is cancelled. A stream's producer runs at most
+    ``max_ahead`` chunks ahead of its fastest subscriber.
+    """
+
+    def __init__(self, enabled: bool = True, max_ahead: int = 32):
+        self.enabled = enabled
+        self.max_ahead = max_ahead
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, _StreamFlight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.stream_leaders = 0
+        self.stream_coalesced = 0
+        self.stream_cancelled = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``fn`` once for all concurrent callers with the same key"""
+        if not self.enabled:
+            return await fn()
+
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _t, k=key: self._calls.pop(k, None))
+        return await asyncio.shield(task)
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Fan one upstream async generator out to all concurrent subscribers"""
+        if not self.enabled:
+            async for chunk in fn():
+                yield chunk
+            return
+
+        flight = self._streams.get(key)
+        if flight is not None:
+            self.stream_coalesced += 1
+        else:
+            self.stream_leaders += 1
+            flight = _StreamFlight(self.max_ahead)
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._produce(key, flight, fn))
+
+        flight.subscribers += 1
+        try:
+            async for chunk in flight.follow():
+                yield chunk
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done and flight.task is not None:
+                # Nobody is listening any more: stop pulling from upstream, and
+                # make sure new callers start a fresh stream rather than join this one
+                self.stream_cancelled += 1
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+                flight.task.cancel()
+
+    async def _produce(self, key: Hashable, flight: _StreamFlight, fn: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for chunk in fn():
+                await flight.wait_for_room()
+                flight.push(chunk)
+            flight.finish()
+        except BaseException as e:
+            flight.finish(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            # Late arrivals after completion start fresh (or hit the response cache)
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    def stats(self) -> dict:
+        """Return coalescing counters and in-flight counts"""
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "stream_leaders": self.stream_leaders,
+            "stream_coalesced": self.stream_coalesced,
+            "stream_cancelled": self.stream_cancelled,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
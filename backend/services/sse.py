@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
+import json
+import time
+import uuid
+from config import settings
+
+try:
+    import orjson  # optional, several times faster for the per-frame encode
+except ImportError:
+    orjson = None
+
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+DONE_DATA = b"[DONE]"
+
+
+def dumps(obj) -> bytes:
+    """Encode a frame payload as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def format_event(data: bytes, event_id: Optional[str] = None, event: Optional[str] = None) -> bytes:
+    """Frame one server-sent event; ``data`` must not contain newlines"""
+    head = b""
+    if event_id is not None:
+        head += b"id: " + event_id.encode("ascii") + b"\n"
+    if event is not None:
+        head += b"event: " + event.encode("ascii") + b"\n"
+    return head + b"data: " + data + b"\n\n"
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Split a ``<stream id>:<sequence>`` event id, or return None if malformed"""
+    if not value:
+        return None
+    stream_id, _, seq = value.strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+class ReplayStream:
+    """
+    Frames of one SSE stream, kept so a reconnecting client can resume.
+
+    Generation writes into the stream independently of the connections
+    reading it. When the last reader goes away, the stream counts as
+    disconnected only after ``grace`` seconds without a new reader, so a
+    client that reconnects in time resumes a complete reply.
+    """
+
+    def __init__(self, stream_id: str, owner: Optional[str] = None, grace: float = 0.0):
+        self.id = stream_id
+        self.owner = owner
+        self.grace = grace
+        self.frames: List[bytes] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._followers = 0
+        self._detached_since = time.monotonic()
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def event(self, data: bytes, event: Optional[str] = None) -> bytes:
+        """Frame ``data`` with the next event id and record it for replay"""
+        frame = format_event(data, f"{self.id}:{len(self.frames) + 1}", event)
+        self.frames.append(frame)
+        self._notify()
+        return frame
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    async def is_disconnected(self) -> bool:
+        """True once nobody has followed the stream for ``grace`` seconds"""
+        return self._followers == 0 and time.monotonic() - self._detached_since > self.grace
+
+    async def follow(self, after: int = 0, heartbeat: float = 0.0) -> AsyncIterator[bytes]:
+        """
+        Replay frames after sequence number ``after``, then follow the live
+        stream, sending a keep-alive comment after ``heartbeat`` idle seconds
+        """
+        index = max(0, after)
+        self._followers += 1
+        try:
+            while True:
+                changed = self._changed
+                while index < len(self.frames):
+                    yield self.frames[index]
+                    index += 1
+                if self.done:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=heartbeat or None)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT_FRAME
+        finally:
+            self._followers -= 1
+            if self._followers == 0:
+                self._detached_since = time.monotonic()
+
+
+class ReplayStore:
+    """
+    Short-lived per-stream replay buffers for ``Last-Event-ID`` resumption.
+
+    Streams are kept while live and for ``ttl`` seconds after they finish;
+    beyond ``max_streams`` the oldest are dropped first. A live stream keeps
+    generating for ``grace`` seconds after its last reader disconnects, long
+    enough for a reconnect but short enough that an abandoned stream stops
+    spending upstream tokens soon after. Streams
+    are bound to the user who started them and live in this process only,
+    so with several workers a resume reaching another worker gets a 410.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_streams: int = 1000, grace: float = 5.0):
+        self.ttl = ttl
+        self.grace = grace
+        self.max_streams = max(1, max_streams)
+        self._streams: "OrderedDict[str, ReplayStream]" = OrderedDict()
+        self.resumes = 0
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [
+            sid for sid, stream in self._streams.items()
+            if stream.done and now - stream.finished_at > self.ttl
+        ]
+        for sid in expired:
+            del self._streams[sid]
+        while len(self._streams) > self.max_streams:
+            self._streams.popitem(last=False)
+
+    def create(self, owner: Optional[str] = None) -> ReplayStream:
+        """Register a new stream for ``owner`` (a user id, None when anonymous)"""
+        stream = ReplayStream(uuid.uuid4().hex, owner=owner, grace=self.grace)
+        self._streams[stream.id] = stream
+        self._prune()
+        return stream
+
+    def get(self, stream_id: str, owner: Optional[str] = None) -> Optional[ReplayStream]:
+        """Return a stream that can still be resumed by ``owner``"""
+        self._prune()
+        stream = self._streams.get(stream_id)
+        if stream is not None and stream.owner != owner:
+            return None
+        if stream is not None:
+            self.resumes += 1
+        return stream
+
+    def stats(self) -> dict:
+        """Return buffered stream counts"""
+        return {
+            "streams": len(self._streams),
+            "live": sum(1 for s in self._streams.values() if not s.done),
+            "resumes": self.resumes,
+        }
+
+
+# Singleton instance
+sse_replay = ReplayStore(
+    ttl=settings.sse_replay_ttl,
+    max_streams=settings.sse_replay_max_streams,
+    grace=settings.sse_resume_grace
+)
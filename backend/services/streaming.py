@@ -0,0 +1,182 @@
+from typing import Any, AsyncIterator, Optional
+import asyncio
+from services.context_builder import estimate_tokens
+
+_END = object()
+# Yielded by stream_until_disconnect when a keep-alive is due
+HEARTBEAT = object()
+
+
+class StreamEvent:
+    """A named, structured event sent alongside streamed text"""
+
+    __slots__ = ("name", "data")
+
+    def __init__(self, name: str, data: dict):
+        self.name = name
+        self.data = data
+
+
+class StreamMetrics:
+    """Counters for streamed responses and streams abandoned by clients"""
+
+    def __init__(self):
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.client_disconnects = 0
+        self.upstream_cancelled = 0
+        self.tokens_streamed = 0
+        self.tokens_saved = 0
+
+    def record_upstream_cancelled(self, emitted_tokens: int, max_tokens: int):
+        """
+        Count an upstream stream closed before it finished.
+
+        ``tokens_saved`` is an upper bound: the output budget left unspent
+        when the stream was closed.
+        """
+        self.upstream_cancelled += 1
+        self.tokens_saved += max(0, max_tokens - emitted_tokens)
+
+    def stats(self) -> dict:
+        """Return stream counters"""
+        return {
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "client_disconnects": self.client_disconnects,
+            "upstream_cancelled": self.upstream_cancelled,
+            "active": self.started - self.completed - self.failed - self.client_disconnects,
+            "tokens_streamed": self.tokens_streamed,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+async def _coalesce(queue: asyncio.Queue, first: str, max_bytes: int, deadline: float):
+    """
+    Join ``first`` with whatever text arrives before ``deadline`` or until
+    ``max_bytes`` is reached. Returns the joined text and any non-text item
+    (event, end marker or error) that has to be handled next.
+    """
+    loop = asyncio.get_running_loop()
+    parts = [first]
+    size = len(first.encode("utf-8"))
+    while size < max_bytes:
+        try:
+            item = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+        if not isinstance(item, str):
+            return "".join(parts), item
+        parts.append(item)
+        size += len(item.encode("utf-8"))
+    return "".join(parts), None
+
+
+async def stream_until_disconnect(
+    request,
+    chunks: AsyncIterator[str],
+    metrics: Optional[StreamMetrics] = None,
+    queue_size: int = 32,
+    poll_interval: float = 0.5,
+    coalesce_bytes: int = 0,
+    coalesce_interval: float = 0.0,
+    heartbeat_interval: float = 0.0
+) -> AsyncIterator[Any]:
+    """
+    Relay ``chunks`` to a streaming response until the client goes away.
+
+    A pump task reads upstream into a bounded queue, so at most
+    ``queue_size`` chunks are buffered ahead of a slow client before the
+    pump stops reading (and the upstream connection stops being drained).
+    The client is checked with ``request.is_disconnected()`` after every
+    chunk and every ``poll_interval`` seconds while upstream is quiet. On
+    disconnect, or if the response itself is cancelled, the pump task is
+    cancelled, which closes the upstream stream.
+
+    With ``coalesce_bytes`` and ``coalesce_interval`` set, chunks after the
+    first are joined until either limit is hit, so tiny upstream chunks
+    become fewer, larger frames. ``StreamEvent`` items pass through in order. With ``heartbeat_interval`` set,
+    ``HEARTBEAT`` is yielded whenever nothing has been sent for that long.
+    """
+    metrics = metrics or StreamMetrics()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+    coalesce = coalesce_bytes > 0 and coalesce_interval > 0
+
+    async def pump():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+            await queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            # Cancelled while waiting on a full queue: close upstream explicitly
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    loop = asyncio.get_running_loop()
+    metrics.started += 1
+    task = asyncio.ensure_future(pump())
+    outcome = None
+    pending = None
+    sent_any = False
+    last_sent = loop.time()
+    try:
+        while True:
+            if pending is not None:
+                item, pending = pending, None
+            else:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        outcome = "disconnected"
+                        return
+                    if heartbeat_interval and loop.time() - last_sent >= heartbeat_interval:
+                        last_sent = loop.time()
+                        yield HEARTBEAT
+                    continue
+
+            if item is _END:
+                outcome = "completed"
+                return
+            if isinstance(item, Exception):
+                outcome = "failed"
+                raise item
+
+            if isinstance(item, str):
+                # The first chunk goes out at once so coalescing never delays it
+                if coalesce and sent_any:
+                    item, pending = await _coalesce(queue, item, coalesce_bytes, loop.time() + coalesce_interval)
+                metrics.tokens_streamed += estimate_tokens(item)
+            yield item
+            sent_any = True
+            last_sent = loop.time()
+            if await request.is_disconnected():
+                outcome = "disconnected"
+                return
+    finally:
+        if outcome == "completed":
+            metrics.completed += 1
+        elif outcome == "failed":
+            metrics.failed += 1
+        else:
+            # Client went away, or the server cancelled the response mid-stream
+            metrics.client_disconnects += 1
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
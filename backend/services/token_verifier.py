@@ -0,0 +1,208 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+import hashlib
+import logging
+import re
+import threading
+import time
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Public certificates used to sign Firebase ID tokens
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class PublicKeyCache:
+    """
+    Process-wide cache of the Firebase signing certificates.
+
+    Certificates are fetched once and reused until the ``Cache-Control``
+    max-age of the response runs out. If a refresh fails, the previous set
+    keeps being served so a Google hiccup does not log everybody out.
+    """
+
+    def __init__(self, url: str = FIREBASE_CERTS_URL, default_max_age: int = 3600):
+        self.url = url
+        self.default_max_age = default_max_age
+        self._certs: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def _max_age(self, cache_control: Optional[str]) -> int:
+        match = _MAX_AGE_RE.search(cache_control or "")
+        return int(match.group(1)) if match else self.default_max_age
+
+    def get(self, force_refresh: bool = False) -> Dict[str, str]:
+        """Return the certificates keyed by key id, refreshing when expired"""
+        if self._certs and not force_refresh and time.time() < self._expires_at:
+            return self._certs
+
+        with self._lock:
+            now = time.time()
+            if self._certs and not force_refresh and now < self._expires_at:
+                return self._certs
+            try:
+                response = httpx.get(self.url, timeout=10.0)
+                response.raise_for_status()
+                self._certs = response.json()
+                self._expires_at = now + self._max_age(response.headers.get("cache-control"))
+                self.fetches += 1
+            except Exception:
+                if not self._certs:
+                    raise
+                logger.warning("Could not refresh Firebase public keys, using cached set")
+            return self._certs
+
+
+class TokenVerifier:
+    """
+    Verifies Firebase ID tokens and caches the decoded claims.
+
+    Claims are cached under a hash of the token (never the token itself) with
+    LRU eviction, and an entry never outlives the token's ``exp`` or
+    ``cache_ttl``. Signatures are checked locally against the cached
+    certificates. With ``check_revoked`` enabled, cache misses go through the
+    Admin SDK's revocation check instead, so a revoked session stops working
+    within ``cache_ttl`` seconds. An optional ``shared`` cache backend (Redis)
+    sits behind the LRU so a token verified by one worker is known to all.
+    """
+
+    def __init__(
+        self,
+        project_id_fn: Callable[[], Optional[str]],
+        revoked_check_fn: Optional[Callable[[str], dict]] = None,
+        key_cache: Optional[PublicKeyCache] = None,
+        cache_size: int = 10000,
+        cache_ttl: float = 300.0,
+        check_revoked: bool = False,
+        clock_skew: int = 5,
+        shared=None
+    ):
+        self.project_id_fn = project_id_fn
+        self.revoked_check_fn = revoked_check_fn
+        self.key_cache = key_cache or PublicKeyCache()
+        self.cache_size = max(1, cache_size)
+        self.cache_ttl = cache_ttl
+        self.check_revoked = check_revoked
+        self.clock_skew = clock_skew
+        self.shared = shared
+        self._cache: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get_cached(self, token: str, shared: bool = True) -> Optional[dict]:
+        """
+        Return cached claims for a token, or None; never verifies.
+
+        ``shared=False`` only checks the in-process LRU, which is safe to call
+        on the event loop; the shared tier is a blocking network round-trip.
+        """
+        key = self._token_key(token)
+        with self._lock:
+            item = self._cache.get(key)
+            if item is not None:
+                expires_at, claims = item
+                if time.time() < expires_at:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return claims
+                del self._cache[key]
+
+        if self.shared is None or not shared:
+            return None
+        entry = self.shared.get(key)
+        if entry is None or time.time() >= entry["expires_at"]:
+            return None
+        self._store_local(key, entry["expires_at"], entry["claims"])
+        with self._lock:
+            self.hits += 1
+            self.shared_hits += 1
+        return entry["claims"]
+
+    def _store_local(self, key: str, expires_at: float, claims: dict):
+        with self._lock:
+            self._cache[key] = (expires_at, claims)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _store(self, token: str, claims: dict):
+        now = time.time()
+        expires_at = min(float(claims.get("exp", 0)), now + self.cache_ttl)
+        if expires_at <= now:
+            return
+        key = self._token_key(token)
+        self._store_local(key, expires_at, claims)
+        if self.shared is not None:
+            self.shared.set(key, {"expires_at": expires_at, "claims": claims}, ttl=expires_at - now)
+
+    def _decode(self, token: str, project_id: str) -> dict:
+        from google.auth import jwt
+        try:
+            claims = jwt.decode(
+                token,
+                certs=self.key_cache.get(),
+                audience=project_id,
+                clock_skew_in_seconds=self.clock_skew
+            )
+        except ValueError as e:
+            # Unknown key id usually means Google rotated keys before max-age ran out
+            if "Certificate for key id" not in str(e):
+                raise
+            claims = jwt.decode(
+                token,
+                certs=self.key_cache.get(force_refresh=True),
+                audience=project_id,
+                clock_skew_in_seconds=self.clock_skew
+            )
+
+        if claims.get("iss") != f"https://securetoken.google.com/{project_id}":
+            raise ValueError("Token has an invalid issuer")
+        subject = claims.get("sub")
+        if not subject or len(subject) > 128:
+            raise ValueError("Token has an invalid subject")
+        claims["uid"] = subject
+        return claims
+
+    def verify(self, token: str) -> Optional[dict]:
+        """Return the decoded claims for a valid token, or None"""
+        claims = self.get_cached(token)
+        if claims is not None:
+            return claims
+
+        with self._lock:
+            self.misses += 1
+        try:
+            if self.check_revoked and self.revoked_check_fn is not None:
+                claims = self.revoked_check_fn(token)
+            else:
+                project_id = self.project_id_fn()
+                if not project_id:
+                    raise ValueError("Firebase project id is not configured")
+                claims = self._decode(token, project_id)
+        except Exception as e:
+            logger.warning("Token verification error: %s", e)
+            return None
+
+        self._store(token, claims)
+        return claims
+
+    def stats(self) -> dict:
+        """Return cache size and hit/miss counters"""
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "key_fetches": self.key_cache.fetches,
+            }
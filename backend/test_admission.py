@@ -0,0 +1,142 @@
+"""Test script for admission control: per-key 429s, global 503s and Retry-After"""
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from services.admission import AdmissionController, OverloadedError
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def hold(controller: AdmissionController, key=None, release: asyncio.Event = None):
+    """Occupy one slot until ``release`` is set"""
+    async with controller.admit(key):
+        await release.wait()
+
+
+async def occupied(controller: AdmissionController, active: int):
+    """Wait until ``active`` slots are held"""
+    while controller.stats()["active"] < active:
+        await asyncio.sleep(0.001)
+
+
+async def rejection(controller: AdmissionController, key=None):
+    """Admit once; return (error, seconds until it was raised)"""
+    start = time.monotonic()
+    try:
+        async with controller.admit(key):
+            pass
+    except OverloadedError as e:
+        return e, time.monotonic() - start
+    return None, time.monotonic() - start
+
+
+def test_per_key_limit_is_429():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=10, per_key_concurrency=1, queue_timeout=0.05, retry_after=7)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(hold(controller, "key-a", release))
+        await occupied(controller, 1)
+        error, _ = await rejection(controller, "key-a")
+        assert error is not None and error.status_code == 429 and error.retry_after == 7
+        # Other keys and the server key are unaffected
+        assert (await rejection(controller, "key-b"))[0] is None
+        assert (await rejection(controller))[0] is None
+        release.set()
+        await holder
+        assert controller.stats()["tracked_keys"] == 0
+        assert controller.stats()["rejected"] == 1
+
+    run(scenario())
+
+
+def test_global_limit_is_503_after_queue_timeout():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, queue_timeout=0.1)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(hold(controller, release=release))
+        await occupied(controller, 1)
+        error, waited = await rejection(controller, "key-a")
+        assert error is not None and error.status_code == 503
+        # Queued for the timeout, then rejected
+        assert 0.09 <= waited < 0.5
+        release.set()
+        await holder
+        stats = controller.stats()
+        assert stats["active"] == 0 and stats["waiting"] == 0 and stats["tracked_keys"] == 0
+
+    run(scenario())
+
+
+def test_full_queue_rejects_at_once():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5.0)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(hold(controller, release=release))
+        await occupied(controller, 1)
+        waiter = asyncio.ensure_future(rejection(controller))
+        await asyncio.sleep(0.01)
+        assert controller.stats()["waiting"] == 1
+
+        error, waited = await rejection(controller)
+        assert error is not None and error.status_code == 503 and waited < 0.05
+        try:
+            controller.check_capacity()
+            assert False, "check_capacity should reject while the queue is full"
+        except OverloadedError:
+            pass
+
+        # The queued request gets the slot once it frees up
+        release.set()
+        await holder
+        assert (await waiter)[0] is None
+        controller.check_capacity()
+
+    run(scenario())
+
+
+def test_http_status_and_retry_after():
+    import httpx
+    import main
+    from services.model_pool import hash_api_key
+
+    async def scenario():
+        release = asyncio.Event()
+        holders = [
+            asyncio.ensure_future(hold(controller, hash_api_key("user-key"), release)),
+        ]
+        await occupied(controller, 1)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            busy_key = await client.post("/api/chat", json={"message": "admission test one", "api_key": "user-key"})
+            assert busy_key.status_code == 429
+            assert busy_key.headers["Retry-After"] == "3"
+
+            holders.append(asyncio.ensure_future(hold(controller, release=release)))
+            await occupied(controller, 2)
+            full = await client.post("/api/chat/stream", json={"message": "admission test two"})
+            assert full.status_code == 503
+            assert full.headers["Retry-After"] == "3"
+        release.set()
+        await asyncio.gather(*holders)
+
+    controller = AdmissionController(max_concurrency=2, per_key_concurrency=1, max_queue=0, queue_timeout=0.05, retry_after=3)
+    saved = main.ai_service.admission
+    main.ai_service.admission = controller
+    try:
+        run(scenario())
+    finally:
+        main.ai_service.admission = saved
+
+
+if __name__ == "__main__":
+    print("🧪 Testing admission control...")
+    print("-" * 50)
+    for test in (test_per_key_limit_is_429, test_global_limit_is_503_after_queue_timeout,
+                 test_full_queue_rejects_at_once, test_http_status_and_retry_after):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,84 @@
+"""Test script to verify the streaming code block parser against the old regex"""
+import random
+import re
+from services.code_blocks import BlockDelta, BlockEnd, BlockStart, FenceParser, extract_code_blocks
+
+LEGACY_PATTERN = r'```(\w+)?\n(.*?)```'
+
+# Responses the regex handles; the parser must agree on all of them
+CORPUS = [
+    "No code here at all.",
+    "```python\nprint('hi')\n```",
+    "Intro text.\n\n```javascript\nconst x = 1;\nconsole.log(x);\n```\n\nOutro.",
+    "Two blocks:\n```go\nfunc main() {}\n```\nand\n```rust\nfn main() {}\n```\n",
+    "Plain fence:\n```\nsome text\n```\n",
+    "Inline `code` and ``double`` ticks then\n```sql\nSELECT 1;\n```",
+    "Example:```python\nx = 1\n```",
+    "```json\n{\n  \"a\": [1, 2]\n}\n```",
+    "    ```bash\n    echo indented\n    ```\n",
+    "````python\nfour backticks\n```\n",
+    "```ts\nconst a = `template ${x}`;\n```",
+    "Inline ```js``` mention, then\n```python\nreal()\n```",
+    "```python3\nprint(3)\n```\ntext ``` more\n```c\nint x;\n```",
+    "```\n```",
+    "```python\n\n\n```",
+]
+
+# Cases the regex got wrong, with what the parser now returns
+IMPROVED = [
+    ("```c++\nint main() {}\n```", [{"language": "c++", "code": "int main() {}"}]),
+    ("```objective-c\n@interface A\n```", [{"language": "objective-c", "code": "@interface A"}]),
+    ("```python title=\"x.py\"\nx = 1\n```", [{"language": "python", "code": "x = 1"}]),
+    ("```python\r\nx = 1\r\n```", [{"language": "python", "code": "x = 1"}]),
+    ("Cut off:\n```python\ndef f():\n    return", [{"language": "python", "code": "def f():\n    return"}]),
+]
+
+
+def legacy_extract(text):
+    matches = re.findall(LEGACY_PATTERN, text, re.DOTALL)
+    return [{"language": lang or "text", "code": code.strip()} for lang, code in matches]
+
+
+def stream_extract(text, chunk_size):
+    parser = FenceParser()
+    for i in range(0, len(text), chunk_size):
+        parser.feed(text[i:i + chunk_size])
+    parser.close()
+    return [b.as_dict() for b in parser.blocks]
+
+
+def test_matches_regex_on_corpus():
+    for text in CORPUS:
+        assert extract_code_blocks(text) == legacy_extract(text), text
+
+
+def test_chunking_does_not_change_results():
+    rng = random.Random(7)
+    for text, _ in [(t, None) for t in CORPUS] + IMPROVED:
+        expected = extract_code_blocks(text)
+        for size in (1, 2, 3, 5, rng.randint(1, 40)):
+            assert stream_extract(text, size) == expected, (text, size)
+
+
+def test_improved_cases():
+    for text, expected in IMPROVED:
+        assert extract_code_blocks(text) == expected, text
+    assert extract_code_blocks(IMPROVED[-1][0], include_unterminated=False) == []
+
+
+def test_events():
+    parser = FenceParser()
+    events = []
+    for ch in "Hi\n```py\nab\n```\n":
+        events.extend(parser.feed(ch))
+    assert isinstance(events[0], BlockStart) and events[0].language == "py"
+    assert isinstance(events[-1], BlockEnd) and events[-1].code == "ab" and events[-1].closed
+    assert "".join(e.text for e in events if isinstance(e, BlockDelta)) == "ab\n"
+
+
+if __name__ == "__main__":
+    print("🧪 Testing code block parser...")
+    print("-" * 50)
+    for test in (test_matches_regex_on_corpus, test_chunking_does_not_change_results, test_improved_cases, test_events):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,118 @@
+"""Test script for the Firestore persistence layer, run against the in-memory fake"""
+import asyncio
+import os
+import threading
+from datetime import datetime, timedelta
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from config import settings
+from fake_firestore import FakeFirestoreClient
+from firebase_config import FirebaseService
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def history_items(uid: str, count: int, tied: int = 0):
+    """(uid, document id, message) items; the last ``tied`` share one timestamp"""
+    items = []
+    for i in range(count):
+        stamp = START + timedelta(seconds=min(i, count - tied))
+        items.append((uid, f"doc{i:03d}", {"role": "user", "content": f"message {i}", "timestamp": stamp}))
+    return items
+
+
+def test_save_batch_for_several_users():
+    db = FakeFirestoreClient()
+    service = FirebaseService(db=db)
+    items = history_items("alice", 3) + history_items("bob", 2)
+    assert run(service.save_chat_messages_batch(items))
+    assert db.commits == 1
+    alice = run(service.get_chat_history("alice"))
+    assert [m["id"] for m in alice] == ["doc000", "doc001", "doc002"]
+    assert len(run(service.get_chat_history("bob"))) == 2
+    # Saving the same items again overwrites rather than duplicates
+    assert run(service.save_chat_messages_batch(items))
+    assert len(run(service.get_chat_history("alice"))) == 3
+
+    db.fail_next_commits = 1
+    assert not run(service.save_chat_messages_batch(history_items("carol", 1)))
+    assert run(service.get_chat_history("carol")) == []
+
+
+def test_history_pages():
+    service = FirebaseService(db=FakeFirestoreClient())
+    # Timestamp ties must not drop or repeat messages across page boundaries
+    run(service.save_chat_messages_batch(history_items("alice", 25, tied=6)))
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        messages, cursor = run(service.get_chat_history_page("alice", limit=10, cursor=cursor))
+        pages += 1
+        # Each page is chronological
+        assert [m["timestamp"] for m in messages] == sorted(m["timestamp"] for m in messages)
+        seen = messages + seen
+        if cursor is None:
+            break
+    assert pages == 3
+    assert [m["id"] for m in seen] == [f"doc{i:03d}" for i in range(25)]
+
+    try:
+        run(service.get_chat_history_page("alice", cursor="not-a-cursor"))
+        assert False, "a malformed cursor should raise"
+    except ValueError:
+        pass
+
+
+def test_stream_history():
+    service = FirebaseService(db=FakeFirestoreClient())
+    run(service.save_chat_messages_batch(history_items("alice", 250)))
+
+    async def collect():
+        return [m["id"] async for m in service.stream_chat_history("alice")]
+
+    ids = run(collect())
+    assert ids == [f"doc{i:03d}" for i in reversed(range(250))]
+
+
+def test_run_timeout_holds_permit_until_worker_returns():
+    service = FirebaseService(db=FakeFirestoreClient())
+    release = threading.Event()
+
+    def stuck():
+        release.wait(5)
+        return "late"
+
+    async def scenario():
+        service._semaphore = asyncio.Semaphore(1)
+        try:
+            await service._run(stuck)
+            assert False, "the call should time out"
+        except TimeoutError:
+            pass
+        # The worker thread is still busy, so its permit is still taken
+        assert service._semaphore.locked()
+        release.set()
+        await asyncio.sleep(0.1)
+        assert not service._semaphore.locked()
+        assert await service._run(lambda: "ok") == "ok"
+
+    timeout, settings.firestore_timeout = settings.firestore_timeout, 0.05
+    try:
+        run(scenario())
+    finally:
+        settings.firestore_timeout = timeout
+        service.close()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Firestore persistence...")
+    print("-" * 50)
+    for test in (test_save_batch_for_several_users, test_history_pages, test_stream_history,
+                 test_run_timeout_holds_permit_until_worker_returns):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,150 @@
+"""Test script for chat history deletion: paged deletes, failures and the 202 job endpoints"""
+import asyncio
+import os
+import threading
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from config import settings
+from fake_firestore import FakeFirestoreClient
+from firebase_config import MAX_BATCH_OPS, FirebaseService
+from services.history_jobs import HistoryDeletionJobs
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def seed(db: FakeFirestoreClient, uid: str, count: int):
+    batch = db.batch()
+    history = db.collection("users").document(uid).collection("chat_history")
+    for i in range(count):
+        if len(batch) == MAX_BATCH_OPS:
+            batch.commit()
+            batch = db.batch()
+        batch.set(history.document(f"doc{i:05d}"), {"content": f"message {i}"})
+    batch.commit()
+
+
+def stored(db: FakeFirestoreClient, uid: str) -> int:
+    return len(db.collection("users").document(uid).collection("chat_history").get())
+
+
+class FailingDeletes(FirebaseService):
+    """Fails the first delete batch and holds the others until released"""
+
+    def __init__(self, db):
+        super().__init__(db=db)
+        self.release = threading.Event()
+        self.failed = threading.Event()
+        self._lock = threading.Lock()
+        self.cancelled = 0
+
+    def _delete_documents_sync(self, references: list) -> int:
+        with self._lock:
+            first = not self.failed.is_set()
+            self.failed.set()
+        if first:
+            raise RuntimeError("Simulated batch failure")
+        self.release.wait(2)
+        return len(references)
+
+    async def _run(self, fn, *args, **kwargs):
+        try:
+            return await super()._run(fn, *args, **kwargs)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def test_paged_delete_completes():
+    db = FakeFirestoreClient()
+    seed(db, "alice", 3 * MAX_BATCH_OPS + 17)
+    seed(db, "bob", 3)
+    service = FirebaseService(db=db)
+    reported = []
+
+    assert run(service.delete_chat_history("alice", progress=reported.append))
+    assert stored(db, "alice") == 0
+    assert stored(db, "bob") == 3
+    assert reported[-1] == 3 * MAX_BATCH_OPS + 17
+    assert reported == sorted(reported)
+    service.close()
+
+
+def test_failing_batch_fails_job_and_cancels_in_flight():
+    db = FakeFirestoreClient()
+    seed(db, "alice", 6 * MAX_BATCH_OPS)
+    service = FailingDeletes(db)
+    jobs = HistoryDeletionJobs(service)
+
+    async def scenario():
+        job = await jobs.start("alice")
+        await asyncio.wait_for(job.task, timeout=5)
+        # Nothing from the failed deletion is left running on the loop
+        assert [t for t in asyncio.all_tasks() if t is not asyncio.current_task()] == []
+        return job
+
+    concurrency, settings.history_delete_concurrency = settings.history_delete_concurrency, 4
+    try:
+        job = run(scenario())
+    finally:
+        settings.history_delete_concurrency = concurrency
+        service.release.set()
+        service.close()
+    assert job.status == "failed" and job.error
+    assert job.to_dict()["finished_at"] is not None
+    # The three batches still committing when the first failed were cancelled
+    assert service.cancelled == 3
+
+
+def test_delete_endpoints_reuse_active_job():
+    import httpx
+    import main
+    from dependencies import get_current_user
+
+    db = FakeFirestoreClient(latency=0.01)
+    seed(db, "alice", 2 * MAX_BATCH_OPS)
+    service = FirebaseService(db=db)
+
+    async def current_user(authorization=None):
+        return {"uid": "alice"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.delete("/api/chat/history")
+            second = await client.delete("/api/chat/history")
+            assert first.status_code == 202 and second.status_code == 202
+            job_id = first.json()["job_id"]
+            # A second DELETE while the first is running returns the same job
+            assert second.json()["job_id"] == job_id
+
+            for _ in range(200):
+                status = (await client.get(f"/api/chat/history/delete/{job_id}")).json()
+                if status["status"] not in ("pending", "running"):
+                    break
+                await asyncio.sleep(0.02)
+            assert status["status"] == "completed" and status["deleted"] == 2 * MAX_BATCH_OPS
+            assert (await client.get("/api/chat/history/delete/unknown")).status_code == 404
+
+    saved = main.firebase_service.db, main.history_deletion_jobs
+    main.firebase_service.db = db
+    main.history_deletion_jobs = HistoryDeletionJobs(service)
+    main.app.dependency_overrides[get_current_user] = current_user
+    try:
+        run(scenario())
+    finally:
+        main.firebase_service.db, main.history_deletion_jobs = saved
+        main.app.dependency_overrides.pop(get_current_user, None)
+        service.close()
+    assert stored(db, "alice") == 0
+
+
+if __name__ == "__main__":
+    print("🧪 Testing chat history deletion...")
+    print("-" * 50)
+    for test in (test_paged_delete_completes, test_failing_batch_fails_job_and_cancels_in_flight,
+                 test_delete_endpoints_reuse_active_job):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,109 @@
+"""Test script for the write-behind chat history queue, run against the in-memory fake"""
+import asyncio
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from fake_firestore import FakeFirestoreClient
+from firebase_config import FirebaseService
+from services.history_writer import ChatHistoryWriter
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_writer(db: FakeFirestoreClient, **kwargs) -> ChatHistoryWriter:
+    kwargs.setdefault("retry_base_delay", 0.01)
+    return ChatHistoryWriter(FirebaseService(db=db), **kwargs)
+
+
+def enqueue(writer: ChatHistoryWriter, count: int, uid: str = "alice"):
+    for i in range(count):
+        assert writer.enqueue(uid, {"role": "user", "content": f"message {i}"})
+
+
+def stored(db: FakeFirestoreClient, uid: str = "alice") -> int:
+    return len(db.collection("users").document(uid).collection("chat_history").get())
+
+
+def test_flushes_full_batches_at_once():
+    db = FakeFirestoreClient()
+    writer = make_writer(db, batch_size=5, flush_interval=10.0)
+
+    async def scenario():
+        enqueue(writer, 12)
+        await asyncio.sleep(0.1)
+        # Two full batches went out without waiting for the interval
+        assert writer.written == 10 and writer.batches == 2
+        await writer.stop()
+
+    run(scenario())
+    assert stored(db) == 12 and writer.batches == 3
+
+
+def test_flushes_after_interval():
+    db = FakeFirestoreClient()
+    writer = make_writer(db, flush_interval=0.05)
+
+    async def scenario():
+        enqueue(writer, 2, "alice")
+        enqueue(writer, 1, "bob")
+        await asyncio.sleep(0.3)
+        # One batch for both users
+        assert writer.written == 3 and writer.batches == 1 and db.commits == 1
+        await writer.stop()
+
+    run(scenario())
+
+
+def test_stop_flushes_pending_writes():
+    db = FakeFirestoreClient()
+    writer = make_writer(db, flush_interval=10.0)
+
+    async def scenario():
+        enqueue(writer, 7)
+        await writer.stop(timeout=5)
+        assert not writer.enqueue("alice", {"content": "too late"})
+
+    run(scenario())
+    assert stored(db) == 7
+    assert writer.stats()["queue_depth"] == 0
+
+
+def test_retried_batch_does_not_duplicate():
+    db = FakeFirestoreClient()
+    # The first commit lands but reports a failure, like a timeout
+    db.lose_next_acks = 1
+    writer = make_writer(db, flush_interval=0.01)
+
+    async def scenario():
+        enqueue(writer, 4)
+        await writer.stop(timeout=5)
+
+    run(scenario())
+    assert writer.retries == 1 and writer.written == 4
+    assert stored(db) == 4
+
+
+def test_gives_up_after_retries():
+    db = FakeFirestoreClient()
+    db.fail_next_commits = 3
+    writer = make_writer(db, flush_interval=0.01, max_retries=2)
+
+    async def scenario():
+        enqueue(writer, 3)
+        await writer.stop(timeout=5)
+
+    run(scenario())
+    assert writer.retries == 2 and writer.failed == 3 and writer.written == 0
+    assert stored(db) == 0
+
+
+if __name__ == "__main__":
+    print("🧪 Testing chat history writer...")
+    print("-" * 50)
+    for test in (test_flushes_full_batches_at_once, test_flushes_after_interval, test_stop_flushes_pending_writes,
+                 test_retried_batch_does_not_duplicate, test_gives_up_after_retries):
+        test()
+        print(f"✅ {test.__name__}")
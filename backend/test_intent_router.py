@@ -0,0 +1,139 @@
+"""Test script to measure intent routing accuracy on a labelled message set"""
+from services.intent_router import IntentRouter, NaiveBayesClassifier
+
+# Messages as users type them, labelled with the handler that should serve them
+LABELLED = [
+    ("Create a roadmap to learn Python", "roadmap"),
+    ("Generate a learning path for web development", "roadmap"),
+    ("Show me a roadmap for data science", "roadmap"),
+    ("I need a study plan for the AWS certification", "roadmap"),
+    ("what should the curriculum for a devops bootcamp look like", "roadmap"),
+    ("Course outline for machine learning", "roadmap"),
+    ("give me a learning plan for rust", "roadmap"),
+    ("Roadmaps for becoming a backend engineer?", "roadmap"),
+    ("plan to learn kubernetes in 3 months", "roadmap"),
+    ("syllabus for an intro to algorithms class", "roadmap"),
+    ("Write a function to reverse a string", "code"),
+    ("write me a python script that renames files", "code"),
+    ("Create a class for a bank account", "code"),
+    ("implement quicksort in go", "code"),
+    ("generate code for a REST client", "code"),
+    ("code to read a csv in pandas", "code"),
+    ("Fix my code, it throws a KeyError", "code"),
+    ("debug this: TypeError undefined is not a function", "code"),
+    ("refactor this into smaller functions", "code"),
+    ("optimize this SQL query", "code"),
+    ("add unit tests for the parser", "code"),
+    ("an algorithm for detecting cycles in a graph", "code"),
+    ("build an api endpoint for user signup", "code"),
+    ("function that checks if a number is prime", "code"),
+    ("Explain recursion", "explain"),
+    ("What is a closure in JavaScript?", "explain"),
+    ("how does garbage collection work in java", "explain"),
+    ("Why does my float math give 0.30000000000000004", "explain"),
+    ("describe the CAP theorem", "explain"),
+    ("tell me about dependency injection", "explain"),
+    ("difference between a process and a thread", "explain"),
+    ("help me understand big O notation", "explain"),
+    ("define polymorphism", "explain"),
+    ("meaning of idempotent in REST", "explain"),
+    ("compare REST and GraphQL", "explain"),
+    ("what are python decorators", "explain"),
+    ("hi there", "chat"),
+    ("thanks!", "chat"),
+    ("good evening", "chat"),
+    ("you are awesome", "chat"),
+    ("can you help me with something", "chat"),
+    ("which laptop is best for coding", "chat"),
+    ("I'm feeling burnt out at work", "chat"),
+    ("recommend a podcast about startups", "chat"),
+    # No rule matches these; only the classifier gets them right
+    ("sort a list of tuples by the second item", "code"),
+    ("convert this loop to a list comprehension", "code"),
+    ("rust vs go for web servers", "explain"),
+]
+
+# Messages the old substring scan sent to the roadmap generator; they still must
+LEGACY_ROADMAP = [
+    "roadmap", "My Learning Roadmap please", "study roadmap for java", "learning paths?",
+    "course outlines for CS50", "CURRICULUM", "learning plan", "study plans",
+]
+
+# Must never trigger a JSON roadmap generation
+NOT_ROADMAP = [
+    "what is the timeline for python 4", "explain the learning rate in ml",
+    "write a road trip planner", "my study group meets tomorrow",
+]
+
+# Rules alone must reach this; the classifier must not make it worse
+MIN_ACCURACY = 0.9
+
+
+def accuracy(router, examples):
+    correct = sum(router.classify(text).intent == label for text, label in examples)
+    return correct / len(examples)
+
+
+def test_rule_accuracy():
+    router = IntentRouter()
+    misses = [(t, l, router.classify(t).intent) for t, l in LABELLED if router.classify(t).intent != l]
+    assert accuracy(router, LABELLED) >= MIN_ACCURACY, misses
+
+
+def test_classifier_does_not_hurt():
+    rules_only = accuracy(IntentRouter(), LABELLED)
+    with_classifier = accuracy(IntentRouter(classifier=NaiveBayesClassifier()), LABELLED)
+    assert with_classifier >= rules_only
+
+
+def test_roadmap_routing():
+    router = IntentRouter()
+    for text in LEGACY_ROADMAP:
+        assert router.route(text, "code") == "roadmap", text
+    for text in NOT_ROADMAP:
+        assert router.route(text, "code") == "code", text
+    # A classifier never routes to the roadmap generator
+    router = IntentRouter(classifier=NaiveBayesClassifier(LABELLED), min_confidence=0.0)
+    for text in NOT_ROADMAP:
+        assert router.classify(text).intent != "roadmap", text
+
+
+def test_resolve_uses_classifier_for_unmatched():
+    router = IntentRouter(classifier=NaiveBayesClassifier(), min_confidence=0.0)
+    # No mode, or the default one: the classifier routes unmatched messages
+    assert router.resolve("thanks, that helped a lot").intent == "chat"
+    assert router.resolve("thanks, that helped a lot", "code").source == "classifier"
+    # Rule matches keep the client's mode; roadmaps always go to the generator
+    assert router.resolve("explain closures", "code").intent == "code"
+    assert router.resolve("roadmap for rust", "chat").source == "rule"
+    assert IntentRouter().resolve("thanks, that helped a lot").intent == "code"
+
+
+def test_explicit_mode_beats_classifier():
+    router = IntentRouter(classifier=NaiveBayesClassifier(), min_confidence=0.0)
+    message = "reverse a linked list in python"
+    assert router.classify(message).source == "classifier"
+    assert router.classify(message).confidence > 0.9
+    for mode in ("chat", "explain"):
+        assert router.resolve(message, mode).intent == mode
+        assert router.resolve(message, mode).source == "client"
+
+
+def test_priority_and_register():
+    router = IntentRouter()
+    # Roadmap beats explain and code regardless of where it appears
+    assert router.classify("explain what a roadmap for rust would include").intent == "roadmap"
+    assert router.classify("implement this, then explain it").intent == "code"
+    router.register("translate", [r"\btranslate\b"])
+    assert router.classify("translate this to french").intent == "translate"
+    assert router.classify("translate this function to rust").intent == "code"
+
+
+if __name__ == "__main__":
+    print("🧪 Testing intent router...")
+    print("-" * 50)
+    print(f"📊 Rules: {accuracy(IntentRouter(), LABELLED):.1%} on {len(LABELLED)} labelled messages")
+    print(f"📊 Rules + classifier: {accuracy(IntentRouter(classifier=NaiveBayesClassifier()), LABELLED):.1%}")
+    for test in (test_rule_accuracy, test_classifier_does_not_hurt, test_roadmap_routing, test_resolve_uses_classifier_for_unmatched, test_explicit_mode_beats_classifier, test_priority_and_register):
+        test()
+        print(f"✅ {test.__name__}")
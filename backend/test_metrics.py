@@ -0,0 +1,66 @@
+"""Test script for the metrics registry and its multi-worker merge"""
+import re
+import tempfile
+
+from services.metrics import MetricsRegistry, merge_process_files, retire_process_file
+
+
+def sample(text: str, name: str) -> dict:
+    """Samples of one metric name, keyed by their label string"""
+    found = {}
+    for line in text.splitlines():
+        match = re.match(re.escape(name) + r"(\{.*\})? (\S+)$", line)
+        if match:
+            found[match.group(1) or ""] = float(match.group(2))
+    return found
+
+
+def worker_registry(requests: int, in_flight: int, latencies=()) -> MetricsRegistry:
+    registry = MetricsRegistry()
+    counter = registry.counter("app_requests_total", "Requests", ["route"])
+    counter.labels("/api/chat").inc(requests)
+    registry.gauge("app_in_flight", "In flight").set(in_flight)
+    histogram = registry.histogram("app_latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in latencies:
+        histogram.observe(value)
+    registry.add_collector("app_cache", "Cache", lambda: {"hits": requests, "hit_rate": 0.5}, counters=("hits",))
+    return registry
+
+
+def test_render():
+    text = worker_registry(3, 2, latencies=(0.05, 0.5)).render()
+    assert sample(text, "app_requests_total") == {'{route="/api/chat"}': 3}
+    assert sample(text, "app_latency_seconds_bucket") == {'{le="0.1"}': 1, '{le="1"}': 2, '{le="+Inf"}': 2}
+    assert sample(text, "app_cache_hits_total") == {"": 3}
+    assert "# TYPE app_cache_hit_rate gauge" in text
+
+
+def test_merge_across_workers():
+    with tempfile.TemporaryDirectory() as directory:
+        worker_registry(3, 2, latencies=(0.05,)).write_process_file(directory, pid=101)
+        worker_registry(4, 1, latencies=(0.5, 5.0)).write_process_file(directory, pid=102)
+        merged = merge_process_files(directory)
+        # Counters and histograms add up
+        assert sample(merged, "app_requests_total") == {'{route="/api/chat"}': 7}
+        assert sample(merged, "app_cache_hits_total") == {"": 7}
+        assert sample(merged, "app_latency_seconds_count") == {"": 3}
+        assert sample(merged, "app_latency_seconds_bucket")['{le="1"}'] == 2
+        # Gauges stay per worker
+        assert sample(merged, "app_in_flight") == {'{worker="101"}': 2, '{worker="102"}': 1}
+        assert sample(merged, "app_cache_hit_rate") == {'{worker="101"}': 0.5, '{worker="102"}': 0.5}
+        assert merged.count("# TYPE app_requests_total counter") == 1
+
+        # An exited worker's counts stay in the totals, its gauges go
+        retire_process_file(directory, 101)
+        worker_registry(5, 0).write_process_file(directory, pid=103)
+        merged = merge_process_files(directory)
+        assert sample(merged, "app_requests_total") == {'{route="/api/chat"}': 12}
+        assert sample(merged, "app_in_flight") == {'{worker="102"}': 1, '{worker="103"}': 0}
+
+
+if __name__ == "__main__":
+    print("🧪 Testing metrics...")
+    print("-" * 50)
+    for test in (test_render, test_merge_across_workers):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,102 @@
+"""Test script for the response cache: exact keys, near-duplicates and staleness"""
+import asyncio
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from services.gemini_transport import GenerationResult
+from services.prompt_templates import PromptTemplate
+from services.response_cache import ResponseCache, exact_text, normalize_text
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_exact_text_keeps_case_and_indentation():
+    assert exact_text("  def f():\r\n    return 1   \r\n") == "def f():\n    return 1"
+    assert exact_text("Print(X)") != exact_text("print(x)")
+    assert exact_text("if x:\n    y()") != exact_text("if x:\n  y()")
+    assert normalize_text("  How do I   Sort a list?? ") == "how do i sort a list"
+
+
+def test_exact_tier():
+    cache = ResponseCache()
+
+    async def scenario():
+        await cache.set("code", "def f():\n    return 1", "code", "cached", language="python")
+        # Line endings and trailing spaces do not matter
+        assert await cache.get("code", "def f():  \r\n    return 1\n", "code", language="python") == "cached"
+        # Case, indentation, mode and fields all do
+        assert await cache.get("code", "DEF F():\n    return 1", "code", language="python") is None
+        assert await cache.get("code", "def f():\n  return 1", "code", language="python") is None
+        assert await cache.get("code", "def f():\n    return 1", "chat", language="python") is None
+        assert await cache.get("code", "def f():\n    return 1", "code", language="go") is None
+
+    run(scenario())
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 4
+
+
+def test_near_duplicate_tier():
+    cache = ResponseCache(semantic=True, similarity_threshold=0.8)
+
+    async def scenario():
+        await cache.set("chat", "How do I reverse a list in Python?", "chat", "reverse it", language="python")
+        assert await cache.get("chat", "how do i reverse a list in python", "chat", language="python") == "reverse it"
+        assert await cache.get("chat", "How do I reverse a  list in Python!", "chat", language="python") == "reverse it"
+        # Different questions, and the same question in another scope, miss
+        assert await cache.get("chat", "How do I sort a dict by value in Go?", "chat", language="python") is None
+        assert await cache.get("chat", "how do i reverse a list in python", "chat", language="rust") is None
+        assert await cache.get("chat", "how do i reverse a list in python", "explain", language="python") is None
+
+    run(scenario())
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 2 and stats["hits"] == 0 and stats["misses"] == 3
+
+    # Without the near-duplicate tier only exact matches hit
+    exact_only = ResponseCache()
+    run(exact_only.set("chat", "How do I reverse a list in Python?", "chat", "reverse it"))
+    assert run(exact_only.get("chat", "how do i reverse a list in python", "chat")) is None
+
+
+class CountingTransport:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, system_instruction, contents, config, api_key=None):
+        self.calls += 1
+        return GenerationResult(f"answer {self.calls}")
+
+
+def test_model_and_prompt_changes_invalidate():
+    from services.ai_service import AIService
+
+    service = AIService()
+    service.transport = CountingTransport()
+
+    async def scenario():
+        first = await service.generate_code("reverse a string")
+        assert await service.generate_code("reverse a string") == first
+        assert service.transport.calls == 1
+
+        # A prompt hot reload bumps the template version
+        template = service.prompts._templates["code_generation"]
+        service.prompts.register(PromptTemplate(template.name, template.text, template.version + ".1"))
+        assert await service.generate_code("reverse a string") != first
+        assert service.transport.calls == 2
+
+        # So does switching the model
+        service.model_name = "another-model"
+        await service.generate_code("reverse a string")
+        assert service.transport.calls == 3
+
+    run(scenario())
+
+
+if __name__ == "__main__":
+    print("🧪 Testing response cache...")
+    print("-" * 50)
+    for test in (test_exact_text_keeps_case_and_indentation, test_exact_tier, test_near_duplicate_tier,
+                 test_model_and_prompt_changes_invalidate):
+        test()
+        print(f"✅ {test.__name__}")
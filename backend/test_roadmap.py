@@ -1,6 +1,76 @@
 """Test script to verify roadmap generation"""
 import asyncio
+import json
+import os
+import tempfile
+import threading
+from config import BASE_DIR, settings
 from services.ai_service import ai_service
+from services.roadmap import normalize_topic, parse_roadmap, repair_json
+from services.roadmap_store import FileRoadmapBackend
+
+
+def test_normalize_topic():
+    # Aliases, filler words, case and punctuation all map to one catalog entry
+    for spelling in ("JS", "javascript", "Learn JavaScript!", "a complete javascript course for beginners"):
+        assert normalize_topic(spelling) == "javascript", spelling
+    assert normalize_topic("become a k8s engineer") == "kubernetes"
+    assert normalize_topic("Front-End Development") == "frontend development"
+    assert normalize_topic("node.js") == normalize_topic("NodeJS") == "node.js"
+    assert normalize_topic("C++") == "c++" and normalize_topic("c#") == "c#"
+    assert normalize_topic("rust for embedded systems") == "rust embedded systems"
+    assert normalize_topic("please show me") == "programming"
+
+
+def test_repair_json():
+    # Prose and fences around the object, trailing commas, raw newlines in strings
+    text = 'Here you go:\n```json\n{"title": "Go", "tags": ["a", "b",],\n "description": "line one\nline two",}\n```'
+    assert json.loads(repair_json(text)) == {"title": "Go", "tags": ["a", "b"], "description": "line one\nline two"}
+    # Mismatched closer
+    assert json.loads(repair_json('{"modules": [1, 2}')) == {"modules": [1, 2]}
+    # Cut off mid-module: keep the complete modules and close what is open
+    module = {"id": 1, "title": "Basics", "description": "Start", "topics": ["syntax"], "duration": "1 week",
+              "difficulty": "Beginner", "prerequisites": []}
+    full = json.dumps({"title": "Go", "description": "d", "modules": [module, dict(module, id=2)]})
+    cut = full[:full.rindex('"title"')]
+    assert json.loads(repair_json(cut)) == {"title": "Go", "description": "d", "modules": [module]}
+    assert [m.id for m in parse_roadmap(cut).modules] == [1]
+    for broken in ("no json here", '{"title": "unterminated'):
+        try:
+            repair_json(broken)
+            assert False, broken
+        except ValueError:
+            pass
+
+
+def test_file_catalog_loads_off_the_loop():
+    readers = []
+
+    class RecordingBackend(FileRoadmapBackend):
+        def _read(self):
+            readers.append(threading.current_thread() is threading.main_thread())
+            return super()._read()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"k": {"topic": "go"}}, f)
+
+        async def scenario():
+            backend = RecordingBackend(path)
+            assert await backend.get("k") == {"topic": "go"}
+            await backend.put("k2", {"topic": "rust"})
+            assert await backend.get("k2") == {"topic": "rust"}
+
+        asyncio.run(scenario())
+        assert readers == [False]
+        with open(path, encoding="utf-8") as f:
+            assert set(json.load(f)) == {"k", "k2"}
+
+    # A relative catalog path does not depend on the working directory
+    assert settings.roadmap_catalog_full_path.is_absolute()
+    assert settings.roadmap_catalog_full_path.parent == BASE_DIR or os.path.isabs(settings.roadmap_catalog_path)
+
 
 async def test_roadmap():
     print("🧪 Testing roadmap generation...")
@@ -15,7 +85,7 @@ async def test_roadmap():
     for msg in test_messages:
         print(f"\n📝 Query: {msg}")
         try:
-            result = await ai_service._generate_roadmap_response(msg, "python")
+            result = await ai_service._generate_roadmap_response(msg)
             print(f"✅ Success!")
             print(f"📊 Response length: {len(result['message'])} characters")
             
@@ -34,4 +104,7 @@ async def test_roadmap():
         print("-" * 50)
 
 if __name__ == "__main__":
+    for test in (test_normalize_topic, test_repair_json, test_file_catalog_loads_off_the_loop):
+        test()
+        print(f"✅ {test.__name__}")
     asyncio.run(test_roadmap())
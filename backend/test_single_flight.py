@@ -0,0 +1,150 @@
+"""Test script for single-flight coalescing of identical calls and streams"""
+import asyncio
+
+from services.single_flight import SingleFlight
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Upstream:
+    """Counts calls and produced chunks, and notes when a stream is closed"""
+
+    def __init__(self, chunks: int = 5, delay: float = 0.01):
+        self.calls = 0
+        self.produced = 0
+        self.closed = 0
+        self.chunks = chunks
+        self.delay = delay
+
+    async def call(self, value="result"):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    async def stream(self):
+        self.calls += 1
+        try:
+            for i in range(self.chunks):
+                await asyncio.sleep(self.delay)
+                self.produced += 1
+                yield f"chunk{i}"
+        finally:
+            self.closed += 1
+
+
+async def collect(flight: SingleFlight, key, upstream: Upstream, limit: int = None):
+    chunks = []
+    async for chunk in flight.stream(key, upstream.stream):
+        chunks.append(chunk)
+        if limit is not None and len(chunks) == limit:
+            break
+    return chunks
+
+
+def test_do_coalesces_identical_calls():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        results = await asyncio.gather(*(flight.do("k", upstream.call) for _ in range(5)))
+        assert results == ["result"] * 5 and upstream.calls == 1
+        await asyncio.gather(flight.do("a", upstream.call), flight.do("b", upstream.call))
+        assert upstream.calls == 3
+        stats = flight.stats()
+        assert stats["leaders"] == 3 and stats["coalesced"] == 4 and stats["in_flight"] == 0
+
+        # Every caller gets the same error
+        failures = await asyncio.gather(
+            *(flight.do("err", lambda: upstream.call(ValueError("boom"))) for _ in range(3)),
+            return_exceptions=True
+        )
+        assert all(isinstance(e, ValueError) for e in failures) and upstream.calls == 4
+
+    run(scenario())
+
+
+def test_do_caller_cancel_does_not_cancel_others():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream(delay=0.05)
+        first = asyncio.ensure_future(flight.do("k", upstream.call))
+        second = asyncio.ensure_future(flight.do("k", upstream.call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "result"
+        assert first.cancelled() and upstream.calls == 1
+
+    run(scenario())
+
+
+def test_stream_shares_one_upstream():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        leader = asyncio.ensure_future(collect(flight, "k", upstream))
+        await asyncio.sleep(0.025)
+        # A late joiner replays what was already sent, then follows along
+        results = await asyncio.gather(leader, collect(flight, "k", upstream), collect(flight, "k", upstream))
+        expected = [f"chunk{i}" for i in range(5)]
+        assert results == [expected] * 3
+        assert upstream.calls == 1
+        stats = flight.stats()
+        assert stats["stream_leaders"] == 1 and stats["stream_coalesced"] == 2 and stats["in_flight"] == 0
+
+    run(scenario())
+
+
+def test_stream_paced_by_fastest_subscriber():
+    async def scenario():
+        flight, upstream = SingleFlight(max_ahead=3), Upstream(chunks=100, delay=0)
+        reader = flight.stream("k", upstream.stream)
+        await reader.__anext__()
+        await asyncio.sleep(0.05)
+        produced = upstream.produced
+        await reader.aclose()
+        return produced
+
+    produced = run(scenario())
+    # One taken, three buffered ahead, one pulled and waiting for room
+    assert produced <= 1 + 3 + 1, f"producer ran {produced} chunks ahead"
+
+
+def test_stream_cancelled_when_last_subscriber_leaves():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream(chunks=100)
+        first = asyncio.ensure_future(collect(flight, "k", upstream, limit=2))
+        second = asyncio.ensure_future(collect(flight, "k", upstream, limit=4))
+        assert len(await first) == 2
+        # One subscriber is still listening, so upstream keeps going
+        await asyncio.sleep(0.01)
+        assert upstream.closed == 0
+        assert len(await second) == 4
+        await asyncio.sleep(0.01)
+        assert upstream.closed == 1 and upstream.produced < 100
+        assert flight.stats()["stream_cancelled"] == 1 and flight.stats()["in_flight"] == 0
+
+        # The next caller starts a fresh stream instead of joining the cancelled one
+        assert len(await collect(flight, "k", upstream, limit=1)) == 1
+        assert upstream.calls == 2
+
+    run(scenario())
+
+
+def test_disabled_passes_through():
+    async def scenario():
+        flight, upstream = SingleFlight(enabled=False), Upstream()
+        await asyncio.gather(flight.do("k", upstream.call), flight.do("k", upstream.call))
+        await asyncio.gather(collect(flight, "k", upstream), collect(flight, "k", upstream))
+        assert upstream.calls == 4
+
+    run(scenario())
+
+
+if __name__ == "__main__":
+    print("🧪 Testing single-flight coalescing...")
+    print("-" * 50)
+    for test in (test_do_coalesces_identical_calls, test_do_caller_cancel_does_not_cancel_others,
+                 test_stream_shares_one_upstream, test_stream_paced_by_fastest_subscriber,
+                 test_stream_cancelled_when_last_subscriber_leaves, test_disabled_passes_through):
+        test()
+        print(f"✅ {test.__name__}")
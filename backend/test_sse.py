@@ -0,0 +1,88 @@
+"""Test script for SSE replay streams: resume grace and upstream cancellation"""
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from services.sse import ReplayStore
+from services.streaming import StreamMetrics, stream_until_disconnect
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def slow_upstream(closed: dict, delay: float = 0.02):
+    """Endless upstream that records when it is closed"""
+    try:
+        while True:
+            await asyncio.sleep(delay)
+            yield "chunk "
+    finally:
+        closed["at"] = time.monotonic()
+
+
+async def start(store: ReplayStore, closed: dict):
+    stream = store.create(owner="uid-1")
+
+    async def produce():
+        async for chunk in stream_until_disconnect(stream, slow_upstream(closed), metrics=StreamMetrics(), poll_interval=0.02):
+            stream.event(chunk.encode("utf-8"))
+        stream.finish()
+
+    stream.task = asyncio.get_running_loop().create_task(produce())
+    return stream
+
+
+async def read_then_leave(stream, frames: int = 3) -> float:
+    reader = stream.follow()
+    for _ in range(frames):
+        await reader.__anext__()
+    await reader.aclose()
+    return time.monotonic()
+
+
+def test_upstream_cancelled_within_grace():
+    async def scenario():
+        # A long replay ttl must not keep an abandoned stream generating
+        store = ReplayStore(ttl=60.0, grace=0.2)
+        closed = {}
+        stream = await start(store, closed)
+        left_at = await read_then_leave(stream)
+        await asyncio.wait_for(stream.task, timeout=2.0)
+        return closed["at"] - left_at
+
+    elapsed = run(scenario())
+    assert 0.2 <= elapsed < 0.6, f"upstream closed {elapsed:.2f}s after the reader left"
+
+
+def test_resume_within_grace_keeps_generating():
+    async def scenario():
+        store = ReplayStore(ttl=60.0, grace=0.3)
+        closed = {}
+        stream = await start(store, closed)
+        await read_then_leave(stream)
+        await asyncio.sleep(0.1)
+        resumed = store.get(stream.id, owner="uid-1")
+        assert resumed is stream
+        assert store.get(stream.id, owner="someone-else") is None
+        reader = resumed.follow(after=1)
+        # Still live well past the grace period while someone is reading
+        deadline = time.monotonic() + 0.6
+        while time.monotonic() < deadline:
+            await reader.__anext__()
+        assert "at" not in closed
+        await reader.aclose()
+        await asyncio.wait_for(stream.task, timeout=2.0)
+        assert "at" in closed
+
+    run(scenario())
+
+
+if __name__ == "__main__":
+    print("🧪 Testing SSE replay streams...")
+    print("-" * 50)
+    for test in (test_upstream_cancelled_within_grace, test_resume_within_grace_keeps_generating):
+        test()
+        print(f"✅ {test.__name__}")
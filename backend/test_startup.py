@@ -0,0 +1,70 @@
+"""Test script for application startup: import cost, deferred SDKs and readiness"""
+import json
+import os
+import subprocess
+import sys
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("FIREBASE_CREDENTIALS_PATH", os.devnull + ".missing")
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds to import the app in a fresh interpreter; the Gemini SDK alone used
+# to add most of a second. Raise it on slow machines with IMPORT_TIME_BUDGET.
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.2"))
+
+# Modules that must only be imported once they are used
+DEFERRED_MODULES = ("google.generativeai", "google.ai.generativelanguage", "firebase_admin", "google.cloud.firestore")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (DEFERRED_MODULES,)
+
+
+def import_main() -> dict:
+    """Import the app in a fresh interpreter and report its cost"""
+    env = dict(os.environ, LOG_LEVEL="WARNING")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_heavy_sdks_are_deferred():
+    assert import_main()["loaded"] == []
+
+
+def test_import_time_budget():
+    # Best of three, so a busy machine does not fail the check
+    seconds = min(import_main()["seconds"] for _ in range(3))
+    assert seconds < IMPORT_TIME_BUDGET, f"importing main took {seconds:.2f}s (budget {IMPORT_TIME_BUDGET}s)"
+
+
+def test_ready_only_after_startup():
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    # Without the lifespan the app is alive but not ready
+    assert client.get("/health").status_code == 200
+    assert client.get("/ready").status_code == 503
+    with client:
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+    assert client.get("/ready").status_code == 503
+
+
+if __name__ == "__main__":
+    print("🧪 Testing application startup...")
+    print("-" * 50)
+    result = import_main()
+    print(f"📊 import main: {result['seconds'] * 1000:.0f} ms (budget {IMPORT_TIME_BUDGET * 1000:.0f} ms)")
+    for test in (test_heavy_sdks_are_deferred, test_import_time_budget, test_ready_only_after_startup):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,108 @@
+"""Test script for streamed responses: backpressure, disconnects and abandoned-stream metrics"""
+import asyncio
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from config import settings
+from services.streaming import StreamMetrics, stream_until_disconnect
+
+
+class FakeRequest:
+    """Stands in for a Starlette request; flip ``disconnected`` to drop the client"""
+
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+
+class FakeTransport:
+    """Endless upstream stream that counts chunks produced and notes when it is closed"""
+
+    def __init__(self):
+        self.produced = 0
+        self.closed = False
+
+    async def stream(self, system_instruction, contents, config, api_key=None, usage=None):
+        try:
+            while True:
+                self.produced += 1
+                yield f"word{self.produced} "
+                await asyncio.sleep(0)
+        finally:
+            self.closed = True
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_producer_blocks_at_queue_bound():
+    async def scenario():
+        upstream = FakeTransport()
+        relay = stream_until_disconnect(FakeRequest(), upstream.stream(None, [], {}), queue_size=4, poll_interval=0.05)
+        await relay.__anext__()
+        # A slow client: nothing is read for a while
+        await asyncio.sleep(0.2)
+        produced = upstream.produced
+        await relay.aclose()
+        return produced, upstream.closed
+
+    produced, closed = run(scenario())
+    # One chunk sent, four queued and one held by the blocked pump
+    assert produced <= 1 + 4 + 1, f"upstream ran {produced} chunks ahead of the client"
+    assert closed
+
+
+def test_disconnect_closes_upstream():
+    async def scenario():
+        request = FakeRequest()
+        upstream = FakeTransport()
+        metrics = StreamMetrics()
+        received = []
+        async for chunk in stream_until_disconnect(request, upstream.stream(None, [], {}), metrics=metrics, poll_interval=0.05):
+            received.append(chunk)
+            if len(received) == 3:
+                request.disconnected = True
+        return received, upstream, metrics
+
+    received, upstream, metrics = run(scenario())
+    assert len(received) == 3
+    assert upstream.closed
+    stats = metrics.stats()
+    assert stats["client_disconnects"] == 1 and stats["completed"] == 0 and stats["active"] == 0
+
+
+def test_abandoned_stream_metrics():
+    from services.ai_service import AIService
+
+    async def scenario():
+        service = AIService()
+        service.transport = FakeTransport()
+        request = FakeRequest()
+        chunks = service._stream_chat_response("tell me a long story", [], mode="chat")
+        received = []
+        async for chunk in stream_until_disconnect(request, chunks, metrics=service.stream_metrics, poll_interval=0.05):
+            received.append(chunk)
+            if len(received) == 5:
+                request.disconnected = True
+        return service, received
+
+    service, received = run(scenario())
+    stats = service.stream_metrics.stats()
+    assert service.transport.closed
+    assert stats["client_disconnects"] == 1
+    assert stats["upstream_cancelled"] == 1
+    assert stats["tokens_streamed"] > 0
+    # The budget left unspent when upstream was closed
+    assert 0 < stats["tokens_saved"] < settings.max_tokens
+
+
+if __name__ == "__main__":
+    print("🧪 Testing streamed responses...")
+    print("-" * 50)
+    for test in (test_producer_blocks_at_queue_bound, test_disconnect_closes_upstream, test_abandoned_stream_metrics):
+        test()
+        print(f"✅ {test.__name__}")
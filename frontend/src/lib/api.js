@@ -116,9 +116,11 @@ export const chatAPI = {
    * @param {Object} request 
    * @param {Function} onChunk 
    * @param {Function} onComplete 
-   * @param {Function} onError 
+   * @param {Function} onError - also gets failed or truncated streams (`error` events)
+   * @param {string} userApiKey 
+   * @param {Function} onEvent - named events (code_start, code_block, summary)
    */
-  streamChatResponse: async (request, onChunk, onComplete, onError, userApiKey) => {
+  streamChatResponse: async (request, onChunk, onComplete, onError, userApiKey, onEvent) => {
     try {
       const payload = { ...request };
       if (userApiKey) {
@@ -145,20 +147,50 @@ export const chatAPI = {
         throw new Error('No response body');
       }
 
+      // Events can be split across reads; keep the trailing partial line
+      let buffered = '';
+      let eventName = null;
+
       while (true) {
         const { done, value } = await reader.read();
         if (done) break;
 
-        const chunk = decoder.decode(value);
-        const lines = chunk.split('\n');
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
 
         for (const line of lines) {
-          if (line.startsWith('data: ')) {
+          if (line === '') {
+            eventName = null;
+          } else if (line.startsWith('event: ')) {
+            eventName = line.slice(7);
+          } else if (line.startsWith('data: ')) {
             const data = line.slice(6);
             if (data === '[DONE]') {
               onComplete?.();
               return;
             }
+            if (eventName === 'error') {
+              // Failed or truncated generation: never report it as a complete reply
+              let detail = {};
+              try {
+                detail = JSON.parse(data);
+              } catch {
+                // Keep the generic message below
+              }
+              const error = new Error(detail.error || 'Stream failed');
+              error.truncated = Boolean(detail.truncated);
+              onError?.(error);
+              return;
+            }
+            if (eventName) {
+              try {
+                onEvent?.(eventName, JSON.parse(data));
+              } catch {
+                // Ignore malformed named events
+              }
+              continue;
+            }
             try {
               const parsed = JSON.parse(data);
               onChunk?.(parsed.content || parsed.message || data);